@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bangers.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, since it loads models.
+from teams.live import LiveFeedApplication  # noqa: E402
+from teams.staticfiles import StaticFilesApplication  # noqa: E402
+from teams.startup import validate_profile  # noqa: E402
+
+validate_profile()
+
+application = StaticFilesApplication(LiveFeedApplication(django_application))
@@ -11,9 +11,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+from urllib.parse import urlparse
 import os
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,8 +47,16 @@ SECRET_KEY = env_str(
     "django-insecure-qd9l--n&dsw30wycqz33*$y#qwy51$bj0+(2ltdh7yrf*i-^0$",
 )
 
+# "development" (the default) or "production", which the Dockerfile sets.
+# Production turns debug off, compiles each template once per process and is
+# checked by teams.startup.validate_profile before a server takes traffic.
+DJANGO_PROFILE = env_str("DJANGO_PROFILE", "development")
+if DJANGO_PROFILE not in {"development", "production"}:
+    raise ImproperlyConfigured(f"Unknown DJANGO_PROFILE {DJANGO_PROFILE!r}.")
+PRODUCTION = DJANGO_PROFILE == "production"
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = env_bool("DJANGO_DEBUG", default=True)
+DEBUG = env_bool("DJANGO_DEBUG", default=not PRODUCTION)
 
 allowed_hosts_env = env_str("DJANGO_ALLOWED_HOSTS", "")
 if allowed_hosts_env:
@@ -69,11 +79,28 @@ INSTALLED_APPS = [
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
-    'allauth.socialaccount.providers.google',
-    'allauth.socialaccount.providers.facebook',
+]
+
+# Each provider app imports its OAuth client stack at startup, so only the
+# providers with credentials are installed.
+SOCIAL_LOGIN_PROVIDERS = env_str(
+    "SOCIAL_LOGIN_PROVIDERS",
+    ",".join(
+        provider
+        for provider in ("google", "facebook")
+        if env_str(f"{provider.upper()}_CLIENT_ID", "")
+    ),
+)
+INSTALLED_APPS += [
+    f"allauth.socialaccount.providers.{provider.strip()}"
+    for provider in SOCIAL_LOGIN_PROVIDERS.split(",")
+    if provider.strip()
 ]
 
 MIDDLEWARE = [
+    'teams.middleware.RequestTimingMiddleware',
+    'teams.routers.DatabaseRoutingMiddleware',
+    'teams.middleware.SiteMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,6 +131,21 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # The cached loader keeps compiled templates for the life of the process,
+    # and template debug off skips recording source positions for error pages.
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["debug"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        )
+    ]
+
 WSGI_APPLICATION = 'bangers.wsgi.application'
 
 
@@ -119,9 +161,107 @@ DATABASE_URL = os.getenv(
     )
 )
 
+# "wsgi" (gunicorn threads) or "asgi" (gunicorn with uvicorn workers); see the Dockerfile.
+SERVER_MODE = env_str("SERVER_MODE", "wsgi")
+# Under ASGI, static files are served ahead of Django by
+# teams.staticfiles (see bangers/asgi.py): WhiteNoise's middleware is
+# sync-only and would put every request through a thread hop.
+if SERVER_MODE == "asgi":
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+# Serve the home and event pages from teams.async_views.
+ASYNC_VIEWS = env_bool("ASYNC_VIEWS", SERVER_MODE == "asgi")
+
+# Stream seat counts to open event pages from LIVE_FEED_PATH; see teams.live.
+# The feed is served by the ASGI entry point only, since each open page holds
+# a connection.
+LIVE_UPDATES = env_bool("LIVE_UPDATES", SERVER_MODE == "asgi")
+LIVE_FEED_PATH = "/live/events/"
+# How often each worker checks the team's change version, and how often it
+# re-reads the counts regardless, for caches not shared between workers.
+LIVE_POLL_SECONDS = float(env_str("LIVE_POLL_SECONDS", "1"))
+LIVE_REFRESH_SECONDS = float(env_str("LIVE_REFRESH_SECONDS", "15"))
+LIVE_KEEPALIVE_SECONDS = float(env_str("LIVE_KEEPALIVE_SECONDS", "20"))
+# Streams end after this long and the browser reconnects where it left off.
+LIVE_STREAM_SECONDS = float(env_str("LIVE_STREAM_SECONDS", "600"))
+LIVE_LONG_POLL_SECONDS = float(env_str("LIVE_LONG_POLL_SECONDS", "25"))
+
+# Optional read replica. Only views that opt in read from it; see teams.routers.
+REPLICA_DATABASE_URL = env_str("REPLICA_DATABASE_URL", "")
+
+# Persistent connections are tied to a thread, which ASGI requests do not
+# keep, so they are closed after each request in that mode. Health checks
+# replace a connection the pooler has dropped instead of failing a request.
+DB_CONN_MAX_AGE = int(
+    env_str("DB_CONN_MAX_AGE", "0" if SERVER_MODE == "asgi" else "600")
+)
+DB_CONN_HEALTH_CHECKS = env_bool("DB_CONN_HEALTH_CHECKS", True)
+# Supabase's transaction pooler (port 6543) may run each transaction on a
+# different server connection, and the named cursors behind
+# QuerySet.iterator() do not survive that. Keep them off behind it; the
+# exports in teams.exports then page by keyset instead.
+DB_TRANSACTION_POOLER = env_bool(
+    "DB_TRANSACTION_POOLER", urlparse(DATABASE_URL).port == 6543
+)
+
+
+def database_config(url, transaction_pooler):
+    return dj_database_url.parse(
+        url,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        disable_server_side_cursors=transaction_pooler,
+        ssl_require=USE_SSL_DB,
+    )
+
+
 DATABASES = {
-    'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600, ssl_require=USE_SSL_DB)
+    'default': database_config(DATABASE_URL, DB_TRANSACTION_POOLER),
 }
+if REPLICA_DATABASE_URL:
+    DATABASES["replica"] = database_config(
+        REPLICA_DATABASE_URL,
+        env_bool(
+            "REPLICA_TRANSACTION_POOLER", urlparse(REPLICA_DATABASE_URL).port == 6543
+        ),
+    )
+    # Tests run against the primary only, with the replica as an alias of it.
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["teams.routers.ReplicaRouter"]
+# Clients read their own writes from the primary for this many seconds.
+REPLICA_PIN_SECONDS = int(env_str("REPLICA_PIN_SECONDS", "10"))
+# The benchmark commands create and drop a test database next to the
+# configured one; they refuse a non-local server unless this is set.
+BENCHMARK_ALLOW_REMOTE_DATABASE = env_bool("BENCHMARK_ALLOW_REMOTE_DATABASE")
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The file backend is shared by every gunicorn worker in the container, so
+# invalidations made by one worker are seen by the others.
+
+CACHE_BACKEND = env_str("DJANGO_CACHE_BACKEND", "locmem" if DEBUG else "file")
+
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": env_str("DJANGO_CACHE_LOCATION", "/tmp/bangers-cache"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+MEMBERSHIP_CACHE_TIMEOUT = int(env_str("MEMBERSHIP_CACHE_TIMEOUT", "300"))
+WALLET_BALANCE_CACHE_TIMEOUT = int(env_str("WALLET_BALANCE_CACHE_TIMEOUT", "300"))
+# The anonymous home page also expires so the upcoming window keeps moving.
+ANONYMOUS_PAGE_CACHE_TIMEOUT = int(env_str("ANONYMOUS_PAGE_CACHE_TIMEOUT", "60"))
+EVENT_CARD_CACHE_TIMEOUT = int(env_str("EVENT_CARD_CACHE_TIMEOUT", "3600"))
+# Seconds after which the home page's ETag changes even without writes.
+PAGE_VALIDATOR_BUCKET = int(env_str("PAGE_VALIDATOR_BUCKET", "60"))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -165,6 +305,9 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 ACCOUNT_LOGOUT_REDIRECT_URL = '/'
 SITE_ID = None
+# The site whose id becomes SITE_ID, looked up on first use by
+# teams.middleware.SiteMiddleware rather than at import time.
+SITE_DOMAIN = env_str("DJANGO_SITE_DOMAIN", "")
 
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
@@ -211,8 +354,20 @@ STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY", "")
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
 STRIPE_CURRENCY = os.environ.get("STRIPE_CURRENCY", "usd")
+# "stripe" for the real API or "stub" for the in-memory client in teams.stripe_client.
+STRIPE_CLIENT = env_str("STRIPE_CLIENT", "stripe")
+STRIPE_API_TIMEOUT = float(env_str("STRIPE_API_TIMEOUT", "5"))
+# The wallet return page looks sessions up off the request thread.
+STRIPE_SESSION_CHECK_ASYNC = env_bool("STRIPE_SESSION_CHECK_ASYNC", True)
+STRIPE_SESSION_CHECK_WORKERS = int(env_str("STRIPE_SESSION_CHECK_WORKERS", "2"))
+STRIPE_SESSION_CACHE_TIMEOUT = int(env_str("STRIPE_SESSION_CACHE_TIMEOUT", "300"))
+# A failed inbox event waits this long before its second try, doubling each
+# time after that, up to teams.payments.MAX_ATTEMPTS tries.
+STRIPE_EVENT_RETRY_SECONDS = int(env_str("STRIPE_EVENT_RETRY_SECONDS", "60"))
 
 TEAM_NAME = env_str("TEAM_NAME", "Frome Pickleball")
+EVENT_PAGE_SIZE = int(env_str("EVENT_PAGE_SIZE", "20"))
+WALLET_HISTORY_PAGE_SIZE = int(env_str("WALLET_HISTORY_PAGE_SIZE", "50"))
 
 SOCIALACCOUNT_PROVIDERS = {
     "google": {
@@ -243,6 +398,30 @@ CSRF_TRUSTED_ORIGINS = [origin.strip() for origin in csrf_env.split(",") if orig
 if env_bool("DJANGO_USE_X_FORWARDED_PROTO", default=True):
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
+# Request timing (teams.middleware.RequestTimingMiddleware)
+
+REQUEST_TIMING_ENABLED = env_bool("REQUEST_TIMING_ENABLED", default=False)
+REQUEST_TIMING_SAMPLE_RATE = float(env_str("REQUEST_TIMING_SAMPLE_RATE", "1.0"))
+REQUEST_TIMING_SLOW_QUERIES = int(env_str("REQUEST_TIMING_SLOW_QUERIES", "3"))
+REQUEST_TIMING_HEADER = env_bool("REQUEST_TIMING_HEADER", default=True)
+
+if REQUEST_TIMING_ENABLED:
+    TEMPLATES[0]["BACKEND"] = "teams.templating.TimedDjangoTemplates"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "teams": {
+            "handlers": ["console"],
+            "level": env_str("TEAMS_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
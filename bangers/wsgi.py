@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bangers.settings')
 
 application = get_wsgi_application()
+
+# Imported once Django is set up, since it loads models.
+from teams.startup import validate_profile  # noqa: E402
+
+validate_profile()
@@ -0,0 +1,37 @@
+"""Gunicorn settings for both server modes; read from the working directory.
+
+GUNICORN_PRELOAD=true imports Django once in the master and forks workers
+from it, which shortens a cold start when there is more than one worker.
+Database connections the master opened are closed before each fork so no
+worker shares a socket with another.
+"""
+
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+    "on",
+}
+
+
+def when_ready(server):
+    if preload_app:
+        from teams.startup import warm_up
+
+        warm_up()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # Without preload each worker warms itself before accepting requests.
+    from teams.startup import warm_up
+
+    warm_up()
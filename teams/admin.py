@@ -1,16 +1,52 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
 
+from . import booking, exports, ledger, series
+from .pagination import CappedCountPaginator
 from .models import (
     Event,
+    EventSeries,
     EventSignup,
+    SignupRequest,
+    StripeEvent,
     Team,
     TeamMembership,
     Venue,
     Wallet,
+    WalletSnapshot,
     WalletTransaction,
 )
 
 
+def export_action(dataset, fmt, rows=None):
+    """Admin action streaming the selected rows, or related ``rows`` of them."""
+
+    def action(modeladmin, request, queryset):
+        if rows is not None:
+            queryset = rows(queryset)
+        return exports.streaming_response(dataset, queryset, fmt)
+
+    label = exports.FORMATS[fmt][1].upper()
+    action.short_description = f"Export {dataset} as {label}"
+    action.__name__ = f"export_{dataset}_{fmt}"
+    return action
+
+
+def signups_of_events(events):
+    return EventSignup.objects.filter(event__in=events)
+
+
+@admin.action(description="Cancel selected events and refund bookings")
+def cancel_events(modeladmin, request, queryset):
+    cancellation = booking.cancel_events(list(queryset.values_list("pk", flat=True)))
+    modeladmin.message_user(
+        request,
+        f"Cancelled {len(cancellation.events)} event(s) and refunded "
+        f"{len(cancellation.refunds)} booking(s).",
+    )
+
+
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
     list_display = ("name", "created_at")
@@ -33,16 +69,95 @@ class EventAdmin(admin.ModelAdmin):
         "ends_at",
         "venue",
         "max_participants",
+        "yes_count",
+        "waitlist_count",
         "price",
+        "is_cancelled",
+    )
+    list_filter = (
+        "team",
+        "queued_booking",
+        "is_cancelled",
+        ("starts_at", admin.DateFieldListFilter),
     )
-    list_filter = ("team",)
     search_fields = ("title", "team__name")
+    readonly_fields = Event.COUNTER_FIELDS + ("is_cancelled",)
+    raw_id_fields = ("series",)
+    actions = [
+        cancel_events,
+        export_action("events", "csv"),
+        export_action("signups", "csv", rows=signups_of_events),
+    ]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if (
+            change
+            and "max_participants" in form.changed_data
+            and not obj.is_cancelled
+        ):
+            promoted = booking.fill_free_spots(obj.pk)
+            if promoted:
+                self.message_user(
+                    request, f"Promoted {len(promoted)} player(s) from the waitlist."
+                )
+
+
+@admin.register(EventSeries)
+class EventSeriesAdmin(admin.ModelAdmin):
+    list_display = ("title", "team", "frequency", "first_date", "last_date", "manage")
+    list_filter = ("team", "frequency")
+    search_fields = ("title",)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            super().save_model(request, obj, form, change)
+            series.sync_occurrences(obj)
+        else:
+            series.create_series(obj)
+
+    @admin.display(description="Upcoming events")
+    def manage(self, obj):
+        url = reverse("teams:series-detail", args=[obj.pk])
+        return format_html('<a href="{}">Edit or cancel</a>', url)
 
 
 @admin.register(EventSignup)
 class EventSignupAdmin(admin.ModelAdmin):
     list_display = ("event", "user", "status", "created_at")
     list_filter = ("event__team", "status")
+    list_select_related = ("event", "user")
+    actions = [export_action("signups", "csv"), export_action("signups", "jsonl")]
+
+
+@admin.register(SignupRequest)
+class SignupRequestAdmin(admin.ModelAdmin):
+    list_display = (
+        "event",
+        "user",
+        "requested_status",
+        "state",
+        "result_status",
+        "created_at",
+        "processed_at",
+    )
+    list_filter = ("state", "requested_status")
+    list_select_related = ("event", "user")
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "stripe_event_id",
+        "event_type",
+        "state",
+        "attempts",
+        "received_at",
+        "processed_at",
+    )
+    list_filter = ("state", "event_type")
+    search_fields = ("stripe_event_id",)
+    readonly_fields = ("stripe_event_id", "event_type", "payload", "received_at")
 
 
 @admin.register(Venue)
@@ -55,9 +170,41 @@ class VenueAdmin(admin.ModelAdmin):
 class WalletAdmin(admin.ModelAdmin):
     list_display = ("user", "balance", "updated_at")
     search_fields = ("user__username", "user__email")
+    readonly_fields = ("balance", "ledger_balance", "history", "updated_at")
+
+    @admin.display(description="Ledger balance")
+    def ledger_balance(self, obj):
+        return ledger.ledger_balance(obj.pk) if obj.pk else None
+
+    @admin.display(description="Transactions")
+    def history(self, obj):
+        if not obj.pk:
+            return "-"
+        url = reverse("admin:teams_wallettransaction_changelist")
+        return format_html('<a href="{}?wallet__id__exact={}">View history</a>', url, obj.pk)
+
+
+@admin.register(WalletSnapshot)
+class WalletSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("wallet", "balance", "last_transaction_id", "created_at")
+    list_select_related = ("wallet__user",)
+    readonly_fields = ("wallet", "balance", "last_transaction_id", "created_at")
 
 
 @admin.register(WalletTransaction)
 class WalletTransactionAdmin(admin.ModelAdmin):
     list_display = ("wallet", "kind", "amount", "event", "created_at")
-    list_filter = ("kind",)
+    list_filter = ("kind", ("created_at", admin.DateFieldListFilter))
+    list_select_related = ("wallet__user", "event")
+    search_fields = ("stripe_session_id", "stripe_payment_intent")
+    raw_id_fields = ("wallet", "event")
+    ordering = ("-created_at", "-id")
+    # The preset date ranges and ?wallet__id__exact= / ?event__id__exact=
+    # links stay on the (wallet, created_at) indexes; a date_hierarchy or a
+    # per-event sidebar would scan the table to build its choices.
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    actions = [
+        export_action("transactions", "csv"),
+        export_action("transactions", "jsonl"),
+    ]
@@ -0,0 +1,171 @@
+"""Async versions of the busiest read-only views, used when ``ASYNC_VIEWS`` is on.
+
+Under an ASGI server these wait on the database without holding a worker
+thread. They mirror the sync views in :mod:`teams.views`, share their query
+builders and render the same templates, but fetch everything the templates
+need before rendering so no query runs on the event loop.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views import View
+
+from .cache import (
+    aget_default_team,
+    aget_membership_role,
+    aget_versions,
+    aget_wallet_balance,
+)
+from .context_processors import awallet_balance
+from .models import Event
+from .pagination import apaginate_keyset, keyset_slice
+from .routers import cache_timeout, read_from_replica, replica_reads
+from .views import (
+    anonymous_home_key,
+    event_detail_queryset,
+    home_context,
+    overlay_statuses,
+    page_etag,
+    signup_lists,
+    signup_overlay,
+    time_bucket,
+    upcoming_events,
+    upcoming_signups,
+    with_validator,
+)
+
+
+@sync_to_async
+def load_request_state(request):
+    """Resolve the lazy user and count pending messages off the event loop.
+
+    Both may read the session store.
+    """
+    user = request.user
+    user.is_authenticated  # evaluate the lazy object here
+    return user, len(messages.get_messages(request))
+
+
+async def attach_card_versions(*event_lists):
+    events = [event for event_list in event_lists for event in event_list]
+    versions = await aget_versions("event", {event.pk for event in events})
+    for event in events:
+        event.card_version = versions[event.pk]
+
+
+class AsyncReplicaReadsMixin:
+    async def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return await super().dispatch(request, *args, **kwargs)
+
+
+async def member_state(team, user):
+    """The member's role and wallet balance, from the cache."""
+    if not user.is_authenticated:
+        return None, None
+    role = await aget_membership_role(team, user)
+    return role, await aget_wallet_balance(user.pk)
+
+
+class HomeView(AsyncReplicaReadsMixin, View):
+    async def get(self, request):
+        team = await aget_default_team()
+        user, pending_messages = await load_request_state(request)
+        if pending_messages:
+            return await self.render_page(request, team, user)
+
+        versions = await aget_versions("team", [team.pk])
+        role, balance = await member_state(team, user)
+        etag = page_etag(
+            request, user, [versions[team.pk]], role, balance, time_bucket()
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        if user.is_authenticated:
+            return with_validator(await self.render_page(request, team, user), etag)
+
+        key = anonymous_home_key(request, team, versions[team.pk])
+        cached = await cache.aget(key)
+        if cached is None:
+            response = await self.render_page(request, team, user)
+            await cache.aset(
+                key,
+                (response.content, read_from_replica()),
+                cache_timeout(settings.ANONYMOUS_PAGE_CACHE_TIMEOUT),
+            )
+            return with_validator(response, etag)
+        content, from_replica = cached
+        return with_validator(HttpResponse(content), etag, from_replica)
+
+    async def render_page(self, request, team, user):
+        role = None
+        statuses = {}
+        my_events_page = None
+        now = timezone.now()
+        upcoming = upcoming_events(team, now)
+        events_page = await apaginate_keyset(
+            upcoming,
+            "starts_at",
+            request.GET.get("cursor"),
+            settings.EVENT_PAGE_SIZE,
+        )
+        if user.is_authenticated:
+            role = await aget_membership_role(team, user)
+            signups = [
+                signup async for signup in upcoming_signups(team, user, now)
+            ]
+            statuses, booked = signup_overlay(signups)
+            my_events_page = keyset_slice(
+                booked,
+                "starts_at",
+                request.GET.get("my_cursor"),
+                settings.EVENT_PAGE_SIZE,
+            )
+            overlay_statuses(my_events_page.items, statuses)
+        overlay_statuses(events_page.items, statuses)
+        await attach_card_versions(
+            events_page.items, my_events_page.items if my_events_page else []
+        )
+        context = await awallet_balance(request)
+        context.update(home_context(team, role, events_page, my_events_page))
+        return render(request, "teams/team_detail.html", context)
+
+
+class EventDetailView(AsyncReplicaReadsMixin, View):
+    async def get(self, request, event_id):
+        team = await aget_default_team()
+        user, pending_messages = await load_request_state(request)
+        etag = None
+        if not pending_messages:
+            versions = await aget_versions("event", [event_id])
+            role, balance = await member_state(team, user)
+            etag = page_etag(request, user, [versions[event_id]], role, balance)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        try:
+            event = await event_detail_queryset(team, user).aget(pk=event_id)
+        except Event.DoesNotExist:
+            raise Http404("No event found matching the query")
+
+        context = await awallet_balance(request)
+        context.update(
+            {
+                "event": event,
+                "object": event,
+                "show_signup_lists": user.is_authenticated,
+                "my_status": None,
+            }
+        )
+        if user.is_authenticated:
+            await aget_membership_role(team, user)
+            context.update(signup_lists(event, user))
+        response = render(request, "teams/event_detail.html", context)
+        return with_validator(response, etag) if etag else response
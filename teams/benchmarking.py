@@ -0,0 +1,478 @@
+import json
+import random
+import re
+import statistics
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import CommandError
+from django.db import connection
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template import Context, Engine, engines
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from .booking import count_signups
+from .cache import forget_default_team, get_default_team
+from .models import Event, EventSignup, Venue, Wallet, WalletTransaction
+
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baselines.json"
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+SQL_ALIAS = re.compile(r'"(\w+)" (U\d+)\b')
+
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+# Template engine options of the production profile, and of a deployment
+# that loads and compiles every template on each render with debug on.
+TEMPLATE_PROFILES = {
+    "uncached_debug": {"debug": True, "loaders": TEMPLATE_LOADERS},
+    "production": {
+        "debug": False,
+        "loaders": [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)],
+    },
+}
+# The requests of the paid signup scenario, as (client, status), repeated.
+# With one spot free they run a debit, a waitlisting, a refund that promotes
+# the rival (and debits them) and the rival's refund, which frees the spot
+# again, so every cycle does the same work.
+PAID_TOGGLE = [
+    ("member", EventSignup.Status.YES),
+    ("rival", EventSignup.Status.YES),
+    ("member", EventSignup.Status.NO),
+    ("rival", EventSignup.Status.NO),
+]
+# Template rendered by each view scenario.
+RENDER_SCENARIOS = {
+    "teams/team_detail.html": "home_member",
+    "teams/event_detail.html": "event_detail",
+}
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """Run the block against a freshly migrated test database.
+
+    Benchmarks seed thousands of rows, so they never touch the configured
+    database; caches are swapped for a private local-memory cache as well.
+    The test database is created on the configured server, so anything but
+    SQLite or a local server needs ``BENCHMARK_ALLOW_REMOTE_DATABASE``.
+    """
+    host = connection.settings_dict.get("HOST") or ""
+    if (
+        connection.vendor != "sqlite"
+        and host not in LOCAL_HOSTS
+        and not settings.BENCHMARK_ALLOW_REMOTE_DATABASE
+    ):
+        raise CommandError(
+            f"Refusing to create a benchmark database on {host}. Point "
+            "DATABASE_URL at a local server, or set "
+            "BENCHMARK_ALLOW_REMOTE_DATABASE=true."
+        )
+    old_name = connection.settings_dict["NAME"]
+    setup_test_environment()
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    forget_default_team()
+    try:
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "benchmark",
+                }
+            }
+        ):
+            yield
+    finally:
+        forget_default_team()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def seed_members(count, balance=0, prefix="member"):
+    User = get_user_model()
+    password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(
+                username=f"{prefix}{index}@example.com",
+                email=f"{prefix}{index}@example.com",
+                first_name=prefix.title(),
+                last_name=str(index),
+                password=password,
+            )
+            for index in range(count)
+        ],
+        batch_size=500,
+    )
+    users = list(User.objects.filter(username__startswith=prefix).order_by("pk"))
+    Wallet.objects.bulk_create(
+        [Wallet(user=user, balance=balance) for user in users], batch_size=500
+    )
+    if balance:
+        wallets = Wallet.objects.filter(user__in=users)
+        WalletTransaction.objects.bulk_create(
+            [
+                WalletTransaction(
+                    wallet=wallet, amount=balance, kind=WalletTransaction.Kind.TOPUP
+                )
+                for wallet in wallets
+            ],
+            batch_size=500,
+        )
+    return users
+
+
+@dataclass
+class Dataset:
+    member: object
+    rival: object
+    busy_event: Event
+    upcoming_event: Event
+    paid_event: Event
+    sizes: dict = field(default_factory=dict)
+
+
+def seed_dataset(users=2000, events=300, signups=20000, transactions=20000, seed=1):
+    """Seed a club with realistic history; returns handles used by the scenarios."""
+    rng = random.Random(seed)
+    team = get_default_team()
+    venue = Venue.objects.create(
+        name="Benchmark Hall", address_line1="1 High Street", postcode="BA11 1AA"
+    )
+    members = seed_members(users, balance=Decimal("40.00"))
+    member, rival = members[:2]
+
+    now = timezone.now()
+    first_start = now - timedelta(days=events // 2)
+    Event.objects.bulk_create(
+        [
+            Event(
+                team=team,
+                title=f"Session {index}",
+                starts_at=first_start + timedelta(days=index, hours=18),
+                ends_at=first_start + timedelta(days=index, hours=20),
+                venue=venue,
+                max_participants=rng.choice([16, 24, 40, 80]),
+                price=rng.choice([Decimal("0.00"), Decimal("5.00"), Decimal("7.50")]),
+                created_by=member,
+            )
+            for index in range(events)
+        ],
+        batch_size=500,
+    )
+    all_events = list(Event.objects.filter(team=team).order_by("starts_at", "pk"))
+    upcoming = [event for event in all_events if event.ends_at >= now]
+    busy_event = upcoming[0]
+
+    per_event = max(signups // max(len(all_events), 1), 1)
+    statuses = [
+        EventSignup.Status.YES,
+        EventSignup.Status.YES,
+        EventSignup.Status.YES,
+        EventSignup.Status.WAITLIST,
+        EventSignup.Status.MAYBE,
+        EventSignup.Status.NO,
+    ]
+    rows = []
+    for event in all_events:
+        attendees = rng.sample(members, min(per_event, len(members)))
+        if event in upcoming[:10] and member not in attendees:
+            attendees[0] = member
+        rows.extend(
+            EventSignup(event=event, user=user, status=rng.choice(statuses))
+            for user in attendees
+        )
+    # A paid event with one spot left, booked by neither member nor rival.
+    booked = members[2:18]
+    paid_event = Event.objects.create(
+        team=team,
+        title="Paid session",
+        starts_at=now + timedelta(days=events, hours=18),
+        ends_at=now + timedelta(days=events, hours=20),
+        venue=venue,
+        max_participants=len(booked) + 1,
+        price=Decimal("5.00"),
+        created_by=member,
+    )
+    rows.extend(EventSignup(event=paid_event, user=user) for user in booked)
+    EventSignup.objects.bulk_create(rows, batch_size=1000)
+    for event_id, counters in count_signups().items():
+        Event.objects.filter(pk=event_id).update(**counters)
+
+    wallets = list(Wallet.objects.order_by("pk"))
+    kinds = list(WalletTransaction.Kind.values)
+    WalletTransaction.objects.bulk_create(
+        [
+            WalletTransaction(
+                wallet=rng.choice(wallets),
+                amount=Decimal(rng.choice(["5.00", "-5.00", "20.00"])),
+                kind=rng.choice(kinds),
+                event=rng.choice(all_events),
+            )
+            for _ in range(transactions)
+        ],
+        batch_size=1000,
+    )
+    # Keep balances equal to their ledgers, as the app does.
+    ledger_total = (
+        WalletTransaction.objects.filter(wallet=OuterRef("pk"))
+        .values("wallet")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    Wallet.objects.update(balance=Coalesce(Subquery(ledger_total), Decimal("0")))
+
+    return Dataset(
+        member=member,
+        rival=rival,
+        busy_event=busy_event,
+        upcoming_event=upcoming[-1],
+        paid_event=paid_event,
+        sizes={
+            "users": users,
+            "events": len(all_events),
+            "signups": len(rows),
+            "transactions": transactions,
+        },
+    )
+
+
+def view_scenarios(dataset):
+    """(name, method, url, data, logged_in) for every view under benchmark."""
+    toggle_url = reverse("teams:event-signup", args=[dataset.upcoming_event.pk])
+    return [
+        ("home_anonymous", "get", reverse("teams:home"), None, False),
+        ("home_member", "get", reverse("teams:home"), None, True),
+        ("event_archive", "get", reverse("teams:event-archive"), None, True),
+        (
+            "event_detail",
+            "get",
+            reverse("teams:event-detail", args=[dataset.busy_event.pk]),
+            None,
+            True,
+        ),
+        ("signup_toggle", "post", toggle_url, "toggle", True),
+        (
+            "signup_paid",
+            "post",
+            reverse("teams:event-signup", args=[dataset.paid_event.pk]),
+            "paid_toggle",
+            True,
+        ),
+        ("wallet", "get", reverse("teams:wallet"), None, True),
+        ("wallet_history", "get", reverse("teams:wallet-history"), None, True),
+    ]
+
+
+def measure_views(dataset, requests=20):
+    """Time each scenario; returns ``{name: {queries, p50_ms, p95_ms}}``."""
+    anonymous, member, rival = scenario_clients(dataset)
+    results = {}
+    for name, method, url, data, logged_in in view_scenarios(dataset):
+        client = member if logged_in else anonymous
+        warm_client, warm_data = scenario_step(client, rival, data, -1)
+        getattr(warm_client, method)(url, warm_data)  # warm caches
+        latencies = []
+        queries = []
+        for index in range(requests):
+            step_client, step_data = scenario_step(client, rival, data, index)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(step_client, method)(url, step_data)
+                latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name} returned {response.status_code}")
+            queries.append(len(captured))
+        results[name] = {
+            "queries": max(queries),
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        }
+    return results
+
+
+def render_contexts(dataset):
+    """The member's context for each template in ``RENDER_SCENARIOS``."""
+    member = Client()
+    member.force_login(dataset.member)
+    urls = {name: url for name, _, url, _, _ in view_scenarios(dataset)}
+    contexts = {}
+    for template_name, scenario in RENDER_SCENARIOS.items():
+        response = member.get(urls[scenario])
+        # The page template's context comes first, before its includes.
+        context = response.context
+        if isinstance(context, list):
+            context = context[0]
+        contexts[template_name] = context.flatten()
+    return contexts
+
+
+def measure_template_renders(dataset, renders=50):
+    """Time loading and rendering each page template under each profile.
+
+    Returns ``{template: {profile: {p50_ms, p95_ms}, "speedup": ratio}}``,
+    where the speedup is the uncached p50 over the production p50.
+    """
+    libraries = engines["django"].engine.libraries
+    results = {}
+    for template_name, context in render_contexts(dataset).items():
+        result = {}
+        for profile, options in TEMPLATE_PROFILES.items():
+            engine = Engine(libraries=libraries, **options)
+            latencies = []
+            for _ in range(renders):
+                started = time.perf_counter()
+                engine.get_template(template_name).render(Context(context))
+                latencies.append(time.perf_counter() - started)
+            result[profile] = {
+                "p50_ms": round(statistics.median(latencies) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            }
+        result["speedup"] = round(
+            result["uncached_debug"]["p50_ms"] / result["production"]["p50_ms"], 2
+        )
+        results[template_name] = result
+    return results
+
+
+def capture_view_queries(dataset):
+    """``{name: [sql, ...]}`` of the SELECTs each scenario runs when warm."""
+    anonymous, member, rival = scenario_clients(dataset)
+    captured_by_view = {}
+    for name, method, url, data, logged_in in view_scenarios(dataset):
+        client = member if logged_in else anonymous
+        warm_client, warm_data = scenario_step(client, rival, data, -1)
+        getattr(warm_client, method)(url, warm_data)  # warm caches
+        step_client, step_data = scenario_step(client, rival, data, 0)
+        with CaptureQueriesContext(connection) as captured:
+            getattr(step_client, method)(url, step_data)
+        captured_by_view[name] = [
+            query["sql"]
+            for query in captured
+            if query["sql"].lstrip().upper().startswith("SELECT")
+        ]
+    return captured_by_view
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def sequential_scans(sql):
+    """Tables the database plans to read in full to answer ``sql``."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return {
+                node["Relation Name"]
+                for node in plan_nodes(plan[0]["Plan"])
+                if node["Node Type"] == "Seq Scan"
+            }
+        if connection.vendor == "sqlite":
+            # Subqueries alias their tables (U0, U1, ...); map them back.
+            aliases = {alias: table for table, alias in SQL_ALIAS.findall(sql)}
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            tables = set()
+            for row in cursor.fetchall():
+                detail = row[-1]
+                if detail.startswith("SCAN ") and " INDEX " not in detail:
+                    name = detail.split()[1]
+                    tables.add(aliases.get(name, name))
+            return tables
+    raise CommandError(
+        f"Query plan checks do not support the {connection.vendor} backend."
+    )
+
+
+def table_sizes(tables):
+    known = set(connection.introspection.table_names())
+    sizes = {}
+    with connection.cursor() as cursor:
+        for table in tables & known:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+            sizes[table] = cursor.fetchone()[0]
+    return sizes
+
+
+def plan_problems(dataset, min_rows=1000):
+    """Sequential scans of tables with at least ``min_rows`` rows, per view.
+
+    Returns ``{name: [(table, rows, sql), ...]}``. Small lookup tables are
+    left out: scanning a few pages beats an index probe, and the planner
+    knows it.
+    """
+    problems = {}
+    for name, queries in capture_view_queries(dataset).items():
+        for sql in queries:
+            scanned = sequential_scans(sql)
+            for table, rows in sorted(table_sizes(scanned).items()):
+                if rows >= min_rows:
+                    problems.setdefault(name, []).append((table, rows, sql))
+    return problems
+
+
+def scenario_clients(dataset):
+    """Test clients for anonymous visitors, the member and the rival."""
+    anonymous = Client()
+    member = Client()
+    member.force_login(dataset.member)
+    rival = Client()
+    rival.force_login(dataset.rival)
+    return anonymous, member, rival
+
+
+def scenario_step(client, rival, data, index):
+    """The client and form data of request ``index`` of a scenario."""
+    if data == "toggle":
+        status = EventSignup.Status.MAYBE if index % 2 else EventSignup.Status.NO
+        return client, {"status": status}
+    if data == "paid_toggle":
+        who, status = PAID_TOGGLE[index % len(PAID_TOGGLE)]
+        return (rival if who == "rival" else client), {"status": status}
+    return client, data
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def load_baselines(path=BASELINE_PATH):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def regressions(results, baselines):
+    """Views whose query count is above the stored baseline."""
+    return {
+        name: (result["queries"], baselines[name])
+        for name, result in results.items()
+        if name in baselines and result["queries"] > baselines[name]
+    }
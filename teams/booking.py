@@ -0,0 +1,361 @@
+from dataclasses import dataclass
+
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import ledger
+from .cache import bump_versions
+from .models import Event, EventSignup, SignupRequest, Wallet, WalletTransaction
+
+
+@dataclass
+class SignupOutcome:
+    status: str | None
+    level: int | None = None
+    message: str = ""
+    signup: EventSignup | None = None
+    promoted: tuple = ()
+    event: Event | None = None
+
+
+STATUS_MESSAGES = {
+    EventSignup.Status.YES: (messages.SUCCESS, "You're booked in!"),
+    EventSignup.Status.WAITLIST: (messages.INFO, "You're on the waitlist."),
+    EventSignup.Status.MAYBE: (messages.INFO, "Marked as maybe."),
+    EventSignup.Status.NO: (messages.INFO, "Marked as not attending."),
+}
+
+
+def count_signups(event_ids=None):
+    """Count signup rows as ``{event_id: {counter_field: total}}``."""
+    signups = EventSignup.objects.all()
+    if event_ids is not None:
+        signups = signups.filter(event_id__in=event_ids)
+    counts = {}
+    rows = (
+        signups.values("event_id", "status")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        counts.setdefault(row["event_id"], {})[
+            Event.counter_field(row["status"])
+        ] = row["total"]
+    return counts
+
+
+def get_wallets(user_ids, lock=False):
+    """Fetch the wallets of ``user_ids``, creating missing ones, keyed by user id."""
+    user_ids = sorted(set(user_ids))
+    queryset = Wallet.objects.select_for_update() if lock else Wallet.objects.all()
+    wallets = {
+        wallet.user_id: wallet for wallet in queryset.filter(user_id__in=user_ids)
+    }
+    missing = [user_id for user_id in user_ids if user_id not in wallets]
+    if missing:
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user_id) for user_id in missing], ignore_conflicts=True
+        )
+        wallets.update(
+            (wallet.user_id, wallet)
+            for wallet in queryset.filter(user_id__in=missing)
+        )
+    return wallets
+
+
+def lock_wallets(user_ids):
+    return get_wallets(user_ids, lock=True)
+
+
+def change_signup(event, user_id, requested_status, signup, wallets):
+    """Apply one RSVP to ``event``.
+
+    ``event`` and ``signup`` must already be locked by the caller's
+    transaction. The user's wallet needs no lock: the debit is a conditional
+    ledger update. Spots released by a cancellation are filled from the
+    waitlist straight away; any wallets locked for that are added to
+    ``wallets`` so callers never hold a stale copy.
+    """
+    wallet = wallets[user_id]
+    current_status = signup.status if signup else None
+    spots_left = event.max_participants - event.yes_count
+    outcome = SignupOutcome(status=requested_status, signup=signup)
+
+    if event.is_cancelled:
+        outcome.status = current_status
+        outcome.level = messages.ERROR
+        outcome.message = "This event has been cancelled."
+        return outcome
+
+    if (
+        requested_status == EventSignup.Status.YES
+        and current_status != EventSignup.Status.YES
+    ):
+        if spots_left <= 0:
+            requested_status = EventSignup.Status.WAITLIST
+            outcome.status = requested_status
+            outcome.level = messages.INFO
+            outcome.message = "Event is full. You've been added to the waitlist."
+        elif event.price > 0:
+            try:
+                ledger.post(
+                    wallet,
+                    -event.price,
+                    WalletTransaction.Kind.EVENT_DEBIT,
+                    event=event,
+                    require_funds=True,
+                )
+            except ledger.InsufficientFunds:
+                outcome.status = current_status
+                outcome.level = messages.ERROR
+                outcome.message = (
+                    "Insufficient wallet balance. Top up to book this event."
+                )
+                return outcome
+
+    if signup:
+        signup.status = requested_status
+        signup.save(update_fields=["status"])
+    else:
+        signup = EventSignup.objects.create(
+            event=event, user_id=user_id, status=requested_status
+        )
+    outcome.signup = signup
+
+    if (
+        current_status == EventSignup.Status.YES
+        and requested_status != EventSignup.Status.YES
+    ):
+        if event.price > 0:
+            ledger.post(
+                wallet, event.price, WalletTransaction.Kind.EVENT_REFUND, event=event
+            )
+        outcome.promoted = promote_waitlist(
+            event, exclude_user_ids=[user_id], wallets=wallets
+        )
+
+    if not outcome.message and current_status != requested_status:
+        outcome.level, outcome.message = STATUS_MESSAGES[requested_status]
+    return outcome
+
+
+def book(event_id, user_id, requested_status):
+    """Apply one RSVP in its own transaction, locking the event row.
+
+    The returned outcome carries the event with its counters as committed,
+    ready to render.
+    """
+    with transaction.atomic():
+        # Only the event row is locked, not the joined team and venue, so
+        # bookings for different events never wait on each other.
+        event = (
+            Event.objects.select_for_update(of=("self",))
+            .select_related("team", "venue")
+            .get(pk=event_id)
+        )
+        signup = event.signups.select_for_update().filter(user_id=user_id).first()
+        wallets = get_wallets([user_id])
+        outcome = change_signup(event, user_id, requested_status, signup, wallets)
+        outcome.event = event
+        return outcome
+
+
+def promote_waitlist(event, exclude_user_ids=(), wallets=None):
+    """Book waitlisted players into free spots; returns the promoted signups.
+
+    Candidates and, for paid events, their wallets are locked with one query
+    each. Eligibility is decided in memory and the status changes, debits and
+    ledger rows are written with one statement each.
+    """
+    if wallets is None:
+        wallets = {}
+    spots_left = event.max_participants - event.yes_count
+    # Cancelled events are never refunded again, so nobody may be debited.
+    if event.is_cancelled or spots_left <= 0:
+        return []
+
+    candidates = list(
+        event.signups.select_for_update()
+        .filter(status=EventSignup.Status.WAITLIST)
+        .exclude(user_id__in=exclude_user_ids)
+        .order_by("created_at", "pk")
+    )
+    if not candidates:
+        return []
+
+    paid = event.price > 0
+    if paid:
+        # Eligibility is decided from these balances, so they are re-read
+        # under lock even if the caller already holds a copy.
+        wallets.update(lock_wallets(signup.user_id for signup in candidates))
+
+    promoted = []
+    for signup in candidates:
+        if len(promoted) >= spots_left:
+            break
+        if paid and wallets[signup.user_id].balance < event.price:
+            continue
+        promoted.append(signup)
+    if not promoted:
+        return []
+
+    EventSignup.objects.filter(pk__in=[signup.pk for signup in promoted]).update(
+        status=EventSignup.Status.YES
+    )
+    for signup in promoted:
+        signup.status = EventSignup.Status.YES
+        signup._counted = (event.pk, signup.status)
+    Event.adjust_signup_counts(
+        event,
+        {
+            EventSignup.Status.WAITLIST: -len(promoted),
+            EventSignup.Status.YES: len(promoted),
+        },
+    )
+    bump_versions(event_ids=[event.pk], team_ids=[event.team_id])
+
+    if paid:
+        ledger.post_many(
+            WalletTransaction(
+                wallet=wallets[signup.user_id],
+                amount=-event.price,
+                kind=WalletTransaction.Kind.EVENT_DEBIT,
+                event=event,
+            )
+            for signup in promoted
+        )
+    return promoted
+
+
+def fill_free_spots(event_id):
+    """Promote from the waitlist after capacity was raised outside a signup."""
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=event_id)
+        return promote_waitlist(event)
+
+
+@dataclass
+class Cancellation:
+    events: list
+    refunds: list
+
+
+def cancel_events(event_ids):
+    """Cancel events and refund what their players paid, in one transaction.
+
+    Each player gets back the net of their debits and refunds for the event,
+    read from the ledger with one aggregate query, and every refund is
+    written by a single :func:`ledger.post_many`. Events that are already
+    cancelled are skipped, so a retry never refunds twice. Signups are kept
+    as a record of who was booked; :func:`change_signup` refuses further
+    changes.
+    """
+    with transaction.atomic():
+        events = list(
+            Event.objects.select_for_update()
+            .filter(pk__in=event_ids, is_cancelled=False)
+            .order_by("pk")
+        )
+        if not events:
+            return Cancellation(events=[], refunds=[])
+        pks = [event.pk for event in events]
+        Event.objects.filter(pk__in=pks).update(is_cancelled=True)
+        for event in events:
+            event.is_cancelled = True
+
+        paid = list(
+            WalletTransaction.objects.filter(
+                event_id__in=pks,
+                kind__in=[
+                    WalletTransaction.Kind.EVENT_DEBIT,
+                    WalletTransaction.Kind.EVENT_REFUND,
+                ],
+            )
+            .values("wallet_id", "event_id")
+            .annotate(total=Sum("amount"))
+            .filter(total__lt=0)
+            .order_by()
+        )
+        wallets = Wallet.objects.in_bulk({row["wallet_id"] for row in paid})
+        refunds = ledger.post_many(
+            WalletTransaction(
+                wallet=wallets[row["wallet_id"]],
+                amount=-row["total"],
+                kind=WalletTransaction.Kind.EVENT_REFUND,
+                event_id=row["event_id"],
+            )
+            for row in paid
+        )
+        bump_versions(
+            event_ids=pks, team_ids={event.team_id for event in events}
+        )
+    return Cancellation(events=events, refunds=refunds)
+
+
+def enqueue_signup(event, user_id, requested_status):
+    return SignupRequest.objects.create(
+        event=event, user_id=user_id, requested_status=requested_status
+    )
+
+
+def drain_signup_requests(event_id, batch_size=100):
+    """Process up to ``batch_size`` queued RSVPs for one event in one transaction.
+
+    The event row, the batch of requests, their signups and their wallets are
+    each locked with a single query, then requests are applied in arrival order
+    with the same rules as :func:`book`.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().filter(pk=event_id).first()
+        if event is None:
+            return 0
+        pending = list(
+            SignupRequest.objects.select_for_update(skip_locked=True)
+            .filter(event=event, state=SignupRequest.State.PENDING)
+            .order_by("created_at", "pk")[:batch_size]
+        )
+        if not pending:
+            return 0
+
+        user_ids = {request.user_id for request in pending}
+        signups = {
+            signup.user_id: signup
+            for signup in event.signups.select_for_update().filter(user_id__in=user_ids)
+        }
+        wallets = get_wallets(user_ids)
+        processed_at = timezone.now()
+
+        for request in pending:
+            outcome = change_signup(
+                event,
+                request.user_id,
+                request.requested_status,
+                signups.get(request.user_id),
+                wallets,
+            )
+            if outcome.signup is not None:
+                signups[request.user_id] = outcome.signup
+            for signup in outcome.promoted:
+                signups[signup.user_id] = signup
+            request.state = SignupRequest.State.DONE
+            request.result_status = outcome.status or ""
+            request.message = outcome.message
+            request.message_level = outcome.level
+            request.processed_at = processed_at
+
+        SignupRequest.objects.bulk_update(
+            pending,
+            ["state", "result_status", "message", "message_level", "processed_at"],
+        )
+    return len(pending)
+
+
+def events_with_pending_requests():
+    return list(
+        SignupRequest.objects.filter(state=SignupRequest.State.PENDING)
+        .values_list("event_id", flat=True)
+        .distinct()
+        .order_by()
+    )
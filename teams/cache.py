@@ -0,0 +1,204 @@
+import threading
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Team, TeamMembership, Wallet
+
+_default_team = None
+_default_team_lock = threading.RLock()
+
+
+def get_default_team():
+    """Return the club's team, looked up once per process.
+
+    The team is identified by ``TEAM_NAME`` and treated as immutable for the
+    life of the process: renaming or deleting it needs a restart. The Team
+    signal only resets the cache of the process that saved it.
+    """
+    global _default_team
+    team = _default_team
+    if team is not None:
+        return team
+    with _default_team_lock:
+        if _default_team is None:
+            _default_team, _ = Team.objects.get_or_create(name=settings.TEAM_NAME)
+        return _default_team
+
+
+async def aget_default_team():
+    team = _default_team
+    if team is not None:
+        return team
+    return await sync_to_async(get_default_team)()
+
+
+def forget_default_team():
+    global _default_team
+    with _default_team_lock:
+        _default_team = None
+
+
+def site_key(domain):
+    return f"teams:site-id:{domain.lower()}"
+
+
+def resolve_site_id():
+    """Set ``SITE_ID`` from ``SITE_DOMAIN`` and return it.
+
+    The id is kept in the cache, so a new worker usually finds it there and
+    skips the sites table.
+    """
+    domain = settings.SITE_DOMAIN
+    if not domain or settings.SITE_ID:
+        return settings.SITE_ID
+    key = site_key(domain)
+    site_id = cache.get(key)
+    if site_id is None:
+        site_id = (
+            Site.objects.filter(domain__iexact=domain)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if site_id is None:
+            return None
+        cache.set(key, site_id, None)
+    settings.SITE_ID = site_id
+    return site_id
+
+
+def forget_site(domain):
+    cache.delete(site_key(domain))
+
+
+def membership_key(team_id, user_id):
+    return f"teams:membership:{team_id}:{user_id}"
+
+
+def get_membership_role(team, user):
+    """Return the user's role on ``team``, joining them as a member if needed."""
+    key = membership_key(team.pk, user.pk)
+    role = cache.get(key)
+    if role is None:
+        membership, _ = TeamMembership.objects.get_or_create(
+            team=team,
+            user=user,
+            defaults={"role": TeamMembership.Role.MEMBER},
+        )
+        role = membership.role
+        cache.set(key, role, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return role
+
+
+async def aget_membership_role(team, user):
+    key = membership_key(team.pk, user.pk)
+    role = await cache.aget(key)
+    if role is None:
+        membership, _ = await TeamMembership.objects.aget_or_create(
+            team=team,
+            user=user,
+            defaults={"role": TeamMembership.Role.MEMBER},
+        )
+        role = membership.role
+        await cache.aset(key, role, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return role
+
+
+def forget_membership(team_id, user_id):
+    cache.delete(membership_key(team_id, user_id))
+
+
+def wallet_balance_key(user_id, version):
+    return f"teams:wallet-balance:{user_id}:{version}"
+
+
+def get_wallet_balance(user_id):
+    """The user's wallet balance, cached under their wallet version.
+
+    Reading the version first means a reader that loads the balance just
+    before a write commits can only cache it under the version that the
+    commit replaces.
+    """
+    key = wallet_balance_key(user_id, get_version("wallet", user_id))
+    balance = cache.get(key)
+    if balance is None:
+        balance = (
+            Wallet.objects.filter(user_id=user_id)
+            .values_list("balance", flat=True)
+            .first()
+        )
+        if balance is None:
+            balance = Decimal("0")
+        cache.set(key, balance, settings.WALLET_BALANCE_CACHE_TIMEOUT)
+    return balance
+
+
+async def aget_wallet_balance(user_id):
+    version = (await aget_versions("wallet", [user_id]))[user_id]
+    key = wallet_balance_key(user_id, version)
+    balance = await cache.aget(key)
+    if balance is None:
+        balance = await (
+            Wallet.objects.filter(user_id=user_id)
+            .values_list("balance", flat=True)
+            .afirst()
+        )
+        if balance is None:
+            balance = Decimal("0")
+        await cache.aset(key, balance, settings.WALLET_BALANCE_CACHE_TIMEOUT)
+    return balance
+
+
+def forget_wallet_balance(user_id):
+    # Bumped after commit, so until then readers keep the committed balance.
+    transaction.on_commit(
+        lambda: cache.set(version_key("wallet", user_id), str(time.time_ns()), None)
+    )
+
+
+def version_key(scope, pk):
+    return f"teams:version:{scope}:{pk}"
+
+
+def get_versions(scope, pks):
+    """Current change version of each object, as ``{pk: version}``.
+
+    Versions are opaque tokens kept in the cache; a missing one is minted on
+    read, which simply invalidates anything cached under the old token.
+    """
+    keys = {version_key(scope, pk): pk for pk in pks}
+    found = cache.get_many(keys)
+    missing = {key: str(time.time_ns()) for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {pk: found[key] for key, pk in keys.items()}
+
+
+async def aget_versions(scope, pks):
+    keys = {version_key(scope, pk): pk for pk in pks}
+    found = await cache.aget_many(keys)
+    missing = {key: str(time.time_ns()) for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return {pk: found[key] for key, pk in keys.items()}
+
+
+def get_version(scope, pk):
+    return get_versions(scope, [pk])[pk]
+
+
+def bump_versions(event_ids=(), team_ids=()):
+    """Invalidate cached pages and fragments once the transaction commits."""
+    keys = [version_key("event", pk) for pk in event_ids]
+    keys += [version_key("team", pk) for pk in team_ids]
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many({key: str(time.time_ns()) for key in keys}, None)
+        )
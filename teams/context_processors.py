@@ -1,14 +1,28 @@
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
-from .models import Wallet
+from .cache import aget_wallet_balance, get_wallet_balance
+from .routers import cache_timeout
 
 
 def wallet_balance(request):
     team_name = getattr(settings, "TEAM_NAME", "Team")
-    if not request.user.is_authenticated:
-        return {"team_name": team_name}
-    wallet = Wallet.objects.filter(user=request.user).first()
-    return {
-        "wallet_balance": wallet.balance if wallet else 0,
+    context = {
         "team_name": team_name,
+        "event_card_timeout": cache_timeout(settings.EVENT_CARD_CACHE_TIMEOUT),
+        "live_feed_url": settings.LIVE_FEED_PATH if settings.LIVE_UPDATES else "",
     }
+    if request.user.is_authenticated:
+        user_id = request.user.pk
+        context["wallet_balance"] = SimpleLazyObject(
+            lambda: get_wallet_balance(user_id)
+        )
+    return context
+
+
+async def awallet_balance(request):
+    """Async views resolve the balance up front so rendering never queries."""
+    context = wallet_balance(request)
+    if "wallet_balance" in context:
+        context["wallet_balance"] = await aget_wallet_balance(request.user.pk)
+    return context
@@ -0,0 +1,171 @@
+"""Streaming exports of events, signups and the wallet ledger.
+
+Rows are read with ``values_list().iterator()``, which on PostgreSQL uses a
+server-side cursor. Behind a transaction pooler server-side cursors are
+disabled and ``iterator()`` would fetch the whole result at once, so rows are
+read in keyset pages of ``CHUNK_SIZE`` instead. Either way each row is
+written out as soon as it is read, so memory use stays flat however long the
+date range.
+"""
+
+import csv
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .forms import start_of_day
+from .models import Event, EventSignup, WalletTransaction
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+@dataclass(frozen=True)
+class Dataset:
+    model: type
+    columns: tuple
+    date_field: str
+    team_field: str
+
+    def queryset(self, queryset=None, team=None, since=None, until=None):
+        """Filter by team and by an inclusive ``since``/``until`` date range."""
+        if queryset is None:
+            queryset = self.model.objects.all()
+        if team is not None:
+            queryset = queryset.filter(**{self.team_field: team})
+        if since is not None:
+            queryset = queryset.filter(
+                **{f"{self.date_field}__gte": start_of_day(since)}
+            )
+        if until is not None:
+            queryset = queryset.filter(
+                **{f"{self.date_field}__lt": start_of_day(until + timedelta(days=1))}
+            )
+        return queryset.order_by(self.date_field, "pk")
+
+
+DATASETS = {
+    "events": Dataset(
+        model=Event,
+        columns=(
+            "id",
+            "team__name",
+            "title",
+            "starts_at",
+            "ends_at",
+            "venue__name",
+            "price",
+            "is_cancelled",
+            "min_participants",
+            "max_participants",
+            "yes_count",
+            "waitlist_count",
+            "maybe_count",
+            "no_count",
+        ),
+        date_field="starts_at",
+        team_field="team",
+    ),
+    "signups": Dataset(
+        model=EventSignup,
+        columns=(
+            "id",
+            "event_id",
+            "event__title",
+            "event__starts_at",
+            "user_id",
+            "user__email",
+            "user__first_name",
+            "user__last_name",
+            "status",
+            "created_at",
+        ),
+        date_field="event__starts_at",
+        team_field="event__team",
+    ),
+    # Top-ups have no event, so a team filter keeps only event payments.
+    "transactions": Dataset(
+        model=WalletTransaction,
+        columns=(
+            "id",
+            "created_at",
+            "wallet__user_id",
+            "wallet__user__email",
+            "kind",
+            "amount",
+            "event_id",
+            "event__title",
+            "stripe_session_id",
+            "stripe_payment_intent",
+        ),
+        date_field="created_at",
+        team_field="event__team",
+    ),
+}
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def read_rows(dataset, queryset):
+    """Yield ``dataset.columns`` of each row of ``queryset``, in export order."""
+    columns = dataset.columns
+    if not connections[queryset.db].settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"):
+        yield from queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+        return
+
+    # Page on the (date_field, pk) order the dataset already sorts by.
+    field = dataset.date_field
+    rows = queryset.values_list(*columns, field, "pk")
+    page = list(rows[:CHUNK_SIZE])
+    while page:
+        for row in page:
+            yield row[:-2]
+        if len(page) < CHUNK_SIZE:
+            return
+        value, pk = page[-1][-2:]
+        after = Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__gt": pk})
+        page = list(rows.filter(after)[:CHUNK_SIZE])
+
+
+def stream_rows(dataset, queryset, fmt):
+    """Yield the export of ``queryset`` as CSV or JSON Lines text chunks."""
+    columns = dataset.columns
+    rows = read_rows(dataset, queryset)
+    if fmt == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    elif fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n"
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}.")
+
+
+def streaming_response(name, queryset, fmt):
+    """Stream ``queryset`` from dataset ``name`` as a file download."""
+    dataset = DATASETS[name]
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(
+        stream_rows(dataset, dataset.queryset(queryset), fmt),
+        content_type=content_type,
+    )
+    filename = f"{name}-{timezone.localdate():%Y%m%d}.{extension}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
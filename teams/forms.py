@@ -1,7 +1,11 @@
+from datetime import date, datetime, time, timedelta
+
 from django import forms
+from django.utils import timezone
 from allauth.account.forms import SignupForm
 
-from .models import Event, Venue
+from .models import Event, EventSeries, Venue, WalletTransaction
+from .pagination import MAX_PK
 
 
 class EventForm(forms.ModelForm):
@@ -40,6 +44,82 @@ class EventForm(forms.ModelForm):
         return cleaned_data
 
 
+class DateListField(forms.Field):
+    """One ``YYYY-MM-DD`` date per line or comma, cleaned to ISO strings."""
+
+    widget = forms.Textarea(attrs={"rows": 3, "placeholder": "2025-12-25"})
+
+    def prepare_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return "\n".join(value)
+        return value
+
+    def to_python(self, value):
+        days = set()
+        for part in (value or "").replace(",", "\n").split():
+            try:
+                days.add(date.fromisoformat(part))
+            except ValueError:
+                raise forms.ValidationError(f"{part} is not a YYYY-MM-DD date.")
+        return [day.isoformat() for day in sorted(days)]
+
+
+class EventSeriesForm(forms.ModelForm):
+    venue = forms.ModelChoiceField(
+        queryset=Venue.objects.all().order_by("name"),
+        empty_label="Select a venue",
+    )
+    skip_dates = DateListField(required=False, label="Skip dates")
+
+    class Meta:
+        model = EventSeries
+        fields = [
+            "title",
+            "venue",
+            "frequency",
+            "first_date",
+            "last_date",
+            "starts_time",
+            "ends_time",
+            "skip_dates",
+            "min_participants",
+            "max_participants",
+            "price",
+        ]
+        widgets = {
+            "first_date": forms.DateInput(attrs={"type": "date"}),
+            "last_date": forms.DateInput(attrs={"type": "date"}),
+            "starts_time": forms.TimeInput(attrs={"type": "time"}),
+            "ends_time": forms.TimeInput(attrs={"type": "time"}),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first_date = cleaned_data.get("first_date")
+        last_date = cleaned_data.get("last_date")
+        starts_time = cleaned_data.get("starts_time")
+        ends_time = cleaned_data.get("ends_time")
+        if starts_time and ends_time and ends_time <= starts_time:
+            self.add_error("ends_time", "End time must be after the start time.")
+        if first_date and last_date:
+            if last_date < first_date:
+                self.add_error("last_date", "Last date must not be before the first.")
+            elif not self.errors:
+                # Assigned by ModelForm only after clean(), so count on the
+                # instance that is about to be saved.
+                for name in ("first_date", "last_date", "frequency", "skip_dates"):
+                    setattr(self.instance, name, cleaned_data[name])
+                count = sum(1 for _ in self.instance.dates())
+                if not count:
+                    self.add_error(None, "Those dates leave no events to schedule.")
+                elif count > EventSeries.MAX_OCCURRENCES:
+                    self.add_error(
+                        "last_date",
+                        f"A series can have at most {EventSeries.MAX_OCCURRENCES} events.",
+                    )
+        return cleaned_data
+
+
 class TopUpForm(forms.Form):
     amount = forms.DecimalField(
         min_value=1,
@@ -49,6 +129,51 @@ class TopUpForm(forms.Form):
     )
 
 
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class WalletHistoryFilterForm(forms.Form):
+    kind = forms.ChoiceField(
+        choices=[("", "All types")] + WalletTransaction.Kind.choices,
+        required=False,
+    )
+    event = forms.IntegerField(
+        required=False, min_value=1, max_value=MAX_PK, widget=forms.HiddenInput
+    )
+    date_from = forms.DateField(
+        required=False,
+        label="From",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    date_to = forms.DateField(
+        required=False,
+        label="To",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    def filter(self, transactions):
+        """Apply the valid filters to ``transactions``."""
+        if not self.is_valid():
+            return transactions
+        data = self.cleaned_data
+        if data["kind"]:
+            transactions = transactions.filter(kind=data["kind"])
+        if data["event"]:
+            transactions = transactions.filter(event_id=data["event"])
+        # Compare against day boundaries rather than created_at__date so the
+        # (wallet, created_at) index stays usable.
+        if data["date_from"]:
+            transactions = transactions.filter(
+                created_at__gte=start_of_day(data["date_from"])
+            )
+        if data["date_to"]:
+            transactions = transactions.filter(
+                created_at__lt=start_of_day(data["date_to"] + timedelta(days=1))
+            )
+        return transactions
+
+
 class CustomSignupForm(SignupForm):
     full_name = forms.CharField(
         max_length=150,
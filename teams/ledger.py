@@ -0,0 +1,182 @@
+"""The wallet ledger.
+
+``WalletTransaction`` rows are the source of truth for money. They are only
+ever appended, never edited. ``Wallet.balance`` is a running total of those
+rows, kept so that reads are a single lookup. Every change to it goes through
+this module. Each change is an ``F()`` update made in the same transaction as
+the rows it sums, so no code path does a read-modify-write in Python.
+``WalletSnapshot`` rows checkpoint the ledger. A wallet's ledger balance is
+its latest snapshot plus the rows after it.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    DecimalField,
+    F,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import forget_wallet_balance
+from .models import Wallet, WalletSnapshot, WalletTransaction
+
+
+class InsufficientFunds(Exception):
+    """A debit would take the wallet below zero."""
+
+
+def post(wallet, amount, kind, event=None, require_funds=False, **fields):
+    """Append one ledger row and move the wallet's balance by ``amount``.
+
+    With ``require_funds`` a debit only applies if the balance covers it, and
+    the check and the update are one conditional statement, so the wallet does
+    not need to be locked. Raises :class:`InsufficientFunds` otherwise. Must
+    run inside a transaction.
+    """
+    wallets = Wallet.objects.filter(pk=wallet.pk)
+    if require_funds and amount < 0:
+        wallets = wallets.filter(balance__gte=-amount)
+    if not wallets.update(balance=F("balance") + amount, updated_at=timezone.now()):
+        raise InsufficientFunds
+    entry = WalletTransaction.objects.create(
+        wallet=wallet, amount=amount, kind=kind, event=event, **fields
+    )
+    wallet.balance = wallet.balance + amount
+    forget_wallet_balance(wallet.user_id)
+    return entry
+
+
+def post_many(entries):
+    """Append unsaved ``WalletTransaction`` rows and apply them to balances.
+
+    Every wallet moves in one ``UPDATE``, with a ``CASE`` on the wallet when
+    the totals differ, so a waitlist promotion, a batch of top-ups or the
+    refunds of a cancelled series cost two statements whatever their size.
+    Must run inside a transaction.
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    wallets = {}
+    totals = {}
+    for entry in entries:
+        wallets.setdefault(entry.wallet_id, entry.wallet)
+        totals[entry.wallet_id] = totals.get(entry.wallet_id, Decimal("0")) + entry.amount
+
+    by_total = {}
+    for wallet_id, total in totals.items():
+        by_total.setdefault(total, []).append(wallet_id)
+    if len(by_total) == 1:
+        delta = Value(next(iter(by_total)))
+    else:
+        delta = Case(
+            *(
+                When(pk__in=wallet_ids, then=Value(total))
+                for total, wallet_ids in by_total.items()
+            ),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    Wallet.objects.filter(pk__in=list(totals)).update(
+        balance=F("balance") + delta, updated_at=timezone.now()
+    )
+    WalletTransaction.objects.bulk_create(entries)
+
+    for wallet_id, wallet in wallets.items():
+        wallet.balance = wallet.balance + totals[wallet_id]
+        forget_wallet_balance(wallet.user_id)
+    return entries
+
+
+def ledger_balance(wallet_id):
+    """Recompute a wallet's balance from its latest snapshot and later rows."""
+    snapshot = (
+        WalletSnapshot.objects.filter(wallet_id=wallet_id)
+        .order_by("-last_transaction_id")
+        .values_list("balance", "last_transaction_id")
+        .first()
+    )
+    balance, last_transaction_id = snapshot or (Decimal("0"), 0)
+    tail = WalletTransaction.objects.filter(
+        wallet_id=wallet_id, pk__gt=last_transaction_id
+    ).aggregate(total=Sum("amount"))["total"]
+    return balance + (tail or Decimal("0"))
+
+
+def ledger_totals(chunk_size=2000, lock=False, full=False):
+    """Yield ``(wallet_id, stored_balance, ledger_balance, last_transaction_id)``.
+
+    Wallets are read in chunks of ``chunk_size``. For each chunk one query
+    reads the stored balances together with the ledger sums, so both sides
+    come from the same database snapshot. A wallet's ledger side starts from
+    its latest ``WalletSnapshot`` and sums only the rows after it; ``full``
+    ignores snapshots and sums every row.
+
+    With ``lock`` each chunk's wallets are locked first. Postings update the
+    wallet row before inserting theirs, so once the locks are held no posting
+    for these wallets is in flight, and ``last_transaction_id`` is safe to
+    checkpoint: no row with a lower id can commit later.
+    """
+    last_seen = 0
+    while True:
+        with transaction.atomic():
+            wallets = Wallet.objects.filter(pk__gt=last_seen).order_by("pk")
+            if lock:
+                wallets = wallets.select_for_update()
+            wallet_ids = list(wallets.values_list("pk", flat=True)[:chunk_size])
+            if not wallet_ids:
+                return
+            rows = list(wallet_totals(wallet_ids, full))
+        yield from rows
+        last_seen = wallet_ids[-1]
+
+
+def wallet_totals(wallet_ids, full=False):
+    """One query for :func:`ledger_totals` over ``wallet_ids``."""
+    money = DecimalField(max_digits=10, decimal_places=2)
+    wallets = Wallet.objects.filter(pk__in=wallet_ids).order_by("pk")
+    if full:
+        wallets = wallets.annotate(
+            snapshot_balance=Value(Decimal("0"), output_field=money),
+            snapshot_last=Value(0),
+        )
+    else:
+        latest = WalletSnapshot.objects.filter(wallet=OuterRef("pk")).order_by(
+            "-last_transaction_id"
+        )
+        wallets = wallets.annotate(
+            snapshot_balance=Coalesce(
+                Subquery(latest.values("balance")[:1]),
+                Value(Decimal("0")),
+                output_field=money,
+            ),
+            snapshot_last=Coalesce(
+                Subquery(latest.values("last_transaction_id")[:1]), Value(0)
+            ),
+        )
+    tail = (
+        WalletTransaction.objects.filter(
+            wallet=OuterRef("pk"), pk__gt=OuterRef("snapshot_last")
+        )
+        .values("wallet")
+        .order_by()
+    )
+    wallets = wallets.annotate(
+        tail_total=Subquery(tail.annotate(total=Sum("amount")).values("total")),
+        tail_last=Subquery(tail.annotate(last=Max("pk")).values("last")),
+    )
+    for wallet_id, stored, balance, last, tail_total, tail_last in wallets.values_list(
+        "pk", "balance", "snapshot_balance", "snapshot_last", "tail_total", "tail_last"
+    ):
+        if tail_total is not None:
+            balance += tail_total
+            last = tail_last
+        yield wallet_id, stored, balance, last
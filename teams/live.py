@@ -0,0 +1,294 @@
+"""Live seat counts for open event pages.
+
+Each worker process runs one poller while it has clients. Every
+``LIVE_POLL_SECONDS`` it reads the team's change version from the cache,
+and only when that moved (or every ``LIVE_REFRESH_SECONDS``) does it read
+the upcoming events' counters in one query. States that differ from the
+previous read are appended to a short change log, and every connected
+client is woken to take what it has not seen yet. Clients never query the
+database, however many are connected.
+
+Browsers subscribe with server-sent events and fall back to long polling.
+Both send back the last cursor they saw. A cursor from another worker, or
+one older than the change log, is answered with the current state of the
+client's events instead.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .cache import aget_default_team, aget_versions
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+HISTORY = 512
+MAX_EVENTS = 200
+
+
+def card_state(pk, yes_count, max_participants, waitlist_count, is_cancelled):
+    return {
+        "event": pk,
+        "spots_taken": yes_count,
+        "max_participants": max_participants,
+        "waitlist_count": waitlist_count,
+        "is_full": yes_count >= max_participants,
+        "is_cancelled": is_cancelled,
+    }
+
+
+def read_states(team_id):
+    """Current counters of the team's upcoming events."""
+    try:
+        rows = Event.objects.filter(
+            team_id=team_id, ends_at__gte=timezone.now()
+        ).values_list(
+            "pk", "yes_count", "max_participants", "waitlist_count", "is_cancelled"
+        )
+        return {row[0]: card_state(*row) for row in rows}
+    finally:
+        # The poller lives outside the request cycle that normally does this.
+        close_old_connections()
+
+
+class ChangeFeed:
+    def __init__(self, history=HISTORY):
+        self.id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.log = deque(maxlen=history)
+        self.states = {}
+        self.clients = 0
+        self.version = None
+        self.read_at = 0.0
+        self._loop = None
+        self._changed = None
+        self._poller = None
+
+    def token(self, seq=None):
+        return f"{self.id}:{self.seq if seq is None else seq}"
+
+    def publish(self, states):
+        """Record the states that differ from the last read and wake clients."""
+        changed = 0
+        for pk, state in states.items():
+            if self.states.get(pk) != state:
+                self.seq += 1
+                self.log.append((self.seq, state))
+                changed += 1
+        # Events that ended drop out without a change.
+        self.states = states
+        if changed and self._changed is not None:
+            self._changed.set()
+            self._changed = asyncio.Event()
+        return changed
+
+    def since(self, token, events=None):
+        """``(cursor, states)`` the holder of ``token`` has not seen yet.
+
+        ``events`` limits the states to the events on the client's page.
+        """
+        seq = None
+        feed_id, _, value = (token or "").partition(":")
+        if feed_id == self.id and value.isdigit():
+            seq = int(value)
+        oldest = self.log[0][0] if self.log else self.seq + 1
+        if seq is None or seq > self.seq or seq < oldest - 1:
+            states = list(self.states.values())
+        else:
+            states = [state for number, state in self.log if number > seq]
+        if events:
+            states = [state for state in states if state["event"] in events]
+        return self.token(), states
+
+    async def wait(self, token, timeout):
+        """Wait up to ``timeout`` seconds for a change after ``token``."""
+        if token != self.token():
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def poll(self):
+        team = await aget_default_team()
+        version = (await aget_versions("team", [team.pk]))[team.pk]
+        now = time.monotonic()
+        fresh = now - self.read_at < settings.LIVE_REFRESH_SECONDS
+        if version == self.version and fresh:
+            return 0
+        states = await sync_to_async(read_states)(team.pk)
+        self.version, self.read_at = version, now
+        return self.publish(states)
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Live feed poll failed")
+            await asyncio.sleep(settings.LIVE_POLL_SECONDS)
+
+    @asynccontextmanager
+    async def subscription(self):
+        """Keep the poller running while the block's client is connected."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._changed = asyncio.Event()
+            self._poller = None
+        self.clients += 1
+        if self._poller is None:
+            self._poller = loop.create_task(self.run())
+        try:
+            yield self
+        finally:
+            self.clients -= 1
+            if not self.clients and self._poller is not None:
+                self._poller.cancel()
+                self._poller = None
+
+
+feed = ChangeFeed()
+
+
+def event_ids(value):
+    ids = {int(pk) for pk in value.split(",") if pk.strip().isdigit()}
+    return set(sorted(ids)[:MAX_EVENTS])
+
+
+async def until_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def race_disconnect(coroutine, receive):
+    """Run ``coroutine`` unless the client goes away first."""
+    work = asyncio.ensure_future(coroutine)
+    watcher = asyncio.ensure_future(until_disconnect(receive))
+    done, pending = await asyncio.wait(
+        {work, watcher}, return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+    return work.result() if work in done else None
+
+
+def sse_message(token, state):
+    return f"id: {token}\nevent: capacity\ndata: {json.dumps(state)}\n\n".encode()
+
+
+class LiveFeedApplication:
+    """ASGI wrapper serving ``LIVE_FEED_PATH`` and passing the rest to Django."""
+
+    def __init__(self, application, feed=feed):
+        self.application = application
+        self.feed = feed
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["path"] == settings.LIVE_FEED_PATH
+            and settings.LIVE_UPDATES
+        ):
+            await self.serve(scope, receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    async def serve(self, scope, receive, send):
+        if scope["method"] != "GET":
+            await self.respond(send, 405, {"message": "Method not allowed."})
+            return
+        headers = {
+            key.lower(): value.decode("latin-1") for key, value in scope["headers"]
+        }
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        events = event_ids(query.get("events", [""])[0])
+        token = headers.get(b"last-event-id") or query.get("cursor", [""])[0]
+        async with self.feed.subscription():
+            if "text/event-stream" in headers.get(b"accept", ""):
+                await self.stream(send, receive, token, events)
+            else:
+                await self.long_poll(send, receive, token, events)
+
+    async def respond(self, send, status, data):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"cache-control", b"no-store"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+    async def long_poll(self, send, receive, token, events):
+        cursor, states = self.feed.since(token, events)
+        deadline = time.monotonic() + settings.LIVE_LONG_POLL_SECONDS
+        while not states:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if await race_disconnect(self.wait(cursor, remaining), receive) is None:
+                return
+            cursor, states = self.feed.since(cursor, events)
+        await self.respond(send, 200, {"cursor": cursor, "changes": states})
+
+    async def wait(self, cursor, timeout):
+        await self.feed.wait(cursor, timeout)
+        return True
+
+    async def stream(self, send, receive, token, events):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-store"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+
+        async def messages():
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": b"retry: 3000\n\n",
+                    "more_body": True,
+                }
+            )
+            cursor = token
+            deadline = time.monotonic() + settings.LIVE_STREAM_SECONDS
+            while True:
+                cursor, states = self.feed.since(cursor, events)
+                body = b"".join(sse_message(cursor, state) for state in states)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": body or b": keepalive\n\n",
+                        "more_body": True,
+                    }
+                )
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                await self.feed.wait(
+                    cursor, min(remaining, settings.LIVE_KEEPALIVE_SECONDS)
+                )
+
+        if await race_disconnect(messages(), receive):
+            await send({"type": "http.response.body", "body": b""})
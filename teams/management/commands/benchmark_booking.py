@@ -0,0 +1,162 @@
+import json
+import statistics
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from teams import booking
+from teams.benchmarking import percentile, seed_members, throwaway_database
+from teams.cache import get_default_team
+from teams.models import Event, EventSignup
+
+
+def run_concurrently(task, user_ids, concurrency):
+    latencies = []
+    queries = []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        local_latencies = []
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                for user_id in chunk:
+                    started = time.perf_counter()
+                    task(user_id)
+                    local_latencies.append(time.perf_counter() - started)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.append(len(captured))
+
+    chunks = [user_ids[index::concurrency] for index in range(concurrency)]
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(chunks[0])
+    else:
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return time.perf_counter() - started, latencies, sum(queries)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the lock-per-request signup path with the queued booking-rush "
+        "path on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=300)
+        parser.add_argument("--capacity", type=int, default=100)
+        parser.add_argument("--price", type=Decimal, default=Decimal("5.00"))
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--json", action="store_true", help="Print a JSON report.")
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        if connection.vendor == "sqlite" and concurrency > 1:
+            self.stderr.write("SQLite cannot lock rows; running with --concurrency 1.")
+            concurrency = 1
+
+        with throwaway_database():
+            report = self.run(options, concurrency)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report["paths"].items():
+            self.stdout.write(
+                f"{name:>8}: {result['requests_per_second']:8.1f} req/s  "
+                f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+                f"{result['queries_per_request']:5.1f} queries/request  "
+                f"booked {result['booked']}"
+            )
+
+    def run(self, options, concurrency):
+        team = get_default_team()
+        creator = seed_members(1, prefix="organiser")[0]
+        members = seed_members(options["members"], balance=Decimal("50.00"))
+        user_ids = [member.pk for member in members]
+        starts_at = timezone.now() + timedelta(days=7)
+
+        def make_event(queued):
+            return Event.objects.create(
+                team=team,
+                title="Benchmark session",
+                starts_at=starts_at,
+                ends_at=starts_at + timedelta(hours=2),
+                max_participants=options["capacity"],
+                price=options["price"],
+                created_by=creator,
+                queued_booking=queued,
+            )
+
+        direct_event = make_event(False)
+        seconds, latencies, queries = run_concurrently(
+            lambda user_id: booking.book(
+                direct_event.pk, user_id, EventSignup.Status.YES
+            ),
+            user_ids,
+            concurrency,
+        )
+        direct_event.refresh_from_db()
+        paths = {
+            "direct": self.summarise(
+                seconds, latencies, queries, len(user_ids), direct_event.yes_count
+            )
+        }
+
+        queued_event = make_event(True)
+        enqueue_seconds, latencies, queries = run_concurrently(
+            lambda user_id: booking.enqueue_signup(
+                queued_event, user_id, EventSignup.Status.YES
+            ),
+            user_ids,
+            concurrency,
+        )
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            while booking.drain_signup_requests(queued_event.pk, options["batch_size"]):
+                pass
+            drain_seconds = time.perf_counter() - started
+        queued_event.refresh_from_db()
+        paths["queued"] = self.summarise(
+            enqueue_seconds + drain_seconds,
+            latencies,
+            queries + len(captured),
+            len(user_ids),
+            queued_event.yes_count,
+        )
+        paths["queued"]["enqueue_seconds"] = round(enqueue_seconds, 4)
+        paths["queued"]["drain_seconds"] = round(drain_seconds, 4)
+
+        return {
+            "database": connection.vendor,
+            "members": options["members"],
+            "capacity": options["capacity"],
+            "concurrency": concurrency,
+            "batch_size": options["batch_size"],
+            "paths": paths,
+        }
+
+    @staticmethod
+    def summarise(seconds, latencies, queries, requests, booked):
+        return {
+            "seconds": round(seconds, 4),
+            "requests_per_second": requests / seconds if seconds else 0.0,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "queries_per_request": queries / requests if requests else 0.0,
+            "booked": booked,
+        }
@@ -0,0 +1,56 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from teams.benchmarking import (
+    measure_template_renders,
+    seed_dataset,
+    throwaway_database,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, then time loading and rendering "
+        "team_detail.html and event_detail.html with the production template "
+        "settings and with an uncached loader in debug mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--events", type=int, default=100)
+        parser.add_argument("--signups", type=int, default=5000)
+        parser.add_argument("--transactions", type=int, default=1000)
+        parser.add_argument("--renders", type=int, default=50)
+        parser.add_argument(
+            "--output", help="Write the JSON report to this path instead of stdout."
+        )
+
+    def handle(self, *args, **options):
+        # Both profiles share the static storage, so skip the manifest.
+        storage = "django.contrib.staticfiles.storage.StaticFilesStorage"
+        with throwaway_database(), override_settings(STATICFILES_STORAGE=storage):
+            dataset = seed_dataset(
+                users=options["users"],
+                events=options["events"],
+                signups=options["signups"],
+                transactions=options["transactions"],
+            )
+            templates = measure_template_renders(dataset, renders=options["renders"])
+            report = {
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "dataset": dataset.sizes,
+                "renders": options["renders"],
+                "templates": templates,
+            }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
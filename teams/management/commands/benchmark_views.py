@@ -0,0 +1,80 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from teams.benchmarking import (
+    BASELINE_PATH,
+    load_baselines,
+    measure_views,
+    regressions,
+    seed_dataset,
+    throwaway_database,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with realistic club history and record "
+        "queries per request and p50/p95 latency for each teams view. Fails "
+        "when a view runs more queries than its stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=300)
+        parser.add_argument("--signups", type=int, default=20000)
+        parser.add_argument("--transactions", type=int, default=20000)
+        parser.add_argument("--requests", type=int, default=20)
+        parser.add_argument(
+            "--output", help="Write the JSON report to this path instead of stdout."
+        )
+        parser.add_argument("--baseline", default=str(BASELINE_PATH))
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store this run's query counts as the new baseline.",
+        )
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            dataset = seed_dataset(
+                users=options["users"],
+                events=options["events"],
+                signups=options["signups"],
+                transactions=options["transactions"],
+            )
+            views = measure_views(dataset, requests=options["requests"])
+            report = {
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "dataset": dataset.sizes,
+                "requests_per_view": options["requests"],
+                "views": views,
+            }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options["update_baseline"]:
+            baselines = {name: result["queries"] for name, result in views.items()}
+            with open(options["baseline"], "w") as handle:
+                json.dump(baselines, handle, indent=2, sort_keys=True)
+                handle.write("\n")
+            self.stderr.write(f"Baseline written to {options['baseline']}.")
+            return
+
+        failures = regressions(views, load_baselines(options["baseline"]))
+        if failures:
+            details = ", ".join(
+                f"{name} ran {count} queries (baseline {baseline})"
+                for name, (count, baseline) in sorted(failures.items())
+            )
+            raise CommandError(f"Query count regression: {details}.")
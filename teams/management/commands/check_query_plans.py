@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from teams.benchmarking import plan_problems, seed_dataset, throwaway_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, run every benchmarked teams view and "
+        "EXPLAIN each SELECT it issues. Fails when a query plans a sequential "
+        "scan of a table with at least --min-rows rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=300)
+        parser.add_argument("--signups", type=int, default=20000)
+        parser.add_argument("--transactions", type=int, default=20000)
+        parser.add_argument("--min-rows", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            dataset = seed_dataset(
+                users=options["users"],
+                events=options["events"],
+                signups=options["signups"],
+                transactions=options["transactions"],
+            )
+            # Freshly seeded tables have no statistics yet; gather them so
+            # the planner chooses as it would against production data.
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            problems = plan_problems(dataset, min_rows=options["min_rows"])
+
+        if not problems:
+            self.stdout.write(
+                self.style.SUCCESS("No sequential scans of large tables.")
+            )
+            return
+        for name, scans in sorted(problems.items()):
+            for table, rows, sql in scans:
+                self.stdout.write(f"{name}: sequential scan of {table} ({rows} rows)")
+                self.stdout.write(f"    {sql}")
+        raise CommandError(
+            f"{sum(len(scans) for scans in problems.values())} query plan(s) "
+            "scan large tables."
+        )
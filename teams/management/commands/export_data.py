@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from teams.exports import DATASETS, FORMATS, stream_rows
+from teams.models import Team
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream events, signups or wallet transactions as CSV or JSON Lines. "
+        "Rows are written as they are read, so large exports use constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(DATASETS))
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--team", help="Team name; defaults to every team.")
+        parser.add_argument(
+            "--since", type=date.fromisoformat, help="First day, YYYY-MM-DD."
+        )
+        parser.add_argument(
+            "--until", type=date.fromisoformat, help="Last day, YYYY-MM-DD."
+        )
+        parser.add_argument("--output", help="Write to this path instead of stdout.")
+
+    def handle(self, *args, **options):
+        team = None
+        if options["team"]:
+            team = Team.objects.filter(name=options["team"]).first()
+            if team is None:
+                raise CommandError(f"No team named {options['team']!r}.")
+
+        dataset = DATASETS[options["dataset"]]
+        queryset = dataset.queryset(
+            team=team, since=options["since"], until=options["until"]
+        )
+        chunks = stream_rows(dataset, queryset, options["format"])
+        if options["output"]:
+            with open(options["output"], "w", newline="") as handle:
+                handle.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
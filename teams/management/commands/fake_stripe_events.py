@@ -0,0 +1,175 @@
+import hashlib
+import hmac
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import reverse
+
+from teams.benchmarking import percentile
+from teams.views import StripeWebhookView
+
+
+def checkout_completed_event(user_id, amount_cents):
+    session_id = f"cs_test_{uuid.uuid4().hex}"
+    return {
+        "id": f"evt_test_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "livemode": False,
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": "paid",
+                "amount_total": amount_cents,
+                "client_reference_id": str(user_id),
+                "metadata": {"user_id": str(user_id)},
+                "payment_intent": f"pi_test_{uuid.uuid4().hex}",
+            }
+        },
+    }
+
+
+def signature_header(payload, secret, timestamp=None):
+    """Build a ``Stripe-Signature`` header the way Stripe signs deliveries."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.{payload}".encode()
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Send signed fake checkout.session.completed webhooks for load testing. "
+        "Posts to --url, or calls the webhook view in-process when no URL is given. "
+        "Run process_stripe_events afterwards to apply them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500)
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.1,
+            help="Share of deliveries that replay an earlier event.",
+        )
+        parser.add_argument("--amount", type=int, default=1000, help="Amount in pence.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--url", help="Webhook URL of a running server.")
+        parser.add_argument(
+            "--secret",
+            help="Signing secret; defaults to STRIPE_WEBHOOK_SECRET.",
+        )
+
+    def handle(self, *args, **options):
+        secret = options["secret"] or settings.STRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError("Set STRIPE_WEBHOOK_SECRET or pass --secret.")
+        user_ids = list(
+            get_user_model().objects.order_by("pk").values_list("pk", flat=True)[:1000]
+        )
+        if not user_ids:
+            raise CommandError("Create at least one user first.")
+
+        events = []
+        payloads = []
+        replays = int(options["count"] * options["duplicates"])
+        for index in range(options["count"] - replays):
+            event = checkout_completed_event(
+                user_ids[index % len(user_ids)], options["amount"]
+            )
+            events.append(event)
+            payloads.append(json.dumps(event))
+        payloads.extend(payloads[index % len(payloads)] for index in range(replays))
+
+        send = self.http_sender(options["url"]) if options["url"] else self.view_sender()
+        concurrency = max(min(options["concurrency"], len(payloads)), 1)
+        if not options["url"] and connection.vendor == "sqlite" and concurrency > 1:
+            self.stderr.write("SQLite allows one writer; running with --concurrency 1.")
+            concurrency = 1
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def worker(chunk):
+            try:
+                for payload in chunk:
+                    started = time.perf_counter()
+                    status = send(payload, signature_header(payload, secret))
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        if status != 200:
+                            failures.append(status)
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+
+        chunks = [payloads[index::concurrency] for index in range(concurrency)]
+        started = time.perf_counter()
+        if concurrency == 1:
+            worker(chunks[0])
+        else:
+            threads = [
+                threading.Thread(target=worker, args=(chunk,)) for chunk in chunks
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        seconds = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Sent {len(payloads)} deliveries ({len(events)} unique) in "
+            f"{seconds:.2f}s: {len(payloads) / seconds:.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:.2f} ms  "
+            f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms  "
+            f"non-200 {len(failures)}"
+        )
+
+    @staticmethod
+    def http_sender(url):
+        def send(payload, signature):
+            request = urllib.request.Request(
+                url,
+                data=payload.encode(),
+                headers={
+                    "Content-Type": "application/json",
+                    "Stripe-Signature": signature,
+                },
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status
+            except urllib.error.HTTPError as exc:
+                return exc.code
+
+        return send
+
+    @staticmethod
+    def view_sender():
+        path = reverse("teams:stripe-webhook")
+        factory = RequestFactory()
+        view = StripeWebhookView.as_view()
+
+        def send(payload, signature):
+            request = factory.post(
+                path,
+                data=payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature,
+            )
+            return view(request).status_code
+
+        return send
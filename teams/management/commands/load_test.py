@@ -0,0 +1,173 @@
+import itertools
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from teams.benchmarking import percentile
+
+
+def database_connections():
+    """Count other client connections to this database, or ``None`` if unknown."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() "
+            "AND backend_type = 'client backend' AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0]
+
+
+class ConnectionSampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                count = database_connections()
+                if count is None:
+                    return
+                self.samples.append(count)
+                self.stopped.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test running servers and compare tail latency and database "
+        "connection use, e.g. gunicorn in SERVER_MODE=wsgi and SERVER_MODE=asgi "
+        "started against the same database: "
+        "load_test --target wsgi=http://localhost:8000 "
+        "--target asgi=http://localhost:8001 --path / --path /events/1/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="name=base_url of a running server; repeat to compare.",
+        )
+        parser.add_argument(
+            "--path", action="append", help="Path to request; repeat for a mix."
+        )
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument(
+            "--cookie",
+            help="Cookie header to send, e.g. a member's sessionid=... to load "
+            "the signed-in pages.",
+        )
+        parser.add_argument(
+            "--sample-interval",
+            type=float,
+            default=0.2,
+            help="Seconds between database connection samples (PostgreSQL only).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print a JSON report.")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            name, sep, base_url = target.partition("=")
+            if not sep or not base_url:
+                raise CommandError(f"Expected name=url, got {target!r}.")
+            targets.append((name, base_url.rstrip("/")))
+        paths = options["path"] or ["/"]
+
+        report = {
+            "database": connection.vendor,
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "paths": paths,
+            "targets": {},
+        }
+        for name, base_url in targets:
+            report["targets"][name] = self.run_target(base_url, paths, options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report["targets"].items():
+            connections = (
+                f"db connections peak {result['db_connections_peak']} "
+                f"mean {result['db_connections_mean']:.1f}"
+                if result["db_connections_peak"] is not None
+                else "db connections n/a"
+            )
+            self.stdout.write(
+                f"{name:>8}: {result['requests_per_second']:8.1f} req/s  "
+                f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+                f"p99 {result['p99_ms']:7.2f} ms  errors {result['errors']}  "
+                f"{connections}"
+            )
+
+    def run_target(self, base_url, paths, options):
+        headers = {"Cookie": options["cookie"]} if options["cookie"] else {}
+        urls = itertools.cycle(f"{base_url}{path}" for path in paths)
+        queue = [next(urls) for _ in range(options["requests"])]
+        concurrency = max(min(options["concurrency"], len(queue)), 1)
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(chunk):
+            for url in chunk:
+                request = urllib.request.Request(url, headers=headers)
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(
+                        request, timeout=options["timeout"]
+                    ) as response:
+                        response.read()
+                        status = response.status
+                except urllib.error.HTTPError as exc:
+                    status = exc.code
+                except OSError as exc:
+                    status = type(exc).__name__
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if status != 200:
+                        errors.append(status)
+
+        sampler = ConnectionSampler(options["sample_interval"])
+        sampler.start()
+        chunks = [queue[index::concurrency] for index in range(concurrency)]
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        samples = sampler.stop()
+
+        return {
+            "seconds": round(seconds, 4),
+            "requests_per_second": len(queue) / seconds if seconds else 0.0,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "errors": len(errors),
+            "db_connections_peak": max(samples) if samples else None,
+            "db_connections_mean": statistics.mean(samples) if samples else None,
+        }
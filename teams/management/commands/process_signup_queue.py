@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from teams import booking
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain queued RSVPs for events in booking-rush mode. Run a single "
+        "instance alongside the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain everything that is queued now, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            close_old_connections()
+            processed = 0
+            for event_id in booking.events_with_pending_requests():
+                while True:
+                    count = booking.drain_signup_requests(event_id, batch_size)
+                    processed += count
+                    if count < batch_size:
+                        break
+            if processed and options["verbosity"] > 1:
+                self.stdout.write(f"Processed {processed} signup request(s).")
+            if options["once"]:
+                self.stdout.write(f"Processed {processed} signup request(s).")
+                return
+            if not processed:
+                time.sleep(options["interval"])
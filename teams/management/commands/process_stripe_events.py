@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from teams import payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply Stripe webhook events stored in the inbox. Run alongside the web "
+        "workers; several instances can run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the inbox is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Apply everything that is in the inbox now, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            close_old_connections()
+            processed = 0
+            while True:
+                count = payments.drain_stripe_events(batch_size)
+                processed += count
+                if count < batch_size:
+                    break
+            if processed and options["verbosity"] > 1:
+                self.stdout.write(f"Processed {processed} Stripe event(s).")
+            if options["once"]:
+                self.stdout.write(f"Processed {processed} Stripe event(s).")
+                return
+            if not processed:
+                time.sleep(options["interval"])
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from teams.booking import count_signups
+from teams.cache import bump_versions
+from teams.models import Event
+
+
+class Command(BaseCommand):
+    help = "Verify stored per-event signup counters against EventSignup rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Rewrite drifted counters from the signup rows.",
+        )
+
+    def handle(self, *args, **options):
+        counters = Event.objects.values_list("pk", *Event.COUNTER_FIELDS)
+        actual = count_signups()
+        drifted = []
+        for pk, *stored in counters.iterator():
+            expected = actual.get(pk, {})
+            diffs = {
+                field: (value, expected.get(field, 0))
+                for field, value in zip(Event.COUNTER_FIELDS, stored)
+                if value != expected.get(field, 0)
+            }
+            if diffs:
+                drifted.append(pk)
+                details = ", ".join(
+                    f"{field} stored={value} actual={real}"
+                    for field, (value, real) in diffs.items()
+                )
+                self.stdout.write(f"Event {pk}: {details}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All signup counters match."))
+            return
+
+        if not options["fix"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(drifted)} event(s) drifted. Re-run with --fix to repair."
+                )
+            )
+            return
+
+        for pk in drifted:
+            with transaction.atomic():
+                event = Event.objects.select_for_update().filter(pk=pk)
+                if not event.exists():
+                    continue
+                expected = count_signups([pk]).get(pk, {})
+                event.update(
+                    **{field: expected.get(field, 0) for field in Event.COUNTER_FIELDS}
+                )
+                bump_versions(
+                    event_ids=[pk], team_ids=event.values_list("team_id", flat=True)
+                )
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} event(s)."))
@@ -0,0 +1,85 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from teams.startup import BASELINE_PATH, measure_startup, startup_regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Start fresh interpreters that import the server entry point and warm "
+        "up as a gunicorn worker would, and report import and warm-up time and "
+        "the most expensive packages. Fails when more modules load than in "
+        "the stored baseline, or the import is slower by over --tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument(
+            "--module",
+            help="Entry point to import. Defaults to the one for SERVER_MODE.",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this path instead of stdout."
+        )
+        parser.add_argument("--baseline", default=str(BASELINE_PATH))
+        parser.add_argument("--tolerance", type=float, default=1.5)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store this run's module count and import time as the new baseline.",
+        )
+
+    def handle(self, *args, **options):
+        module = options["module"] or (
+            "bangers.asgi"
+            if settings.SERVER_MODE == "asgi"
+            else settings.WSGI_APPLICATION.rsplit(".", 1)[0]
+        )
+        measured = measure_startup(module, runs=options["runs"])
+        packages = sorted(
+            measured.pop("packages").items(), key=lambda item: item[1], reverse=True
+        )
+        report = {
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "module": module,
+            "runs": options["runs"],
+            **measured,
+            "packages_ms": dict(packages[: options["top"]]),
+        }
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options["update_baseline"]:
+            baseline = {
+                "import_ms": report["import_ms"],
+                "modules": report["modules"],
+            }
+            with open(options["baseline"], "w") as handle:
+                json.dump(baseline, handle, indent=2, sort_keys=True)
+                handle.write("\n")
+            self.stderr.write(f"Baseline written to {options['baseline']}.")
+            return
+
+        try:
+            with open(options["baseline"]) as handle:
+                baseline = json.load(handle)
+        except FileNotFoundError:
+            return
+        failures = startup_regressions(report, baseline, options["tolerance"])
+        if failures:
+            details = ", ".join(
+                f"{name} {value} (baseline {limit})"
+                for name, (value, limit) in sorted(failures.items())
+            )
+            raise CommandError(f"Start-up regression: {details}.")
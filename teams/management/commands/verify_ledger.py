@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from teams import ledger
+from teams.models import Wallet, WalletSnapshot, WalletTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every wallet balance from its latest snapshot and the "
+        "ledger rows after it, and report wallets whose stored balance differs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Record a snapshot for every wallet that matches its ledger. "
+            "Each chunk of wallets is locked while it is read, so the snapshot "
+            "cannot miss a posting that commits later.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Sum every wallet's whole ledger instead of starting from its "
+            "latest snapshot.",
+        )
+        parser.add_argument(
+            "--record-adjustments",
+            action="store_true",
+            help="Append an adjustment row to each drifted wallet's ledger so "
+            "it sums to the stored balance, e.g. for balances set before the "
+            "ledger was complete.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = {}
+        snapshots = []
+        checked = 0
+        for wallet_id, stored, computed, last_id in ledger.ledger_totals(
+            options["chunk_size"], lock=options["snapshot"], full=options["full"]
+        ):
+            checked += 1
+            if stored != computed:
+                drifted[wallet_id] = stored - computed
+                self.stdout.write(
+                    f"Wallet {wallet_id}: stored={stored} ledger={computed}"
+                )
+            elif options["snapshot"]:
+                snapshots.append(
+                    WalletSnapshot(
+                        wallet_id=wallet_id,
+                        balance=computed,
+                        last_transaction_id=last_id,
+                    )
+                )
+                if len(snapshots) >= options["chunk_size"]:
+                    WalletSnapshot.objects.bulk_create(snapshots)
+                    snapshots = []
+        if snapshots:
+            WalletSnapshot.objects.bulk_create(snapshots)
+
+        if not drifted:
+            self.stdout.write(
+                self.style.SUCCESS(f"All {checked} wallet balances match the ledger.")
+            )
+            return
+
+        if not options["record_adjustments"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(drifted)} of {checked} wallet(s) drifted. Re-run with "
+                    "--record-adjustments to reconcile the ledger."
+                )
+            )
+            return
+
+        with transaction.atomic():
+            # Locked so a concurrent posting cannot slip in between the
+            # comparison above and the adjustment rows.
+            wallets = Wallet.objects.select_for_update().in_bulk(list(drifted))
+            adjustments = []
+            for wallet_id, wallet in wallets.items():
+                difference = wallet.balance - ledger.ledger_balance(wallet_id)
+                if difference:
+                    adjustments.append(
+                        WalletTransaction(
+                            wallet=wallet,
+                            amount=difference,
+                            kind=WalletTransaction.Kind.ADJUSTMENT,
+                        )
+                    )
+            WalletTransaction.objects.bulk_create(adjustments)
+        self.stdout.write(
+            self.style.SUCCESS(f"Recorded {len(adjustments)} adjustment(s).")
+        )
@@ -0,0 +1,191 @@
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .cache import resolve_site_id
+
+logger = logging.getLogger("teams.timing")
+
+_current_timings = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self, slow_query_limit):
+        self.slow_query_limit = slow_query_limit
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.slow_queries = []
+        self.template_seconds = 0.0
+        self.external_seconds = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.query_count += 1
+            self.db_seconds += elapsed
+            entry = (elapsed, self.query_count, sql[:300])
+            if len(self.slow_queries) < self.slow_query_limit:
+                heapq.heappush(self.slow_queries, entry)
+            elif self.slow_query_limit:
+                heapq.heappushpop(self.slow_queries, entry)
+
+    def server_timing(self, total_seconds):
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.query_count} queries"',
+            f"tpl;dur={self.template_seconds * 1000:.2f}",
+        ]
+        metrics.extend(
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in sorted(self.external_seconds.items())
+        )
+        metrics.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def as_log(self, request, response, total_seconds):
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total_seconds * 1000, 2),
+            "db_queries": self.query_count,
+            "db_ms": round(self.db_seconds * 1000, 2),
+            "template_ms": round(self.template_seconds * 1000, 2),
+            "external_ms": {
+                name: round(seconds * 1000, 2)
+                for name, seconds in self.external_seconds.items()
+            },
+            "slow_queries": [
+                {"ms": round(elapsed * 1000, 2), "sql": sql}
+                for elapsed, _, sql in sorted(self.slow_queries, reverse=True)
+            ],
+        }
+
+
+def record_template_time(seconds):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.template_seconds += seconds
+
+
+@contextmanager
+def timed_external(name):
+    """Attribute the time spent in the block to an external service."""
+    timings = _current_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            elapsed = time.perf_counter() - started
+            timings.external_seconds[name] = (
+                timings.external_seconds.get(name, 0.0) + elapsed
+            )
+
+
+class RequestTimingMiddleware:
+    """Per-request SQL, template and external-call timings.
+
+    Enabled with ``REQUEST_TIMING_ENABLED``; ``REQUEST_TIMING_SAMPLE_RATE``
+    controls the share of requests measured. Each sampled request is logged as
+    one JSON line on ``teams.timing`` and gets a ``Server-Timing`` header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        started = time.perf_counter()
+        timings = RequestTimings(settings.REQUEST_TIMING_SLOW_QUERIES)
+        token = _current_timings.set(timings)
+        try:
+            with self.wrap_connections(timings):
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self.report(request, response, timings, started)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        timings = RequestTimings(settings.REQUEST_TIMING_SLOW_QUERIES)
+        token = _current_timings.set(timings)
+        # Connections are per thread, and async views query from the thread
+        # sync_to_async runs this request's ORM calls on, not the event loop.
+        wrappers = await sync_to_async(self.wrap_connections)(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrappers.close()
+            _current_timings.reset(token)
+        return self.report(request, response, timings, started)
+
+    @staticmethod
+    def wrap_connections(timings):
+        wrappers = ExitStack()
+        for alias in connections:
+            wrappers.enter_context(connections[alias].execute_wrapper(timings))
+        return wrappers
+
+    def report(self, request, response, timings, started):
+        total_seconds = time.perf_counter() - started
+        if settings.REQUEST_TIMING_HEADER:
+            response["Server-Timing"] = timings.server_timing(total_seconds)
+        logger.info(json.dumps(timings.as_log(request, response, total_seconds)))
+        return response
+
+
+class SiteMiddleware:
+    """Resolve ``SITE_ID`` from ``SITE_DOMAIN`` on the first request.
+
+    Doing it here rather than in ``AppConfig.ready`` keeps database access
+    out of start-up, so management commands and fresh workers never wait
+    on it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SITE_DOMAIN or settings.SITE_ID:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.resolved = False
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.resolved:
+            # Keep trying until the Site row exists.
+            self.resolved = resolve_site_id() is not None
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.resolved:
+            self.resolved = await sync_to_async(resolve_site_id)() is not None
+        return await self.get_response(request)
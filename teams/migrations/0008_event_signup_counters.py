@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_signup_counters(apps, schema_editor):
+    Event = apps.get_model("teams", "Event")
+    EventSignup = apps.get_model("teams", "EventSignup")
+
+    counts = {}
+    rows = EventSignup.objects.values("event_id", "status").annotate(total=Count("id"))
+    for row in rows:
+        counts.setdefault(row["event_id"], {})[f"{row['status']}_count"] = row["total"]
+    for event_id, fields in counts.items():
+        Event.objects.filter(pk=event_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("teams", "0007_remove_event_location"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="yes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="waitlist_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="maybe_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="no_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_signup_counters, migrations.RunPython.noop),
+    ]
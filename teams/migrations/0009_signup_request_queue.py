@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("teams", "0008_event_signup_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="queued_booking",
+            field=models.BooleanField(
+                default=False,
+                help_text="Booking-rush mode: queue RSVPs and process them in batches.",
+            ),
+        ),
+        migrations.CreateModel(
+            name="SignupRequest",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("requested_status", models.CharField(choices=[("yes", "Yes"), ("maybe", "Maybe"), ("no", "No"), ("waitlist", "Waitlist")], max_length=10)),
+                ("state", models.CharField(choices=[("pending", "Pending"), ("done", "Done")], default="pending", max_length=10)),
+                ("result_status", models.CharField(blank=True, choices=[("yes", "Yes"), ("maybe", "Maybe"), ("no", "No"), ("waitlist", "Waitlist")], max_length=10)),
+                ("message", models.CharField(blank=True, max_length=200)),
+                ("message_level", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("event", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="signup_requests", to="teams.event")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="signup_requests", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["event", "state", "created_at"], name="signup_request_queue")],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-16 23:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0010_stripe_event_inbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wallet',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='wallettransaction',
+            name='kind',
+            field=models.CharField(choices=[('topup', 'Top up'), ('event_debit', 'Event debit'), ('event_refund', 'Event refund'), ('adjustment', 'Adjustment')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='teams.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', '-last_transaction_id'], name='wallet_snapshot_latest')],
+            },
+        ),
+    ]
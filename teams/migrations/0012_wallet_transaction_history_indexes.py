@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0011_wallet_ledger_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', '-created_at', '-id'], name='wallet_tx_history'),
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['-created_at', '-id'], name='wallet_tx_recent'),
+        ),
+    ]
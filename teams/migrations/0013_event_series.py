@@ -0,0 +1,49 @@
+# Generated by Django 4.2.27 on 2026-10-16 23:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('teams', '0012_wallet_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='is_cancelled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='EventSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=140)),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('starts_time', models.TimeField()),
+                ('ends_time', models.TimeField()),
+                ('frequency', models.PositiveSmallIntegerField(choices=[(1, 'Weekly'), (2, 'Fortnightly')], default=1)),
+                ('skip_dates', models.JSONField(blank=True, default=list)),
+                ('min_participants', models.PositiveIntegerField(default=0)),
+                ('max_participants', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='created_series', to=settings.AUTH_USER_MODEL)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='teams.team')),
+                ('venue', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='series', to='teams.venue')),
+            ],
+            options={
+                'verbose_name_plural': 'event series',
+            },
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='teams.eventseries'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.27 on 2026-10-16 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0013_event_series'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['team', 'starts_at', 'id'], name='event_team_start'),
+        ),
+        migrations.AddIndex(
+            model_name='eventsignup',
+            index=models.Index(fields=['event', 'status', 'created_at'], name='signup_event_status'),
+        ),
+        migrations.AddIndex(
+            model_name='eventsignup',
+            index=models.Index(condition=models.Q(('status', 'waitlist')), fields=['event', 'created_at', 'id'], name='signup_waitlist_queue'),
+        ),
+        migrations.AddIndex(
+            model_name='eventsignup',
+            index=models.Index(condition=models.Q(('status', 'yes')), fields=['user', 'event'], name='signup_user_booked'),
+        ),
+    ]
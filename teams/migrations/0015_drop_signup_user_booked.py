@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0014_query_shaped_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='eventsignup',
+            name='signup_user_booked',
+        ),
+    ]
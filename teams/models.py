@@ -1,6 +1,10 @@
+from datetime import date, datetime, timedelta
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 
 class Team(models.Model):
@@ -46,6 +50,81 @@ class TeamMembership(models.Model):
         return f"{self.user} on {self.team} ({self.role})"
 
 
+class EventSeries(models.Model):
+    """A recurring rule whose occurrences are materialized as events."""
+
+    class Frequency(models.IntegerChoices):
+        WEEKLY = 1, "Weekly"
+        FORTNIGHTLY = 2, "Fortnightly"
+
+    team = models.ForeignKey(Team, related_name="series", on_delete=models.CASCADE)
+    title = models.CharField(max_length=140)
+    venue = models.ForeignKey(
+        Venue, related_name="series", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    first_date = models.DateField()
+    last_date = models.DateField()
+    starts_time = models.TimeField()
+    ends_time = models.TimeField()
+    frequency = models.PositiveSmallIntegerField(
+        choices=Frequency.choices, default=Frequency.WEEKLY
+    )
+    # ISO dates the rule skips, e.g. bank holidays or a hall booking clash.
+    skip_dates = models.JSONField(default=list, blank=True)
+    min_participants = models.PositiveIntegerField(default=0)
+    max_participants = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="created_series", on_delete=models.PROTECT
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "event series"
+
+    MAX_OCCURRENCES = 104
+
+    # Fields copied onto every occurrence under the same name.
+    OCCURRENCE_FIELDS = (
+        "title",
+        "venue",
+        "min_participants",
+        "max_participants",
+        "price",
+    )
+
+    def __str__(self):
+        return f"{self.title} ({self.get_frequency_display().lower()})"
+
+    def dates(self):
+        """Dates the rule produces, without the skipped ones."""
+        skipped = {date.fromisoformat(day) for day in self.skip_dates}
+        step = timedelta(weeks=self.frequency)
+        day = self.first_date
+        while day <= self.last_date:
+            if day not in skipped:
+                yield day
+            day += step
+
+    def occurrence_times(self, day):
+        return (
+            timezone.make_aware(datetime.combine(day, self.starts_time)),
+            timezone.make_aware(datetime.combine(day, self.ends_time)),
+        )
+
+    def occurrence(self, day):
+        """An unsaved event for ``day``."""
+        starts_at, ends_at = self.occurrence_times(day)
+        return Event(
+            team_id=self.team_id,
+            series=self,
+            starts_at=starts_at,
+            ends_at=ends_at,
+            created_by_id=self.created_by_id,
+            **{field: getattr(self, field) for field in self.OCCURRENCE_FIELDS},
+        )
+
+
 class Event(models.Model):
     team = models.ForeignKey(Team, related_name="events", on_delete=models.CASCADE)
     title = models.CharField(max_length=140)
@@ -61,9 +140,30 @@ class Event(models.Model):
         settings.AUTH_USER_MODEL, related_name="created_events", on_delete=models.PROTECT
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    yes_count = models.PositiveIntegerField(default=0, editable=False)
+    waitlist_count = models.PositiveIntegerField(default=0, editable=False)
+    maybe_count = models.PositiveIntegerField(default=0, editable=False)
+    no_count = models.PositiveIntegerField(default=0, editable=False)
+    queued_booking = models.BooleanField(
+        default=False,
+        help_text="Booking-rush mode: queue RSVPs and process them in batches.",
+    )
+    series = models.ForeignKey(
+        EventSeries,
+        related_name="occurrences",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    # Set by teams.booking.cancel_events, which refunds paid bookings.
+    is_cancelled = models.BooleanField(default=False, editable=False)
 
     class Meta:
         ordering = ["starts_at"]
+        indexes = [
+            # Upcoming and past event pages: one team, keyset on starts_at.
+            models.Index(fields=["team", "starts_at", "id"], name="event_team_start"),
+        ]
         constraints = [
             models.CheckConstraint(check=Q(max_participants__gte=1), name="event_max_gte_1"),
             models.CheckConstraint(
@@ -72,16 +172,56 @@ class Event(models.Model):
             ),
         ]
 
+    COUNTER_FIELDS = ("yes_count", "waitlist_count", "maybe_count", "no_count")
+
     def __str__(self):
         return f"{self.title} ({self.team})"
 
+    def save(self, *args, **kwargs):
+        # Counters are only ever moved with F() updates; never write back a
+        # possibly stale in-memory copy when the rest of the event is edited.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def counter_field(status):
+        return f"{status}_count"
+
+    @classmethod
+    def adjust_signup_counts(cls, event, deltas):
+        """Apply ``{status: delta}`` to the stored counters of ``event``.
+
+        ``event`` may be an instance or a primary key. The row is updated with
+        ``F()`` expressions so callers must already be inside the transaction
+        that changes the signups; instances are kept in sync in memory.
+        Counters stop at zero, so a decrement on a drifted counter cannot
+        break the unsigned column; ``reconcile_signup_counts`` repairs drift.
+        """
+        updates = {
+            cls.counter_field(status): Greatest(
+                F(cls.counter_field(status)) + delta, 0
+            )
+            for status, delta in deltas.items()
+            if status and delta
+        }
+        if not updates:
+            return
+        event_id = event.pk if isinstance(event, cls) else event
+        cls.objects.filter(pk=event_id).update(**updates)
+        if isinstance(event, cls):
+            for status, delta in deltas.items():
+                if status and delta:
+                    field = cls.counter_field(status)
+                    setattr(event, field, max(getattr(event, field) + delta, 0))
+
     @property
     def spots_taken(self):
-        if hasattr(self, "yes_count"):
-            return self.yes_count
-        if hasattr(self, "signup_count"):
-            return self.signup_count
-        return self.signups.filter(status=EventSignup.Status.YES).count()
+        return self.yes_count
 
     @property
     def spots_left(self):
@@ -109,19 +249,107 @@ class EventSignup(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # (event, user) lookups, such as the home page's my_status subquery,
+        # use the unique constraint's index.
         constraints = [
             models.UniqueConstraint(fields=["event", "user"], name="unique_event_signup"),
         ]
+        indexes = [
+            models.Index(
+                fields=["event", "status", "created_at"], name="signup_event_status"
+            ),
+            # Waitlist promotion reads the queue in arrival order.
+            models.Index(
+                fields=["event", "created_at", "id"],
+                name="signup_waitlist_queue",
+                condition=Q(status="waitlist"),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} -> {self.event} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "event_id" in instance.__dict__ and "status" in instance.__dict__:
+            instance._counted = (instance.event_id, instance.status)
+        return instance
+
+    def counted_state(self):
+        """The (event_id, status) pair currently reflected in the counters."""
+        if self._state.adding:
+            return (None, None)
+        if not hasattr(self, "_counted"):
+            self._counted = (
+                EventSignup.objects.filter(pk=self.pk)
+                .values_list("event_id", "status")
+                .first()
+            ) or (None, None)
+        return self._counted
+
+    def save(self, *args, **kwargs):
+        counted_event_id, counted_status = self.counted_state()
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            if (counted_event_id, counted_status) != (self.event_id, self.status):
+                event = self.event if EventSignup.event.is_cached(self) else self.event_id
+                if counted_event_id == self.event_id:
+                    Event.adjust_signup_counts(
+                        event, {counted_status: -1, self.status: 1}
+                    )
+                else:
+                    if counted_event_id:
+                        Event.adjust_signup_counts(
+                            counted_event_id, {counted_status: -1}
+                        )
+                    Event.adjust_signup_counts(event, {self.status: 1})
+        self._counted = (self.event_id, self.status)
+
+
+class SignupRequest(models.Model):
+    class State(models.TextChoices):
+        PENDING = "pending", "Pending"
+        DONE = "done", "Done"
+
+    event = models.ForeignKey(
+        Event, related_name="signup_requests", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="signup_requests", on_delete=models.CASCADE
+    )
+    requested_status = models.CharField(max_length=10, choices=EventSignup.Status.choices)
+    state = models.CharField(
+        max_length=10, choices=State.choices, default=State.PENDING
+    )
+    result_status = models.CharField(
+        max_length=10, choices=EventSignup.Status.choices, blank=True
+    )
+    message = models.CharField(max_length=200, blank=True)
+    message_level = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["event", "state", "created_at"], name="signup_request_queue"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> {self.event} ({self.requested_status}, {self.state})"
+
 
 class Wallet(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, related_name="wallet", on_delete=models.CASCADE
     )
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Running total of the wallet's ledger rows. Only teams.ledger changes it,
+    # in the same statement set that appends the WalletTransaction.
+    balance = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -133,6 +361,7 @@ class WalletTransaction(models.Model):
         TOPUP = "topup", "Top up"
         EVENT_DEBIT = "event_debit", "Event debit"
         EVENT_REFUND = "event_refund", "Event refund"
+        ADJUSTMENT = "adjustment", "Adjustment"
 
     wallet = models.ForeignKey(
         Wallet, related_name="transactions", on_delete=models.CASCADE
@@ -146,5 +375,65 @@ class WalletTransaction(models.Model):
     stripe_payment_intent = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Newest-first history pages, per wallet and across all wallets.
+            models.Index(
+                fields=["wallet", "-created_at", "-id"], name="wallet_tx_history"
+            ),
+            models.Index(fields=["-created_at", "-id"], name="wallet_tx_recent"),
+        ]
+
     def __str__(self):
         return f"{self.wallet.user} {self.kind} {self.amount}"
+
+
+class WalletSnapshot(models.Model):
+    """Ledger balance of a wallet up to and including ``last_transaction_id``."""
+
+    wallet = models.ForeignKey(
+        Wallet, related_name="snapshots", on_delete=models.CASCADE
+    )
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    last_transaction_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["wallet", "-last_transaction_id"],
+                name="wallet_snapshot_latest",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet} {self.balance} @ {self.last_transaction_id}"
+
+
+class StripeEvent(models.Model):
+    """Verified Stripe webhook delivery waiting to be applied."""
+
+    class State(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSED = "processed", "Processed"
+        IGNORED = "ignored", "Ignored"
+        FAILED = "failed", "Failed"
+
+    stripe_event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    state = models.CharField(
+        max_length=10, choices=State.choices, default=State.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "received_at"], name="stripe_event_inbox"),
+        ]
+
+    def __str__(self):
+        return f"{self.stripe_event_id} {self.event_type} ({self.state})"
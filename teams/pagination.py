@@ -0,0 +1,120 @@
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+# Largest value a bigint primary key can hold; bigger ones overflow the query.
+MAX_PK = 2**63 - 1
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str | None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CappedCountPaginator(Paginator):
+    """Paginator that stops counting at ``max_count`` rows.
+
+    For admin lists over large tables: the count query reads at most
+    ``max_count + 1`` rows and later pages are reached by filtering.
+    """
+
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[: self.max_count].count()
+
+
+def encode_cursor(value, pk):
+    raw = f"{value.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return the ``(datetime, pk)`` position in ``token``, or ``None``.
+
+    Tokens that do not decode, carry a naive datetime or a pk outside the
+    bigint range are rejected, so a tampered cursor falls back to the first
+    page instead of failing the query.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit("|", 1)
+        value, pk = datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if timezone.is_naive(value) or not 1 <= pk <= MAX_PK:
+        return None
+    return value, pk
+
+
+def keyset_queryset(queryset, field, cursor, descending=False):
+    """Filter ``queryset`` to rows after ``cursor`` and order it for paging."""
+    position = decode_cursor(cursor)
+    if position is not None:
+        value, pk = position
+        if descending:
+            after = Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__lt": pk})
+        else:
+            after = Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__gt": pk})
+        queryset = queryset.filter(after)
+
+    if descending:
+        return queryset.order_by(f"-{field}", "-pk")
+    return queryset.order_by(field, "pk")
+
+
+def keyset_slice(items, field, cursor, page_size, descending=False):
+    """:func:`paginate_keyset` over objects already in memory."""
+
+    def key(item):
+        return getattr(item, field), item.pk
+
+    items = sorted(items, key=key, reverse=descending)
+    position = decode_cursor(cursor)
+    if position is not None:
+        if descending:
+            items = [item for item in items if key(item) < position]
+        else:
+            items = [item for item in items if key(item) > position]
+    return keyset_page(items[: page_size + 1], field, page_size)
+
+
+def keyset_page(items, field, page_size):
+    """Build a page from up to ``page_size + 1`` rows fetched in order."""
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(items=items, next_cursor=next_cursor)
+
+
+def paginate_keyset(queryset, field, cursor, page_size, descending=False):
+    """Return one page of ``queryset`` ordered by ``(field, pk)``.
+
+    ``cursor`` is the opaque token from a previous page's ``next_cursor``;
+    invalid tokens are treated as the first page.
+    """
+    queryset = keyset_queryset(queryset, field, cursor, descending)
+    return keyset_page(list(queryset[: page_size + 1]), field, page_size)
+
+
+async def apaginate_keyset(queryset, field, cursor, page_size, descending=False):
+    """Async version of :func:`paginate_keyset`."""
+    queryset = keyset_queryset(queryset, field, cursor, descending)
+    items = [item async for item in queryset[: page_size + 1]]
+    return keyset_page(items, field, page_size)
@@ -0,0 +1,318 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import ledger, stripe_client
+from .booking import get_wallets
+from .models import StripeEvent, WalletTransaction
+
+logger = logging.getLogger(__name__)
+
+TOPUP_EVENT_TYPES = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+}
+
+MAX_ATTEMPTS = 5
+
+
+@dataclass(frozen=True)
+class TopUp:
+    user_id: int
+    session_id: str
+    amount: Decimal
+    payment_intent: str | None = None
+
+
+def topup_from_session(session):
+    """Read a paid Checkout Session as a :class:`TopUp`, or ``None``."""
+    if session.get("payment_status") != "paid":
+        return None
+    user_id = session.get("client_reference_id") or (
+        session.get("metadata") or {}
+    ).get("user_id")
+    amount_total = session.get("amount_total")
+    session_id = session.get("id")
+    if not user_id or amount_total is None or not session_id:
+        return None
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return TopUp(
+        user_id=user_id,
+        session_id=session_id,
+        amount=Decimal(amount_total) / Decimal("100"),
+        payment_intent=session.get("payment_intent") or None,
+    )
+
+
+def credit_topups(topups):
+    """Credit each top-up once, returning the session ids credited now.
+
+    A session that already has a ledger row is skipped, so replays of the same
+    Checkout Session are harmless. Must run inside a transaction.
+    """
+    topups = list({topup.session_id: topup for topup in topups}.values())
+    if not topups:
+        return set()
+    already_logged = set(
+        WalletTransaction.objects.filter(
+            stripe_session_id__in=[topup.session_id for topup in topups]
+        ).values_list("stripe_session_id", flat=True)
+    )
+    user_ids = set(
+        get_user_model()
+        .objects.filter(pk__in={topup.user_id for topup in topups})
+        .values_list("pk", flat=True)
+    )
+    topups = [
+        topup
+        for topup in topups
+        if topup.session_id not in already_logged and topup.user_id in user_ids
+    ]
+    if not topups:
+        return set()
+
+    wallets = get_wallets(topup.user_id for topup in topups)
+    ledger.post_many(
+        WalletTransaction(
+            wallet=wallets[topup.user_id],
+            amount=topup.amount,
+            kind=WalletTransaction.Kind.TOPUP,
+            stripe_session_id=topup.session_id,
+            stripe_payment_intent=topup.payment_intent,
+        )
+        for topup in topups
+    )
+    return {topup.session_id for topup in topups}
+
+
+def record_stripe_event(body):
+    """Append a verified webhook body to the inbox.
+
+    Redeliveries share the Stripe event id and are dropped by the unique
+    constraint, so this is a single insert whatever Stripe retries.
+    """
+    payload = json.loads(body)
+    StripeEvent.objects.bulk_create(
+        [
+            StripeEvent(
+                stripe_event_id=payload["id"],
+                event_type=payload.get("type", ""),
+                payload=payload,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def retry_delay(attempts):
+    """How long a failed event waits after its ``attempts``-th try."""
+    return timedelta(seconds=settings.STRIPE_EVENT_RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def due_stripe_events(now):
+    """Pending events, and failed ones whose backoff has run out."""
+    due = Q(state=StripeEvent.State.PENDING)
+    for attempts in range(1, MAX_ATTEMPTS):
+        due |= Q(
+            state=StripeEvent.State.FAILED,
+            attempts=attempts,
+            processed_at__lte=now - retry_delay(attempts),
+        )
+    return due
+
+
+def drain_stripe_events(batch_size=100):
+    """Apply up to ``batch_size`` inbox events in one transaction.
+
+    Top-ups in the batch are credited together with one lock per wallet.
+    If that fails, each event is retried on its own so a single bad event is
+    marked failed without holding back the rest. Failed events are tried
+    again after an exponential backoff, ``MAX_ATTEMPTS`` times at most.
+    """
+    with transaction.atomic():
+        pending = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(due_stripe_events(timezone.now()))
+            .order_by("received_at", "pk")[:batch_size]
+        )
+        if not pending:
+            return 0
+
+        try:
+            with transaction.atomic():
+                apply_stripe_events(pending)
+        except Exception:
+            logger.exception("Stripe inbox batch failed; retrying events one by one")
+            for record in pending:
+                try:
+                    with transaction.atomic():
+                        apply_stripe_events([record])
+                except Exception as exc:
+                    record.state = StripeEvent.State.FAILED
+                    record.last_error = repr(exc)[:2000]
+
+        processed_at = timezone.now()
+        for record in pending:
+            record.attempts += 1
+            record.processed_at = processed_at
+            if (
+                record.state == StripeEvent.State.FAILED
+                and record.attempts >= MAX_ATTEMPTS
+            ):
+                logger.error(
+                    "Stripe event %s failed %s times and will not be retried: %s",
+                    record.stripe_event_id,
+                    record.attempts,
+                    record.last_error,
+                )
+        StripeEvent.objects.bulk_update(
+            pending, ["state", "attempts", "last_error", "processed_at"]
+        )
+    return len(pending)
+
+
+def apply_stripe_events(records):
+    """Credit the top-ups in ``records`` and set each record's state."""
+    topups = {}
+    for record in records:
+        topup = None
+        if record.event_type in TOPUP_EVENT_TYPES:
+            session = record.payload.get("data", {}).get("object", {})
+            topup = topup_from_session(session)
+        if topup is None:
+            record.state = StripeEvent.State.IGNORED
+        else:
+            topups[record.pk] = topup
+            record.state = StripeEvent.State.PROCESSED
+        record.last_error = ""
+    credit_topups(topups.values())
+
+
+def credit_from_inbox(session_id):
+    """Apply a queued webhook for ``session_id`` now, if one has arrived.
+
+    Returns whether a matching inbox event was found. A record another worker
+    is already applying is skipped rather than waited for.
+    """
+    with transaction.atomic():
+        record = (
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                state__in=[StripeEvent.State.PENDING, StripeEvent.State.FAILED],
+                attempts__lt=MAX_ATTEMPTS,
+                event_type__in=TOPUP_EVENT_TYPES,
+                payload__data__object__id=session_id,
+            )
+            .first()
+        )
+        if record is None:
+            return False
+        apply_stripe_events([record])
+        record.attempts += 1
+        record.processed_at = timezone.now()
+        record.save(update_fields=["state", "attempts", "last_error", "processed_at"])
+    return True
+
+
+class SessionCheck:
+    PENDING = "pending"
+    CREDITED = "credited"
+    UNPAID = "unpaid"
+    ERROR = "error"
+
+
+def session_check_key(session_id):
+    return f"teams:stripe-session:{session_id}"
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.STRIPE_SESSION_CHECK_WORKERS,
+                thread_name_prefix="stripe-session-check",
+            )
+    return _executor
+
+
+def request_session_check(session_id):
+    """Return the cached result of looking up a Checkout Session.
+
+    The first call for a session starts the lookup in a background thread and
+    returns a pending result; later calls read the cached outcome. Raises
+    :class:`~teams.stripe_client.StripeUnavailable` if Stripe is not set up.
+    """
+    stripe_client.get_client()
+    key = session_check_key(session_id)
+    result = cache.get(key)
+    if result is not None:
+        return result
+    pending = {"state": SessionCheck.PENDING}
+    # A pending marker outlives one API timeout, so a lost lookup is retried.
+    if cache.add(key, pending, settings.STRIPE_API_TIMEOUT * 2):
+        if settings.STRIPE_SESSION_CHECK_ASYNC:
+            get_executor().submit(run_session_check, session_id)
+        else:
+            return check_session(session_id)
+    return pending
+
+
+def run_session_check(session_id):
+    close_old_connections()
+    try:
+        check_session(session_id)
+    except Exception:
+        logger.exception("Checkout session check for %s failed", session_id)
+        cache.delete(session_check_key(session_id))
+    finally:
+        connection.close()
+
+
+def check_session(session_id):
+    """Retrieve a Checkout Session, credit it if paid and cache the outcome."""
+    try:
+        session = stripe_client.get_client().retrieve_checkout_session(session_id)
+    except stripe_client.StripeError:
+        logger.warning("Unable to retrieve checkout session %s", session_id)
+        result = {"state": SessionCheck.ERROR}
+        cache.set(session_check_key(session_id), result, settings.STRIPE_API_TIMEOUT)
+        return result
+
+    user_id = session.get("client_reference_id") or (
+        session.get("metadata") or {}
+    ).get("user_id")
+    result = {"state": SessionCheck.UNPAID, "user_id": str(user_id)}
+    topup = topup_from_session(session)
+    if topup is not None:
+        try:
+            with transaction.atomic():
+                credit_topups([topup])
+        except IntegrityError:
+            # The webhook or another check credited the session first.
+            pass
+        result["state"] = SessionCheck.CREDITED
+    cache.set(
+        session_check_key(session_id),
+        result,
+        settings.STRIPE_SESSION_CACHE_TIMEOUT if topup else settings.STRIPE_API_TIMEOUT,
+    )
+    return result
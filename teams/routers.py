@@ -0,0 +1,144 @@
+"""Routing reads to an optional replica database.
+
+When ``DATABASES`` has a ``replica`` alias, views that opt in with
+:func:`replica_reads` read events, signups and venues from it. Everything
+else stays on the primary: writes, locking reads in booking and wallet
+code, and any read by a client that wrote recently. A request that writes
+pins its client to the primary for ``REPLICA_PIN_SECONDS`` with a cookie,
+so a member sees their own RSVP straight away. A request pins itself as
+soon as it writes. Caches filled from replica reads expire quickly, and
+pages built from them carry no ETag, so a lagging replica cannot leave
+stale pages behind under a fresh version.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"
+PIN_COOKIE = "db_primary_until"
+REPLICA_MODELS = {"teams.event", "teams.eventsignup", "teams.venue"}
+
+_current_state = ContextVar("db_routing", default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_allowed = False
+        self.wrote = False
+        self.read_replica = False
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+def pinned_to_primary(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@contextmanager
+def replica_reads():
+    """Let the block's event, signup and venue reads use the replica."""
+    state = _current_state.get()
+    if state is None:
+        yield
+        return
+    previous = state.replica_allowed
+    state.replica_allowed = True
+    try:
+        yield
+    finally:
+        state.replica_allowed = previous
+
+
+def read_from_replica():
+    state = _current_state.get()
+    return state is not None and state.read_replica
+
+
+def cache_timeout(timeout):
+    """``timeout`` for caching this request's output, capped after replica reads."""
+    if read_from_replica():
+        return min(timeout, settings.REPLICA_PIN_SECONDS)
+    return timeout
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current_state.get()
+        if (
+            state is not None
+            and state.replica_allowed
+            and not (state.pinned or state.wrote)
+            and model._meta.label_lower in REPLICA_MODELS
+            and replica_configured()
+        ):
+            state.read_replica = True
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class DatabaseRoutingMiddleware:
+    """Track each request's writes and pin writing clients to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned=pinned_to_primary(request))
+        token = _current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=pinned_to_primary(request))
+        token = _current_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote and replica_configured():
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + pin_seconds),
+                max_age=pin_seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
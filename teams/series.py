@@ -0,0 +1,114 @@
+"""Recurring event series.
+
+A series is a rule: every one or two weeks between two dates, minus some
+skipped dates. Its occurrences are ordinary events, written with one
+``bulk_create``. Edits to the rule are applied to the future occurrences in
+one pass. Occurrences the rule no longer produces are cancelled through
+:func:`booking.cancel_events`, so their refunds are batched too.
+"""
+
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import booking
+from .cache import bump_versions
+from .models import Event
+
+
+@dataclass
+class SeriesChange:
+    created: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    cancellation: booking.Cancellation | None = None
+    # Booked occurrences keep the price their players paid.
+    price_kept: int = 0
+
+
+def future_occurrences(series, now=None):
+    return series.occurrences.filter(
+        starts_at__gt=now or timezone.now(), is_cancelled=False
+    )
+
+
+def create_series(series):
+    """Save a new ``series`` and materialize all of its occurrences."""
+    with transaction.atomic():
+        series.save()
+        events = Event.objects.bulk_create(
+            [series.occurrence(day) for day in series.dates()]
+        )
+        bump_versions(team_ids=[series.team_id])
+    return events
+
+
+def sync_occurrences(series, now=None):
+    """Bring future occurrences in line with an edited ``series``.
+
+    Occurrences still on the rule take the series' title, venue, times,
+    capacity and price. Price only changes where nobody is booked, so
+    refunds always match what was paid. Dates newly on the rule are created,
+    and occurrences whose date was skipped or dropped are cancelled and
+    refunded. Raising capacity books players from the waitlist.
+    """
+    now = now or timezone.now()
+    change = SeriesChange()
+    with transaction.atomic():
+        events = list(
+            series.occurrences.select_for_update()
+            .filter(starts_at__gt=now)
+            .order_by("pk")
+        )
+        # Cancelled occurrences stay as a record of who was booked, so a date
+        # that is back on the rule gets a new occurrence.
+        by_date = {}
+        for event in events:
+            if not event.is_cancelled:
+                by_date.setdefault(timezone.localdate(event.starts_at), event)
+        wanted = set(series.dates())
+
+        dropped = []
+        raised = []
+        for day, event in by_date.items():
+            if day not in wanted:
+                dropped.append(event.pk)
+                continue
+            if series.max_participants > event.max_participants:
+                raised.append(event)
+            for name in series.OCCURRENCE_FIELDS:
+                if name == "price" and event.yes_count and event.price != series.price:
+                    change.price_kept += 1
+                    continue
+                setattr(event, name, getattr(series, name))
+            event.starts_at, event.ends_at = series.occurrence_times(day)
+            change.updated.append(event)
+        if change.updated:
+            Event.objects.bulk_update(
+                change.updated,
+                ["starts_at", "ends_at", *series.OCCURRENCE_FIELDS],
+            )
+
+        new = [
+            series.occurrence(day)
+            for day in sorted(wanted - set(by_date))
+            if series.occurrence_times(day)[0] > now
+        ]
+        change.created = Event.objects.bulk_create(new)
+
+        if dropped:
+            change.cancellation = booking.cancel_events(dropped)
+        for event in raised:
+            if event.waitlist_count:
+                booking.promote_waitlist(event)
+        bump_versions(
+            event_ids=[event.pk for event in change.updated],
+            team_ids=[series.team_id],
+        )
+    return change
+
+
+def cancel_future(series, now=None):
+    """Cancel every remaining occurrence of ``series`` and refund them."""
+    pks = list(future_occurrences(series, now).values_list("pk", flat=True))
+    return booking.cancel_events(pks)
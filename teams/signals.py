@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .cache import (
+    bump_versions,
+    forget_default_team,
+    forget_membership,
+    forget_site,
+    forget_wallet_balance,
+)
+from .models import Event, EventSignup, Team, TeamMembership, Venue, Wallet
+
+
+def deleted_with(origin, *models):
+    """Whether a cascading delete started from one of ``models``."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_delete, sender=EventSignup)
+def release_signup_count(sender, instance, origin=None, **kwargs):
+    # The event's counters go with it.
+    if deleted_with(origin, Event, Team):
+        return
+    event_id, status = getattr(instance, "_counted", (instance.event_id, instance.status))
+    if event_id and status:
+        Event.adjust_signup_counts(event_id, {status: -1})
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def bump_event_version(sender, instance, **kwargs):
+    bump_versions(event_ids=[instance.pk], team_ids=[instance.team_id])
+
+
+@receiver(post_save, sender=EventSignup)
+@receiver(post_delete, sender=EventSignup)
+def bump_signup_event_version(sender, instance, origin=None, **kwargs):
+    # Deleting an event bumps it once; deleting a member bumps every event
+    # they signed up for from bump_member_event_versions.
+    if deleted_with(origin, Event, Team, get_user_model()):
+        return
+    if EventSignup.event.is_cached(instance):
+        team_id = instance.event.team_id
+    else:
+        team_id = (
+            Event.objects.filter(pk=instance.event_id)
+            .values_list("team_id", flat=True)
+            .first()
+        )
+    bump_versions(
+        event_ids=[instance.event_id], team_ids=[team_id] if team_id else []
+    )
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def bump_member_event_versions(sender, instance, **kwargs):
+    events = list(
+        Event.objects.filter(signups__user=instance).values_list("pk", "team_id")
+    )
+    bump_versions(
+        event_ids=[pk for pk, _ in events],
+        team_ids={team_id for _, team_id in events},
+    )
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def bump_venue_event_versions(sender, instance, **kwargs):
+    events = list(Event.objects.filter(venue_id=instance.pk).values_list("pk", "team_id"))
+    bump_versions(
+        event_ids=[pk for pk, _ in events],
+        team_ids={team_id for _, team_id in events},
+    )
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def reset_default_team(sender, instance, **kwargs):
+    forget_default_team()
+
+
+@receiver(setting_changed)
+def reset_default_team_setting(sender, setting, **kwargs):
+    if setting == "TEAM_NAME":
+        forget_default_team()
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def reset_site(sender, instance, **kwargs):
+    forget_site(instance.domain)
+
+
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+def reset_membership(sender, instance, **kwargs):
+    forget_membership(instance.team_id, instance.user_id)
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def reset_wallet_balance(sender, instance, **kwargs):
+    forget_wallet_balance(instance.user_id)
@@ -0,0 +1,209 @@
+"""Work a worker does before it takes traffic, so its first request does not.
+
+Gunicorn runs :func:`warm_up` from ``gunicorn.conf.py``. With
+``GUNICORN_PRELOAD`` it runs once in the master, and the forked workers
+share the loaded modules and compiled templates.
+"""
+
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, ProgrammingError
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from .cache import resolve_site_id
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = Path(__file__).resolve().parent / "startup_baseline.json"
+
+# Run in a fresh interpreter under ``-X importtime``.
+PROBE = """
+import json, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from teams.startup import warm_up
+timings = warm_up()
+print(json.dumps(dict(timings, import_ms=(imported - started) * 1000)))
+"""
+
+_warmed = False
+
+
+def template_names():
+    """Every template shipped in the teams app, including allauth overrides."""
+    root = Path(apps.get_app_config("teams").path) / "templates"
+    paths = root.rglob("*.html")
+    return sorted(path.relative_to(root).as_posix() for path in paths)
+
+
+def warm_templates():
+    """Compile the app's templates into the cached template loader."""
+    names = template_names()
+    for name in names:
+        get_template(name)
+    return names
+
+
+def warm_up():
+    """Import the views, resolve the site and compile templates, once per process.
+
+    Returns the milliseconds each step took, or ``None`` if it already ran.
+    """
+    global _warmed
+    if _warmed:
+        return None
+    timings = {}
+    started = time.perf_counter()
+    get_resolver().url_patterns
+    timings["urls_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    try:
+        resolve_site_id()
+    except (OperationalError, ProgrammingError):
+        # A database that is down or not migrated yet must not stop the
+        # worker from booting; SiteMiddleware retries on each request.
+        logger.warning("Could not resolve the site during warm-up.", exc_info=True)
+    timings["site_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    names = warm_templates()
+    timings["templates_ms"] = (time.perf_counter() - started) * 1000
+
+    _warmed = True
+    logger.info(
+        "Warmed up: %s templates; %s",
+        len(names),
+        ", ".join(f"{name}={value:.1f}" for name, value in timings.items()),
+    )
+    return timings
+
+
+def profile_problems():
+    """Settings that make a production deployment slow or unsafe."""
+    problems = []
+    if settings.DEBUG:
+        problems.append("DEBUG is on, so every query is kept in connection.queries.")
+    if settings.SECRET_KEY.startswith("django-insecure-"):
+        problems.append("DJANGO_SECRET_KEY is not set.")
+    if set(settings.ALLOWED_HOSTS) <= {"localhost", "127.0.0.1"}:
+        problems.append("DJANGO_ALLOWED_HOSTS is not set.")
+    if settings.STRIPE_CLIENT == "stub":
+        problems.append(
+            "STRIPE_CLIENT is the stub, which marks every checkout paid."
+        )
+    for backend in engines.all():
+        engine = getattr(backend, "engine", None)
+        if engine is None:
+            continue
+        loaders = engine.template_loaders
+        if engine.debug or not all(isinstance(loader, CachedLoader) for loader in loaders):
+            problems.append(
+                f"Template engine {backend.name!r} is not using the cached "
+                "loader with debug off."
+            )
+    for alias, database in settings.DATABASES.items():
+        if database.get("CONN_MAX_AGE") and not database.get("CONN_HEALTH_CHECKS"):
+            problems.append(
+                f"Database {alias!r} keeps connections open without health checks."
+            )
+    for alias, cache in settings.CACHES.items():
+        if cache["BACKEND"].endswith("LocMemCache"):
+            problems.append(
+                f"Cache {alias!r} is per-process memory, so invalidations would "
+                "not reach the other workers."
+            )
+    return problems
+
+
+def validate_profile():
+    """Refuse to start a production profile that is misconfigured."""
+    if settings.DJANGO_PROFILE != "production":
+        return
+    problems = profile_problems()
+    if problems:
+        raise ImproperlyConfigured(
+            "The production profile is misconfigured: " + " ".join(problems)
+        )
+
+
+def parse_importtime(output):
+    """Module count and own import time in microseconds per top-level package.
+
+    ``output`` is the stderr of ``python -X importtime``. Each module's own
+    time is charged to its top-level package, so nested imports are not
+    counted twice.
+    """
+    modules = 0
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, _, name = line[len("import time:"):].split("|", 2)
+        if not own.strip().isdigit():
+            continue  # the header line
+        modules += 1
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    return modules, packages
+
+
+def measure_startup(module, runs=3):
+    """Start ``runs`` fresh interpreters that import ``module`` and warm up.
+
+    Returns the median of each timing and of each top-level package's import
+    time, in milliseconds, and the number of modules loaded.
+    """
+    samples = []
+    package_samples = {}
+    modules = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+            capture_output=True,
+            text=True,
+            env=os.environ.copy(),
+            check=True,
+        )
+        total_ms = (time.perf_counter() - started) * 1000
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(dict(timings, process_ms=total_ms))
+        modules, packages = parse_importtime(result.stderr)
+        for package, micros in packages.items():
+            package_samples.setdefault(package, []).append(micros / 1000)
+    report = {
+        name: round(statistics.median(sample[name] for sample in samples), 1)
+        for name in samples[0]
+    }
+    report["modules"] = modules
+    report["packages"] = {
+        package: round(statistics.median(values), 1)
+        for package, values in package_samples.items()
+    }
+    return report
+
+
+def startup_regressions(report, baseline, tolerance):
+    """More modules than ``baseline``, or an import slower by over ``tolerance``."""
+    failures = {}
+    if report["modules"] > baseline.get("modules", report["modules"]):
+        failures["modules"] = (report["modules"], baseline["modules"])
+    limit = baseline.get("import_ms")
+    if limit is not None and report["import_ms"] > limit * tolerance:
+        failures["import_ms"] = (report["import_ms"], limit)
+    return failures
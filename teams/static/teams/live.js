@@ -0,0 +1,84 @@
+// Keep seat counts on event cards current while the page is open.
+// Listens to the live feed over server-sent events, or long polls where
+// EventSource is missing, and edits the cards in place.
+(() => {
+    const feed = document.currentScript.dataset.feed;
+
+    const cardIds = () => [
+        ...new Set([...document.querySelectorAll("[data-event-card]")].map((node) => node.dataset.eventCard)),
+    ];
+
+    const setChoice = (button, status, label) => {
+        button.value = status;
+        button.classList.remove("status-yes", "status-waitlist");
+        button.classList.add(`status-${status}`);
+        button.textContent = label;
+    };
+
+    const apply = (state) => {
+        document.querySelectorAll(`[data-event-card="${state.event}"]`).forEach((card) => {
+            const spots = card.querySelector('[data-live="spots"]');
+            if (spots) {
+                spots.textContent = `${state.spots_taken}/${state.max_participants} spots`;
+            }
+            const action = card.querySelector(".event-action");
+            if (state.is_cancelled) {
+                const note = document.createElement("span");
+                note.className = "muted";
+                note.textContent = "Cancelled";
+                action.replaceChildren(note);
+                return;
+            }
+            // The booking button follows the capacity unless it is the
+            // member's current choice.
+            const bookable = card.querySelector(
+                '.status-buttons button[value="yes"]:not([disabled]), .status-buttons button[value="waitlist"]:not([disabled])'
+            );
+            if (bookable && state.is_full && bookable.value === "yes") {
+                setChoice(bookable, "waitlist", "Join waitlist");
+            } else if (bookable && !state.is_full && bookable.value === "waitlist") {
+                setChoice(bookable, "yes", "Book now");
+            }
+            const queued = card.querySelector('.status-buttons button[value="waitlist"][disabled]');
+            if (queued) {
+                queued.textContent = `#${state.waitlist_count} in waitlist`;
+            }
+        });
+    };
+
+    const query = (ids, cursor) => {
+        const params = new URLSearchParams({ events: ids.join(",") });
+        if (cursor) {
+            params.set("cursor", cursor);
+        }
+        return `${feed}?${params}`;
+    };
+
+    const longPoll = async (ids) => {
+        let cursor = "";
+        for (;;) {
+            try {
+                const response = await fetch(query(ids, cursor), {
+                    headers: { Accept: "application/json" },
+                });
+                const data = await response.json();
+                cursor = data.cursor;
+                data.changes.forEach(apply);
+            } catch (error) {
+                await new Promise((resolve) => setTimeout(resolve, 5000));
+            }
+        }
+    };
+
+    const ids = cardIds();
+    if (!feed || !ids.length) {
+        return;
+    }
+    if (window.EventSource) {
+        // EventSource reconnects by itself and resumes from the last id.
+        const source = new EventSource(query(ids));
+        source.addEventListener("capacity", (message) => apply(JSON.parse(message.data)));
+    } else {
+        longPoll(ids);
+    }
+})();
@@ -0,0 +1,73 @@
+// Submit RSVP buttons on event cards with fetch and swap in the updated card.
+// Without JavaScript the forms post normally and the page reloads.
+(() => {
+    const flash = (message, level) => {
+        if (!message) {
+            return;
+        }
+        let stack = document.querySelector(".flash-stack");
+        if (!stack) {
+            stack = document.createElement("div");
+            stack.className = "flash-stack";
+            document.querySelector("main").prepend(stack);
+        }
+        const item = document.createElement("div");
+        item.className = `flash ${level}`;
+        item.textContent = message;
+        stack.replaceChildren(item);
+    };
+
+    document.addEventListener("submit", async (event) => {
+        const form = event.target;
+        const card = form.closest("[data-event-card]");
+        if (!card || !form.classList.contains("status-form")) {
+            return;
+        }
+        event.preventDefault();
+        const body = new FormData(form);
+        if (event.submitter && event.submitter.name) {
+            body.append(event.submitter.name, event.submitter.value);
+        }
+        const buttons = [...form.querySelectorAll("button:not([disabled])")];
+        buttons.forEach((button) => {
+            button.disabled = true;
+        });
+
+        let response;
+        let data = {};
+        try {
+            response = await fetch(form.action, {
+                method: "POST",
+                body,
+                headers: { Accept: "application/json" },
+                credentials: "same-origin",
+            });
+            data = await response.json();
+        } catch (error) {
+            response = null;
+        }
+        if (data.redirect) {
+            window.location.assign(data.redirect);
+            return;
+        }
+        if (!response || !response.ok || !data.card) {
+            flash(data.message || "Something went wrong. Please try again.", "error");
+            buttons.forEach((button) => {
+                button.disabled = false;
+            });
+            return;
+        }
+
+        // The same event can be listed in both tabs.
+        document.querySelectorAll(`[data-event-card="${data.event}"]`).forEach((node) => {
+            node.outerHTML = data.card;
+        });
+        document.querySelectorAll("[data-wallet-balance]").forEach((node) => {
+            node.textContent = data.balance;
+        });
+        flash(data.message, data.level);
+        if (window.lucide) {
+            window.lucide.createIcons();
+        }
+    });
+})();
@@ -0,0 +1,81 @@
+"""Static files for the ASGI entry point, served ahead of Django.
+
+WhiteNoise's middleware is synchronous, so under ASGI every request would
+hop to a thread and back just to pass through it. This wrapper answers
+``STATIC_URL`` paths itself using WhiteNoise's file index and response
+headers, reads the file in chunks off the event loop, and hands every other
+request straight to the async Django handler.
+"""
+
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+CHUNK_SIZE = 64 * 1024
+
+
+def request_headers(scope):
+    """The request headers keyed the way WhiteNoise reads them from META."""
+    return {
+        "HTTP_" + key.decode("latin-1").upper().replace("-", "_"): value.decode(
+            "latin-1"
+        )
+        for key, value in scope["headers"]
+    }
+
+
+class StaticFilesApplication:
+    """ASGI wrapper serving WhiteNoise's files and passing the rest on."""
+
+    def __init__(self, application, whitenoise=None):
+        self.application = application
+        self.whitenoise = whitenoise or WhiteNoiseMiddleware()
+
+    async def __call__(self, scope, receive, send):
+        static_file = None
+        if scope["type"] == "http":
+            static_file = await self.find(self.path_info(scope))
+        if static_file is None:
+            await self.application(scope, receive, send)
+        else:
+            await self.serve(static_file, scope, send)
+
+    @staticmethod
+    def path_info(scope):
+        root_path = scope.get("root_path", "")
+        if root_path and scope["path"].startswith(root_path):
+            return scope["path"][len(root_path) :]
+        return scope["path"]
+
+    async def find(self, path):
+        if self.whitenoise.autorefresh:
+            return await sync_to_async(
+                self.whitenoise.find_file, thread_sensitive=False
+            )(path)
+        return self.whitenoise.files.get(path)
+
+    async def serve(self, static_file, scope, send):
+        response = await sync_to_async(
+            static_file.get_response, thread_sensitive=False
+        )(scope["method"], request_headers(scope))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(response.status),
+                "headers": [
+                    (key.lower().encode("latin-1"), value.encode("latin-1"))
+                    for key, value in response.headers
+                ],
+            }
+        )
+        if response.file is None:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while chunk := await read(CHUNK_SIZE):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+        finally:
+            await sync_to_async(response.file.close, thread_sensitive=False)()
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,167 @@
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+# Seconds a webhook signature stays valid, matching the SDK's default.
+WEBHOOK_TOLERANCE = 300
+
+
+class StripeError(Exception):
+    """A Stripe API call failed, timed out or was rejected."""
+
+
+class StripeUnavailable(StripeError):
+    """Stripe is not configured, or the SDK is not installed."""
+
+
+class SignatureError(StripeError):
+    """A webhook payload did not match its ``Stripe-Signature`` header."""
+
+
+class SDKClient:
+    """Stripe API access through the official SDK, with a bounded timeout.
+
+    The SDK is imported on first use so processes that never talk to Stripe do
+    not pay for the import.
+    """
+
+    def __init__(self, api_key, timeout):
+        try:
+            import stripe
+        except ImportError as exc:
+            raise StripeUnavailable("Stripe package is not installed on the server.") from exc
+        self.stripe = stripe
+        self.client = stripe.StripeClient(
+            api_key,
+            max_network_retries=0,
+            http_client=stripe.new_default_http_client(timeout=timeout),
+        )
+
+    def create_checkout_session(self, **params):
+        try:
+            return self.client.checkout.sessions.create(params=params)
+        except self.stripe.StripeError as exc:
+            raise StripeError(str(exc)) from exc
+
+    def retrieve_checkout_session(self, session_id):
+        try:
+            return self.client.checkout.sessions.retrieve(session_id)
+        except self.stripe.StripeError as exc:
+            raise StripeError(str(exc)) from exc
+
+
+class StubClient:
+    """In-memory stand-in for Stripe, for local development and tests.
+
+    Checkout sessions are marked paid as soon as they are created and the
+    success URL is returned as the checkout URL, so the wallet flow runs end
+    to end offline. ``latency`` simulates a slow API.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def add_session(self, **fields):
+        session = {
+            "id": f"cs_stub_{uuid.uuid4().hex}",
+            "object": "checkout.session",
+            "payment_status": "paid",
+            "payment_intent": f"pi_stub_{uuid.uuid4().hex}",
+            "metadata": {},
+        }
+        session.update(fields)
+        with self.lock:
+            self.sessions[session["id"]] = session
+        return session
+
+    def create_checkout_session(self, **params):
+        amount_total = sum(
+            item["price_data"]["unit_amount"] * item.get("quantity", 1)
+            for item in params.get("line_items", [])
+        )
+        session = self.add_session(
+            amount_total=amount_total,
+            client_reference_id=params.get("client_reference_id"),
+            metadata=params.get("metadata", {}),
+        )
+        session["url"] = params["success_url"].replace(
+            "{CHECKOUT_SESSION_ID}", session["id"]
+        )
+        return session
+
+    def retrieve_checkout_session(self, session_id):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise StripeError(f"No such checkout.session: '{session_id}'")
+        return session
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """Return the Stripe client selected by ``STRIPE_CLIENT``.
+
+    Raises :class:`StripeUnavailable` when the real client is selected but no
+    secret key is configured.
+    """
+    backend = settings.STRIPE_CLIENT
+    if backend == "stub":
+        key = ("stub",)
+    elif not settings.STRIPE_SECRET_KEY:
+        raise StripeUnavailable("Stripe is not configured yet.")
+    else:
+        key = ("stripe", settings.STRIPE_SECRET_KEY, settings.STRIPE_API_TIMEOUT)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if backend == "stub":
+                client = StubClient()
+            else:
+                client = SDKClient(settings.STRIPE_SECRET_KEY, settings.STRIPE_API_TIMEOUT)
+            _clients[key] = client
+    return client
+
+
+def verify_webhook(payload, signature, secret):
+    """Check a webhook body against its ``Stripe-Signature`` header.
+
+    Uses the SDK's verifier when it is installed, otherwise the same
+    HMAC-SHA256 scheme implemented here, so the stub works without the SDK.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    if settings.STRIPE_CLIENT != "stub":
+        try:
+            import stripe
+        except ImportError:
+            stripe = None
+        if stripe is not None:
+            try:
+                stripe.WebhookSignature.verify_header(
+                    payload, signature, secret, WEBHOOK_TOLERANCE
+                )
+            except stripe.SignatureVerificationError as exc:
+                raise SignatureError(str(exc)) from exc
+            return
+    try:
+        parts = dict(item.split("=", 1) for item in signature.split(","))
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError) as exc:
+        raise SignatureError("Malformed Stripe-Signature header.") from exc
+    if abs(time.time() - timestamp) > WEBHOOK_TOLERANCE:
+        raise SignatureError("Timestamp outside the tolerance zone.")
+    signed = f"{timestamp}.{payload}".encode()
+    expected = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, parts.get("v1", "")):
+        raise SignatureError("No signatures found matching the expected signature.")
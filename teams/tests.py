@@ -1,3 +1,1808 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import warnings
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib import admin, messages
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sites.models import Site
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    OperationalError,
+    connection,
+    connections,
+    transaction,
+)
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.http import HttpResponse
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    async_views,
+    booking,
+    exports,
+    ledger,
+    live,
+    payments,
+    routers,
+    series,
+    startup,
+    staticfiles,
+    stripe_client,
+    views,
+)
+from .benchmarking import (
+    load_baselines,
+    throwaway_database,
+    measure_template_renders,
+    measure_views,
+    plan_problems,
+    regressions,
+    seed_dataset,
+    sequential_scans,
+)
+from .cache import (
+    aget_default_team,
+    aget_membership_role,
+    aget_wallet_balance,
+    forget_default_team,
+    get_default_team,
+    get_membership_role,
+    get_version,
+    get_versions,
+    get_wallet_balance,
+    resolve_site_id,
+    wallet_balance_key,
+)
+from .middleware import RequestTimingMiddleware, timed_external
+from .management.commands.fake_stripe_events import (
+    checkout_completed_event,
+    signature_header,
+)
+from .pagination import MAX_PK, encode_cursor
+from .templating import TimedDjangoTemplates
+from .models import (
+    Event,
+    EventSeries,
+    EventSignup,
+    SignupRequest,
+    StripeEvent,
+    TeamMembership,
+    Venue,
+    Wallet,
+    WalletSnapshot,
+    WalletTransaction,
+)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class TeamsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        forget_default_team()
+        self.addCleanup(forget_default_team)
+        self.team = get_default_team()
+        self.user = get_user_model().objects.create_user(
+            username="player@example.com", email="player@example.com"
+        )
+
+    def create_event(self, **kwargs):
+        starts_at = timezone.now() + timedelta(days=3)
+        fields = {
+            "team": self.team,
+            "title": "Club night",
+            "starts_at": starts_at,
+            "ends_at": starts_at + timedelta(hours=2),
+            "max_participants": 100,
+            "created_by": self.user,
+        }
+        fields.update(kwargs)
+        return Event.objects.create(**fields)
+
+    def add_players(self, event, count, status=EventSignup.Status.YES):
+        User = get_user_model()
+        for index in range(count):
+            player = User.objects.create_user(
+                username=f"{event.pk}-{status}-{index}@example.com",
+                first_name=f"Player {index}",
+            )
+            EventSignup.objects.create(event=event, user=player, status=status)
+
+
+class EventDetailQueryCountTests(TeamsTestCase):
+    def assert_detail_queries(self, event, expected):
+        url = reverse("teams:event-detail", args=[event.pk])
+        self.client.force_login(self.user)
+        self.client.get(url)  # warm the membership and wallet caches
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_attendees(self):
+        # session, user, event, signups with their users
+        small = self.create_event()
+        self.add_players(small, 2)
+        large = self.create_event()
+        self.add_players(large, 30)
+        self.add_players(large, 10, status=EventSignup.Status.WAITLIST)
+        self.add_players(large, 10, status=EventSignup.Status.MAYBE)
+
+        self.assert_detail_queries(small, 4)
+        response = self.assert_detail_queries(large, 4)
+        self.assertEqual(len(response.context["signups_yes"]), 30)
+        self.assertEqual(len(response.context["signups_waitlist"]), 10)
+        self.assertEqual(len(response.context["signups_maybe"]), 10)
+        self.assertEqual(response.context["signups_no"], [])
+
+    def test_partitions_in_signup_order_and_reports_my_status(self):
+        event = self.create_event()
+        self.add_players(event, 3, status=EventSignup.Status.WAITLIST)
+        EventSignup.objects.create(
+            event=event, user=self.user, status=EventSignup.Status.WAITLIST
+        )
+        response = self.assert_detail_queries(event, 4)
+        waitlist = response.context["signups_waitlist"]
+        self.assertEqual(
+            [signup.created_at for signup in waitlist],
+            sorted(signup.created_at for signup in waitlist),
+        )
+        self.assertEqual(waitlist[-1].user, self.user)
+        self.assertEqual(response.context["my_status"], EventSignup.Status.WAITLIST)
+
+
+class ViewBenchmarkTests(TeamsTestCase):
+    def test_query_counts_stay_within_baselines(self):
+        dataset = seed_dataset(users=60, events=20, signups=400, transactions=200)
+        results = measure_views(dataset, requests=3)
+        baselines = load_baselines()
+        self.assertEqual(set(results), set(baselines))
+        self.assertEqual(regressions(results, baselines), {})
+
+    def test_view_queries_do_not_scan_large_tables(self):
+        dataset = seed_dataset(users=300, events=40, signups=2000, transactions=1000)
+        self.assertEqual(plan_problems(dataset, min_rows=200), {})
+
+    def test_template_benchmark_renders_each_page_under_both_profiles(self):
+        dataset = seed_dataset(users=20, events=6, signups=60, transactions=20)
+        results = measure_template_renders(dataset, renders=2)
+        self.assertEqual(
+            set(results), {"teams/team_detail.html", "teams/event_detail.html"}
+        )
+        for result in results.values():
+            self.assertGreater(result["production"]["p50_ms"], 0)
+            self.assertIn("speedup", result)
+
+    def test_throwaway_database_refuses_a_remote_server(self):
+        database = connections[DEFAULT_DB_ALIAS]
+        with mock.patch.object(database, "vendor", "postgresql"), mock.patch.dict(
+            database.settings_dict, {"HOST": "db.example.com"}
+        ):
+            with self.assertRaisesMessage(CommandError, "db.example.com"):
+                with throwaway_database():
+                    pass
+
+    def test_plan_check_refuses_an_unsupported_backend(self):
+        database = connections[DEFAULT_DB_ALIAS]
+        with mock.patch.object(database, "vendor", "oracle"):
+            with self.assertRaisesMessage(CommandError, "oracle backend"):
+                sequential_scans("SELECT 1")
+
+
+class MemberCacheTests(TeamsTestCase):
+    def test_default_team_is_looked_up_once_per_process(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(get_default_team(), self.team)
+            self.assertEqual(async_to_sync(aget_default_team)(), self.team)
+
+    def test_saving_or_deleting_a_team_clears_the_default_team(self):
+        self.team.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_default_team(), self.team)
+
+        self.team.delete()
+        team = get_default_team()
+        self.assertNotEqual(team.pk, self.team.pk)
+        self.assertEqual(team.name, settings.TEAM_NAME)
+
+    def test_membership_role_is_cached_until_the_membership_changes(self):
+        self.assertFalse(TeamMembership.objects.filter(user=self.user).exists())
+        self.assertEqual(get_membership_role(self.team, self.user), "member")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_membership_role(self.team, self.user), "member")
+            self.assertEqual(
+                async_to_sync(aget_membership_role)(self.team, self.user), "member"
+            )
+
+        membership = TeamMembership.objects.get(team=self.team, user=self.user)
+        membership.role = TeamMembership.Role.ADMIN
+        membership.save()
+        self.assertEqual(get_membership_role(self.team, self.user), "admin")
+
+        membership.delete()
+        self.assertEqual(get_membership_role(self.team, self.user), "member")
+        self.assertTrue(TeamMembership.objects.filter(user=self.user).exists())
+
+    def test_wallet_balance_is_cached_and_forgotten_on_commit(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_wallet_balance(self.user.pk), Decimal("0"))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_wallet_balance(self.user.pk), Decimal("0"))
+
+        wallet = Wallet.objects.create(user=self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ledger.post(wallet, Decimal("12.50"), WalletTransaction.Kind.TOPUP)
+        # Until the transaction commits, readers keep the committed balance.
+        self.assertEqual(get_wallet_balance(self.user.pk), Decimal("0"))
+        stale_version = get_version("wallet", self.user.pk)
+        for callback in callbacks:
+            callback()
+        # A reader that loaded the old balance before the commit and caches
+        # it afterwards writes under the replaced version.
+        cache.set(wallet_balance_key(self.user.pk, stale_version), Decimal("0"))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_wallet_balance(self.user.pk), Decimal("12.50"))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                async_to_sync(aget_wallet_balance)(self.user.pk), Decimal("12.50")
+            )
+
+
+class SignupQueueTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(max_participants=2)
+        User = get_user_model()
+        self.players = [
+            User.objects.create_user(username=f"queued-{index}@example.com")
+            for index in range(3)
+        ]
+
+    def test_requests_are_applied_in_arrival_order(self):
+        first, second, third = self.players
+        requests = [
+            booking.enqueue_signup(self.event, player.pk, EventSignup.Status.YES)
+            for player in self.players
+        ]
+        requests.append(
+            booking.enqueue_signup(self.event, first.pk, EventSignup.Status.NO)
+        )
+        self.assertEqual(booking.drain_signup_requests(self.event.pk), 4)
+
+        for request in requests:
+            request.refresh_from_db()
+        self.assertEqual(
+            [request.state for request in requests], [SignupRequest.State.DONE] * 4
+        )
+        self.assertEqual(
+            [request.result_status for request in requests],
+            ["yes", "yes", "waitlist", "no"],
+        )
+        self.assertEqual(requests[0].message, "You're booked in!")
+        self.assertEqual(
+            requests[2].message, "Event is full. You've been added to the waitlist."
+        )
+        self.assertIsNotNone(requests[3].processed_at)
+
+        # The third player took the spot the first one gave up.
+        self.assertEqual(
+            EventSignup.objects.get(event=self.event, user=third).status, "yes"
+        )
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.yes_count, self.event.waitlist_count), (2, 0))
+
+    def test_each_drain_takes_one_batch_of_pending_requests(self):
+        requests = [
+            booking.enqueue_signup(self.event, player.pk, EventSignup.Status.MAYBE)
+            for player in self.players
+        ]
+        self.assertEqual(booking.drain_signup_requests(self.event.pk, batch_size=2), 2)
+        self.assertEqual(
+            list(
+                SignupRequest.objects.filter(state=SignupRequest.State.PENDING)
+                .values_list("pk", flat=True)
+            ),
+            [requests[2].pk],
+        )
+        self.assertEqual(booking.events_with_pending_requests(), [self.event.pk])
+        self.assertEqual(booking.drain_signup_requests(self.event.pk, batch_size=2), 1)
+        self.assertEqual(booking.drain_signup_requests(self.event.pk), 0)
+        self.assertEqual(booking.events_with_pending_requests(), [])
+
+
+class WaitlistPromotionTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(max_participants=1, price=Decimal("5.00"))
+        EventSignup.objects.create(event=self.event, user=self.user)
+        self.waitlist = []
+        for name, balance in (("short", "2.00"), ("first", "10.00"), ("second", "5.00")):
+            player = get_user_model().objects.create_user(username=f"{name}@example.com")
+            wallet = Wallet.objects.create(user=player)
+            ledger.post(wallet, Decimal(balance), WalletTransaction.Kind.TOPUP)
+            EventSignup.objects.create(
+                event=self.event, user=player, status=EventSignup.Status.WAITLIST
+            )
+            self.waitlist.append(player)
+
+    def raise_capacity(self, max_participants):
+        self.event.max_participants = max_participants
+        self.event.save()
+
+    def test_paid_promotion_skips_short_wallets_and_debits_each_player_once(self):
+        short, first, second = self.waitlist
+        self.raise_capacity(4)
+        with CaptureQueriesContext(connection) as queries:
+            promoted = booking.fill_free_spots(self.event.pk)
+        self.assertEqual([signup.user_id for signup in promoted], [first.pk, second.pk])
+        wallet_updates = [
+            query for query in queries if query["sql"].startswith('UPDATE "teams_wallet"')
+        ]
+        self.assertEqual(len(wallet_updates), 1)
+
+        debits = WalletTransaction.objects.filter(
+            event=self.event, kind=WalletTransaction.Kind.EVENT_DEBIT
+        )
+        self.assertEqual(
+            sorted(debits.values_list("wallet__user_id", "amount")),
+            [(first.pk, Decimal("-5.00")), (second.pk, Decimal("-5.00"))],
+        )
+        self.assertEqual(
+            dict(Wallet.objects.values_list("user_id", "balance").exclude(user=self.user)),
+            {short.pk: Decimal("2.00"), first.pk: Decimal("5.00"), second.pk: 0},
+        )
+        self.assertEqual(
+            EventSignup.objects.get(event=self.event, user=short).status, "waitlist"
+        )
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.yes_count, self.event.waitlist_count), (3, 1))
+
+        # Nothing left that can pay, so a second pass changes nothing.
+        self.assertEqual(booking.fill_free_spots(self.event.pk), [])
+
+    def test_promotion_stops_at_the_free_spots(self):
+        self.raise_capacity(2)
+        promoted = booking.fill_free_spots(self.event.pk)
+        self.assertEqual([signup.user_id for signup in promoted], [self.waitlist[1].pk])
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.yes_count, self.event.waitlist_count), (2, 2))
+
+    def test_a_cancelled_event_promotes_nobody(self):
+        booking.cancel_events([self.event.pk])
+        self.event.refresh_from_db()
+        self.raise_capacity(4)
+        self.assertEqual(booking.fill_free_spots(self.event.pk), [])
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.yes_count, self.event.waitlist_count), (1, 3))
+        self.assertFalse(
+            WalletTransaction.objects.filter(
+                kind=WalletTransaction.Kind.EVENT_DEBIT
+            ).exists()
+        )
+
+    def test_raising_capacity_in_the_admin_promotes_the_waitlist(self):
+        model_admin = admin.site._registry[Event]
+        request = RequestFactory().post("/")
+        request.user = self.user
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+
+        class Form:
+            changed_data = ["title"]
+
+        self.event.title = "Renamed"
+        model_admin.save_model(request, self.event, Form(), change=True)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.yes_count, 1)
+
+        Form.changed_data = ["max_participants"]
+        self.event.max_participants = 3
+        model_admin.save_model(request, self.event, Form(), change=True)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.yes_count, 3)
+        self.assertEqual(
+            [message.message for message in messages.get_messages(request)],
+            ["Promoted 2 player(s) from the waitlist."],
+        )
+
+
+class SignupCounterTests(TeamsTestCase):
+    def counts(self, event):
+        event.refresh_from_db()
+        return {field: getattr(event, field) for field in Event.COUNTER_FIELDS}
+
+    def test_counters_follow_signup_create_change_and_delete(self):
+        event = self.create_event()
+        other = self.create_event()
+        signup = EventSignup.objects.create(event=event, user=self.user)
+        self.assertEqual(self.counts(event)["yes_count"], 1)
+
+        signup.status = EventSignup.Status.MAYBE
+        signup.save()
+        self.assertEqual(
+            self.counts(event),
+            {"yes_count": 0, "waitlist_count": 0, "maybe_count": 1, "no_count": 0},
+        )
+
+        signup.event = other
+        signup.save()
+        self.assertEqual(self.counts(event)["maybe_count"], 0)
+        self.assertEqual(self.counts(other)["maybe_count"], 1)
+
+        # Saving without a change leaves the counters alone.
+        signup.save()
+        self.assertEqual(self.counts(other)["maybe_count"], 1)
+
+        signup.delete()
+        self.assertEqual(self.counts(other)["maybe_count"], 0)
+
+        self.add_players(event, 2, EventSignup.Status.NO)
+        EventSignup.objects.filter(event=event).delete()
+        self.assertEqual(self.counts(event)["no_count"], 0)
+
+    def test_cascades_skip_per_signup_work(self):
+        event = self.create_event()
+        self.add_players(event, 3)
+        with CaptureQueriesContext(connection) as queries:
+            event.delete()
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith('UPDATE "teams_event"')]
+        )
+
+        event = self.create_event()
+        other = self.create_event()
+        player = get_user_model().objects.create_user(username="leaver@example.com")
+        for booked in (event, other):
+            EventSignup.objects.create(event=booked, user=player)
+        versions = get_versions("event", [event.pk, other.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                player.delete()
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith('SELECT "teams_event"."team_id"')]
+        )
+        self.assertEqual(self.counts(event)["yes_count"], 0)
+        self.assertEqual(self.counts(other)["yes_count"], 0)
+        new_versions = get_versions("event", [event.pk, other.pk])
+        self.assertNotEqual(new_versions[event.pk], versions[event.pk])
+        self.assertNotEqual(new_versions[other.pk], versions[other.pk])
+
+    def test_adjustments_stop_at_zero_on_drifted_counters(self):
+        event = self.create_event()
+        signup = EventSignup.objects.create(
+            event=event, user=self.user, status=EventSignup.Status.NO
+        )
+        Event.objects.filter(pk=event.pk).update(no_count=0)
+        signup.delete()
+        self.assertEqual(self.counts(event)["no_count"], 0)
+
+        Event.adjust_signup_counts(event, {EventSignup.Status.YES: -2})
+        self.assertEqual(event.yes_count, 0)
+        self.assertEqual(self.counts(event)["yes_count"], 0)
+
+    def test_reconcile_reports_and_repairs_drift(self):
+        event = self.create_event()
+        self.add_players(event, 2)
+        Event.objects.filter(pk=event.pk).update(yes_count=5, maybe_count=1)
+
+        out = StringIO()
+        call_command("reconcile_signup_counts", stdout=out)
+        self.assertIn(f"Event {event.pk}: yes_count stored=5 actual=2", out.getvalue())
+        self.assertEqual(self.counts(event)["yes_count"], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reconcile_signup_counts", fix=True, stdout=StringIO())
+        self.assertEqual(
+            self.counts(event),
+            {"yes_count": 2, "waitlist_count": 0, "maybe_count": 0, "no_count": 0},
+        )
+        out = StringIO()
+        call_command("reconcile_signup_counts", stdout=out)
+        self.assertIn("All signup counters match.", out.getvalue())
+
+
+@override_settings(EVENT_PAGE_SIZE=2)
+class KeysetPaginationTests(TeamsTestCase):
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([event.pk for event in response.context["events"]])
+            next_url = response.context.get("events_next_url") or response.context.get(
+                "next_url"
+            )
+            url = next_url and reverse(response.resolver_match.view_name) + next_url
+        return pages
+
+    def test_home_pages_cover_tied_start_times_once_in_order(self):
+        starts_at = timezone.now() + timedelta(days=3)
+        events = [
+            self.create_event(starts_at=starts_at + timedelta(hours=offset))
+            for offset in (0, 0, -1, 0, 1)
+        ]
+        expected = [
+            event.pk for event in sorted(events, key=lambda e: (e.starts_at, e.pk))
+        ]
+        pages = self.walk(reverse("teams:home"))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        # A last page that is exactly full has no next link.
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.get(pk=expected[-1]).delete()
+        self.assertEqual(self.walk(reverse("teams:home")), [expected[:2], expected[2:4]])
+
+    def test_archive_pages_backwards_across_tied_start_times(self):
+        starts_at = timezone.now() - timedelta(days=10)
+        events = [
+            self.create_event(
+                starts_at=starts_at + timedelta(hours=offset),
+                ends_at=starts_at + timedelta(hours=offset + 2),
+            )
+            for offset in (0, 0, 1, 0)
+        ]
+        self.create_event()  # upcoming, so not archived
+        expected = [
+            event.pk
+            for event in sorted(events, key=lambda e: (e.starts_at, e.pk), reverse=True)
+        ]
+        pages = self.walk(reverse("teams:event-archive"))
+        self.assertEqual(pages, [expected[:2], expected[2:]])
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        starts_at = timezone.now() + timedelta(days=3)
+        for offset in range(3):
+            self.create_event(starts_at=starts_at + timedelta(hours=offset))
+        first_page = self.walk(reverse("teams:home"))[0]
+        cursors = [
+            "not a cursor",
+            "%%%",
+            encode_cursor(starts_at, MAX_PK + 1),
+            encode_cursor(starts_at, 0),
+            encode_cursor(datetime(2030, 1, 1), 1),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), warnings.catch_warnings():
+                warnings.simplefilter("error", RuntimeWarning)
+                response = self.client.get(reverse("teams:home"), {"cursor": cursor})
+                self.assertEqual(
+                    [event.pk for event in response.context["events"]], first_page
+                )
+                response = self.client.get(
+                    reverse("teams:event-archive"), {"cursor": cursor}
+                )
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(EVENT_PAGE_SIZE=2)
+class HomeOverlayTests(TeamsTestCase):
+    def test_member_state_comes_from_one_query_over_their_signups(self):
+        events = [
+            self.create_event(starts_at=timezone.now() + timedelta(days=day))
+            for day in range(1, 6)
+        ]
+        for event in events[1], events[3], events[4]:
+            EventSignup.objects.create(event=event, user=self.user)
+        EventSignup.objects.create(
+            event=events[0], user=self.user, status=EventSignup.Status.MAYBE
+        )
+        url = reverse("teams:home")
+        self.client.force_login(self.user)
+        self.client.get(url)  # warm the membership and wallet caches
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse(any("U0" in query["sql"] for query in queries))
+        self.assertEqual(
+            [event.my_status for event in response.context["events"]],
+            ["maybe", "yes"],
+        )
+        my_events = response.context["my_events"]
+        self.assertEqual(
+            [event.pk for event in my_events], [events[1].pk, events[3].pk]
+        )
+        self.assertEqual({event.my_status for event in my_events}, {"yes"})
+
+        next_url = response.context["my_events_next_url"].split("#")[0]
+        response = self.client.get(url + next_url)
+        self.assertEqual(
+            [event.pk for event in response.context["my_events"]], [events[4].pk]
+        )
+        self.assertIsNone(response.context["my_events_next_url"])
+
+
+@override_settings(
+    REQUEST_TIMING_ENABLED=True,
+    REQUEST_TIMING_SAMPLE_RATE=1.0,
+    REQUEST_TIMING_SLOW_QUERIES=2,
+    REQUEST_TIMING_HEADER=True,
+)
+class RequestTimingTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        engine = TimedDjangoTemplates(
+            {"NAME": "timed", "DIRS": [], "APP_DIRS": False, "OPTIONS": {}}
+        )
+        self.template = engine.from_string("{% for item in items %}{{ item }}{% endfor %}")
+
+    def view(self, request):
+        for _ in range(3):
+            list(Event.objects.all())
+        with timed_external("stripe"):
+            sleep(0.005)
+        return HttpResponse(self.template.render({"items": range(20000)}))
+
+    def timing_log(self, logs):
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage())
+
+    def test_sampled_requests_get_a_header_and_one_log_line(self):
+        middleware = RequestTimingMiddleware(self.view)
+        with self.assertLogs("teams.timing", "INFO") as logs:
+            response = middleware(RequestFactory().get("/events/"))
+
+        header = dict(
+            metric.split(";", 1) for metric in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(set(header), {"db", "tpl", "stripe", "total"})
+        self.assertIn('desc="3 queries"', header["db"])
+
+        line = self.timing_log(logs)
+        self.assertEqual((line["method"], line["path"]), ("GET", "/events/"))
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["db_queries"], 3)
+        self.assertEqual(len(line["slow_queries"]), 2)
+        self.assertIn("teams_event", line["slow_queries"][0]["sql"])
+        self.assertGreater(line["template_ms"], 0)
+        self.assertGreaterEqual(line["external_ms"]["stripe"], 5)
+        self.assertGreaterEqual(line["total_ms"], line["external_ms"]["stripe"])
+
+    def test_async_requests_are_timed_the_same_way(self):
+        async def view(request):
+            return await sync_to_async(self.view)(request)
+
+        middleware = RequestTimingMiddleware(view)
+        with self.assertLogs("teams.timing", "INFO") as logs:
+            response = async_to_sync(middleware)(RequestFactory().get("/"))
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+        self.assertEqual(self.timing_log(logs)["db_queries"], 3)
+
+    def test_unsampled_and_disabled_requests_are_left_alone(self):
+        with override_settings(REQUEST_TIMING_SAMPLE_RATE=0):
+            with self.assertNoLogs("teams.timing"):
+                response = RequestTimingMiddleware(self.view)(RequestFactory().get("/"))
+        self.assertNotIn("Server-Timing", response)
+
+        with override_settings(REQUEST_TIMING_HEADER=False):
+            with self.assertLogs("teams.timing", "INFO"):
+                response = RequestTimingMiddleware(self.view)(RequestFactory().get("/"))
+        self.assertNotIn("Server-Timing", response)
+
+        with override_settings(REQUEST_TIMING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                RequestTimingMiddleware(self.view)
+
+
+class AnonymousPageCacheTests(TeamsTestCase):
+    def test_home_page_is_served_from_cache_until_an_event_changes(self):
+        event = self.create_event(title="Tuesday social")
+        url = reverse("teams:home")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Tuesday social")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.title = "Thursday social"
+            event.save()
+        response = self.client.get(url)
+        self.assertContains(response, "Thursday social")
+        self.assertNotContains(response, "Tuesday social")
+
+    def test_card_fragment_refreshes_when_signups_change(self):
+        event = self.create_event(max_participants=8)
+        url = reverse("teams:home")
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(url), "0/8 spots")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_players(event, 2)
+        self.assertContains(self.client.get(url), "2/8 spots")
+
+    def test_card_fragment_ignores_a_signup_between_query_and_render(self):
+        event = self.create_event(max_participants=8)
+        url = reverse("teams:home")
+        self.client.force_login(self.user)
+        attach = views.attach_card_versions
+
+        def signup_then_attach(*event_lists):
+            # Commits after the event query and before the version read.
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add_players(event, 1)
+            attach(*event_lists)
+
+        with mock.patch.object(views, "attach_card_versions", signup_then_attach):
+            self.assertContains(self.client.get(url), "0/8 spots")
+        self.assertContains(self.client.get(url), "1/8 spots")
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookInboxTests(TeamsTestCase):
+    def deliver(self, payload):
+        return self.client.post(
+            reverse("teams:stripe-webhook"),
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature_header(payload, "whsec_test"),
+        )
+
+    def test_deliveries_are_stored_then_applied_once(self):
+        payload = json.dumps(checkout_completed_event(self.user.pk, 1250))
+        self.assertEqual(self.deliver(payload).status_code, 200)
+        self.assertEqual(self.deliver(payload).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertFalse(WalletTransaction.objects.exists())
+
+        self.assertEqual(payments.drain_stripe_events(), 1)
+        self.assertEqual(payments.drain_stripe_events(), 0)
+        wallet = Wallet.objects.get(user=self.user)
+        self.assertEqual(wallet.balance, Decimal("12.50"))
+        self.assertEqual(
+            StripeEvent.objects.get().state, StripeEvent.State.PROCESSED
+        )
+
+    def test_a_second_event_for_the_same_session_is_not_credited_again(self):
+        event = checkout_completed_event(self.user.pk, 500)
+        replay = dict(event, id="evt_test_replay")
+        self.deliver(json.dumps(event))
+        self.deliver(json.dumps(replay))
+        self.assertEqual(payments.drain_stripe_events(), 2)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("5.00"))
+
+    def test_failed_events_back_off_then_give_up(self):
+        self.deliver(json.dumps(checkout_completed_event(self.user.pk, 500)))
+        failure = mock.patch.object(
+            payments, "apply_stripe_events", side_effect=RuntimeError("boom")
+        )
+        with failure, self.assertLogs("teams.payments", "ERROR"):
+            self.assertEqual(payments.drain_stripe_events(), 1)
+        record = StripeEvent.objects.get()
+        self.assertEqual((record.state, record.attempts), (StripeEvent.State.FAILED, 1))
+        self.assertIn("boom", record.last_error)
+        self.assertEqual(payments.drain_stripe_events(), 0)
+
+        def rewind(attempts):
+            StripeEvent.objects.update(
+                attempts=attempts,
+                processed_at=timezone.now() - payments.retry_delay(attempts),
+            )
+
+        rewind(payments.MAX_ATTEMPTS - 1)
+        with failure, self.assertLogs("teams.payments", "ERROR") as logs:
+            self.assertEqual(payments.drain_stripe_events(), 1)
+        self.assertIn("will not be retried", logs.output[-1])
+        StripeEvent.objects.update(processed_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(payments.drain_stripe_events(), 0)
+
+        rewind(1)
+        self.assertEqual(payments.drain_stripe_events(), 1)
+        self.assertEqual(StripeEvent.objects.get().state, StripeEvent.State.PROCESSED)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("5.00"))
+
+    def test_rejects_bad_signatures(self):
+        payload = json.dumps(checkout_completed_event(self.user.pk, 500))
+        response = self.client.post(
+            reverse("teams:stripe-webhook"),
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature_header(payload, "whsec_other"),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+@override_settings(
+    STRIPE_CLIENT="stub",
+    STRIPE_WEBHOOK_SECRET="whsec_test",
+    STRIPE_SESSION_CHECK_ASYNC=False,
+)
+class WalletReturnTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.stub = stripe_client.get_client()
+
+    def return_from_checkout(self, session_id):
+        return self.client.get(reverse("teams:wallet"), {"session_id": session_id})
+
+    def test_credits_from_the_ingested_webhook_without_calling_stripe(self):
+        event = checkout_completed_event(self.user.pk, 2000)
+        payload = json.dumps(event)
+        self.client.post(
+            reverse("teams:stripe-webhook"),
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature_header(payload, "whsec_test"),
+        )
+        # The stub has never seen this session, so a lookup would fail.
+        response = self.return_from_checkout(event["data"]["object"]["id"])
+        self.assertRedirects(response, reverse("teams:home"))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("20.00"))
+        self.assertEqual(StripeEvent.objects.get().state, StripeEvent.State.PROCESSED)
+
+    def test_a_concurrent_credit_of_the_same_session_is_not_an_error(self):
+        event = checkout_completed_event(self.user.pk, 2000)
+        payments.record_stripe_event(json.dumps(event))
+        session_id = event["data"]["object"]["id"]
+
+        def credited_meanwhile(session_id):
+            # The background check commits its ledger row first.
+            with transaction.atomic():
+                payments.credit_topups(
+                    [payments.TopUp(self.user.pk, session_id, Decimal("20.00"))]
+                )
+            raise IntegrityError("duplicate key value violates unique constraint")
+
+        with mock.patch.object(
+            payments, "credit_from_inbox", side_effect=credited_meanwhile
+        ):
+            response = self.return_from_checkout(session_id)
+        self.assertRedirects(response, reverse("teams:home"))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("20.00"))
+
+        # The worker later marks the inbox event done without a second credit.
+        self.assertEqual(payments.drain_stripe_events(), 1)
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_a_session_check_racing_another_credit_reports_it_credited(self):
+        session = self.stub.add_session(
+            amount_total=750, client_reference_id=str(self.user.pk)
+        )
+        with transaction.atomic():
+            payments.credit_topups(
+                [payments.TopUp(self.user.pk, session["id"], Decimal("7.50"))]
+            )
+        with mock.patch.object(
+            payments,
+            "credit_topups",
+            side_effect=IntegrityError("duplicate key value violates unique constraint"),
+        ):
+            result = payments.check_session(session["id"])
+        self.assertEqual(result["state"], payments.SessionCheck.CREDITED)
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_falls_back_to_retrieving_the_session(self):
+        session = self.stub.add_session(
+            amount_total=750, client_reference_id=str(self.user.pk)
+        )
+        response = self.return_from_checkout(session["id"])
+        self.assertRedirects(response, reverse("teams:home"))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("7.50"))
+        self.return_from_checkout(session["id"])
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_shows_pending_while_the_lookup_runs(self):
+        session = self.stub.add_session(
+            amount_total=750, client_reference_id=str(self.user.pk)
+        )
+        cache.set(payments.session_check_key(session["id"]), {"state": "pending"})
+        response = self.return_from_checkout(session["id"])
+        self.assertTemplateUsed(response, "teams/wallet_pending.html")
+        self.assertFalse(WalletTransaction.objects.exists())
+
+    def test_rejects_another_members_session(self):
+        other = get_user_model().objects.create_user(username="other@example.com")
+        session = self.stub.add_session(
+            amount_total=750, client_reference_id=str(other.pk)
+        )
+        response = self.return_from_checkout(session["id"])
+        self.assertRedirects(response, reverse("teams:wallet"))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal("0.00"))
+
+
+class SignupFragmentTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(max_participants=1, price=Decimal("4.00"))
+        self.url = reverse("teams:event-signup", args=[self.event.pk])
+        self.client.force_login(self.user)
+
+    def post(self, status, **headers):
+        return self.client.post(self.url, {"status": status}, **headers)
+
+    def test_json_rsvp_returns_the_updated_card_without_a_page_render(self):
+        wallet = booking.get_wallets([self.user.pk])[self.user.pk]
+        with transaction.atomic():
+            ledger.post(wallet, Decimal("10.00"), WalletTransaction.Kind.TOPUP)
+
+        with self.assertTemplateNotUsed("teams/team_detail.html"):
+            response = self.post("yes", HTTP_ACCEPT="application/json")
+        data = response.json()
+        self.assertEqual(data["status"], "yes")
+        self.assertEqual(data["level"], "success")
+        self.assertEqual(data["balance"], "6.00")
+        self.assertIn(f'data-event-card="{self.event.pk}"', data["card"])
+        self.assertIn("1/1 spots", data["card"])
+        self.assertIn("Refund &amp; cancel", data["card"])
+
+        response = self.post("no")
+        self.assertRedirects(response, reverse("teams:home"))
+
+    def test_json_errors_and_queued_events(self):
+        data = self.post("yes", HTTP_ACCEPT="application/json").json()
+        self.assertIsNone(data["status"])
+        self.assertEqual(data["level"], "error")
+        self.assertIn("Book now", data["card"])
+
+        response = self.post("bogus", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        Event.objects.filter(pk=self.event.pk).update(queued_booking=True)
+        response = self.post("maybe", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()["redirect"].startswith("/signup-requests/"))
+
+
+class ConditionalGetTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event()
+        self.detail = reverse("teams:event-detail", args=[self.event.pk])
+        self.client.force_login(self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_answer_304_before_the_page_queries(self):
+        for url in (reverse("teams:home"), self.detail):
+            etag = self.client.get(url)["ETag"]
+            # Only the session and user lookups run.
+            with self.assertNumQueries(2):
+                response = self.revalidate(url, etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_and_other_members_get_a_fresh_page(self):
+        etag = self.client.get(self.detail)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("teams:event-signup", args=[self.event.pk]),
+                {"status": EventSignup.Status.MAYBE},
+            )
+        # Consume the RSVP's flash message.
+        self.client.get(self.detail)
+        response = self.revalidate(self.detail, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["my_status"], EventSignup.Status.MAYBE)
+
+        etag = response["ETag"]
+        wallet = booking.get_wallets([self.user.pk])[self.user.pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ledger.post(wallet, Decimal("5.00"), WalletTransaction.Kind.TOPUP)
+        self.assertEqual(self.revalidate(self.detail, etag).status_code, 200)
+
+        etag = self.client.get(self.detail)["ETag"]
+        other = get_user_model().objects.create_user(
+            username="other@example.com", email="other@example.com"
+        )
+        self.client.force_login(other)
+        self.assertEqual(self.revalidate(self.detail, etag).status_code, 200)
+
+
+class AsyncViewTests(TeamsTestCase):
+    def render(self, view_class, path, user, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = user
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        view = view_class.as_view()
+        if view_class.view_is_async:
+            response = async_to_sync(view)(request, **kwargs)
+        else:
+            response = view(request, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        self.assertEqual(response.status_code, 200)
+        return re.sub(r'value="[^"]+"', "", response.content.decode())
+
+    def test_async_views_render_the_same_pages(self):
+        event = self.create_event(title="Doubles ladder")
+        self.add_players(event, 3)
+        EventSignup.objects.create(
+            event=event, user=self.user, status=EventSignup.Status.MAYBE
+        )
+        detail = reverse("teams:event-detail", args=[event.pk])
+        for user in (AnonymousUser(), self.user):
+            with self.subTest(user=user):
+                cache.clear()
+                self.assertHTMLEqual(
+                    self.render(async_views.HomeView, "/", user),
+                    self.render(views.HomeView, "/", user),
+                )
+                self.assertHTMLEqual(
+                    self.render(
+                        async_views.EventDetailView, detail, user, event_id=event.pk
+                    ),
+                    self.render(views.EventDetailView, detail, user, event_id=event.pk),
+                )
+
+
+    @override_settings(DEBUG=True, REQUEST_TIMING_ENABLED=True, SITE_DOMAIN="example.com")
+    def test_asgi_middleware_chain_needs_no_thread_hops(self):
+        def adaptations(middleware):
+            with override_settings(MIDDLEWARE=middleware):
+                with self.assertLogs("django.request", "DEBUG") as logs:
+                    ASGIHandler()
+                    logging.getLogger("django.request").debug("loaded")
+            return [line for line in logs.output if "adapted" in line]
+
+        whitenoise = "whitenoise.middleware.WhiteNoiseMiddleware"
+        self.assertEqual(len(adaptations(settings.MIDDLEWARE)), 1)
+        self.assertIn(whitenoise, adaptations(settings.MIDDLEWARE)[0])
+        asgi_middleware = [name for name in settings.MIDDLEWARE if name != whitenoise]
+        self.assertEqual(adaptations(asgi_middleware), [])
+
+    @override_settings(STATIC_ROOT=None, WHITENOISE_USE_FINDERS=True)
+    def test_static_files_are_served_ahead_of_django(self):
+        passed = []
+
+        async def django_application(scope, receive, send):
+            passed.append(scope["path"])
+
+        app = staticfiles.StaticFilesApplication(django_application)
+
+        def get(path, method="GET"):
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {"type": "http", "method": method, "path": path, "headers": []}
+            async_to_sync(app)(scope, None, send)
+            return messages
+
+        messages = get("/static/teams/live.js")
+        self.assertEqual(messages[0]["status"], 200)
+        with open(settings.BASE_DIR / "teams/static/teams/live.js", "rb") as script:
+            self.assertEqual(
+                b"".join(message.get("body", b"") for message in messages[1:]),
+                script.read(),
+            )
+        self.assertEqual(get("/static/teams/live.js", "HEAD")[-1]["body"], b"")
+        self.assertEqual(passed, [])
+
+        get("/")
+        self.assertEqual(passed, ["/"])
+
+
+@override_settings(LIVE_UPDATES=True, LIVE_POLL_SECONDS=0.01, LIVE_LONG_POLL_SECONDS=1)
+class LiveFeedTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(max_participants=2)
+        self.feed = live.ChangeFeed()
+        self.app = live.LiveFeedApplication(None, feed=self.feed)
+
+    def get(self, query="", accept="application/json"):
+        messages = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": settings.LIVE_FEED_PATH,
+            "query_string": query.encode(),
+            "headers": [(b"accept", accept.encode())],
+        }
+        async_to_sync(self.app)(scope, receive, send)
+        return messages
+
+    def poll(self, cursor=""):
+        query = f"events={self.event.pk}&cursor={cursor}"
+        return json.loads(self.get(query)[-1]["body"])
+
+    def test_long_poll_sends_the_current_state_then_changes(self):
+        data = self.poll()
+        self.assertEqual(
+            data["changes"],
+            [live.card_state(self.event.pk, 0, 2, 0, False)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_players(self.event, 2)
+        with self.assertNumQueries(1):
+            changed = self.poll(data["cursor"])
+        self.assertEqual(len(changed["changes"]), 1)
+        self.assertTrue(changed["changes"][0]["is_full"])
+
+        # A cursor minted by another worker gets the current state.
+        stale = self.poll("another-worker:3")
+        self.assertEqual(stale["changes"], changed["changes"])
+
+    def test_clients_share_one_read_and_streams_use_sse(self):
+        self.feed.publish(live.read_states(self.team.pk))
+        cursor = self.feed.token()
+        Event.objects.filter(pk=self.event.pk).update(yes_count=1)
+        self.feed.publish(live.read_states(self.team.pk))
+        for _ in range(3):
+            _, states = self.feed.since(cursor, {self.event.pk})
+            self.assertEqual(states[0]["spots_taken"], 1)
+        self.assertEqual(self.feed.since(cursor, {self.event.pk + 1})[1], [])
+
+        with override_settings(LIVE_STREAM_SECONDS=0):
+            messages = self.get(f"events={self.event.pk}", "text/event-stream")
+        self.assertIn(
+            (b"content-type", b"text/event-stream"), messages[0]["headers"]
+        )
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        self.assertIn(b"event: capacity", body)
+        self.assertIn(f"id: {self.feed.token()}".encode(), body)
+
+
+class LedgerTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.wallet = Wallet.objects.create(user=self.user)
+        with transaction.atomic():
+            ledger.post(self.wallet, Decimal("10.00"), WalletTransaction.Kind.TOPUP)
+
+    def test_bookings_move_the_balance_through_the_ledger(self):
+        event = self.create_event(price=Decimal("6.00"))
+        booking.book(event.pk, self.user.pk, EventSignup.Status.YES)
+        outcome = booking.book(
+            self.create_event(price=Decimal("6.00")).pk,
+            self.user.pk,
+            EventSignup.Status.YES,
+        )
+        self.assertEqual(outcome.level, messages.ERROR)
+        booking.book(event.pk, self.user.pk, EventSignup.Status.NO)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("10.00"))
+        self.assertEqual(
+            list(
+                self.wallet.transactions.order_by("pk").values_list("kind", flat=True)
+            ),
+            ["topup", "event_debit", "event_refund"],
+        )
+        self.assertEqual(ledger.ledger_balance(self.wallet.pk), Decimal("10.00"))
+
+    def test_debit_requiring_funds_is_refused_without_a_ledger_row(self):
+        with self.assertRaises(ledger.InsufficientFunds), transaction.atomic():
+            ledger.post(
+                self.wallet,
+                Decimal("-10.01"),
+                WalletTransaction.Kind.EVENT_DEBIT,
+                require_funds=True,
+            )
+        self.assertEqual(self.wallet.transactions.count(), 1)
+
+    def test_verify_reports_drift_and_snapshots_matching_wallets(self):
+        other = get_user_model().objects.create_user(username="other@example.com")
+        Wallet.objects.create(user=other)
+        Wallet.objects.filter(user=other).update(balance=Decimal("3.00"))
+
+        out = StringIO()
+        call_command("verify_ledger", "--snapshot", stdout=out)
+        self.assertIn("stored=3.00 ledger=0", out.getvalue())
+        snapshot = WalletSnapshot.objects.get()
+        self.assertEqual(snapshot.wallet, self.wallet)
+        self.assertEqual(snapshot.balance, Decimal("10.00"))
+
+        call_command("verify_ledger", "--record-adjustments", stdout=StringIO())
+        out = StringIO()
+        call_command("verify_ledger", stdout=out)
+        self.assertIn("All 2 wallet balances match the ledger.", out.getvalue())
+
+    def test_verification_starts_from_the_latest_snapshot(self):
+        call_command("verify_ledger", "--snapshot", stdout=StringIO())
+        first = self.wallet.transactions.get()
+        self.assertEqual(WalletSnapshot.objects.get().last_transaction_id, first.pk)
+
+        with transaction.atomic():
+            later = ledger.post(self.wallet, Decimal("2.50"), WalletTransaction.Kind.TOPUP)
+        self.assertEqual(ledger.ledger_balance(self.wallet.pk), Decimal("12.50"))
+        self.assertEqual(
+            list(ledger.ledger_totals()),
+            [(self.wallet.pk, Decimal("12.50"), Decimal("12.50"), later.pk)],
+        )
+
+        # A row rewritten behind the snapshot only shows up in a full pass.
+        WalletTransaction.objects.filter(pk=first.pk).update(amount=Decimal("9.00"))
+        out = StringIO()
+        call_command("verify_ledger", stdout=out)
+        self.assertIn("All 1 wallet balances match the ledger.", out.getvalue())
+        out = StringIO()
+        call_command("verify_ledger", "--full", stdout=out)
+        self.assertIn("stored=12.50 ledger=11.5", out.getvalue())
+
+
+@override_settings(WALLET_HISTORY_PAGE_SIZE=5)
+class WalletHistoryTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.event = self.create_event(title="Friday doubles")
+        entries = [
+            WalletTransaction(
+                wallet=self.wallet, amount=Decimal("10.00"), kind="topup"
+            )
+            for _ in range(7)
+        ]
+        entries += [
+            WalletTransaction(
+                wallet=self.wallet,
+                amount=Decimal("-4.00"),
+                kind="event_debit",
+                event=self.event,
+            )
+            for _ in range(3)
+        ]
+        WalletTransaction.objects.bulk_create(entries)
+        self.client.force_login(self.user)
+
+    def test_pages_newest_first_and_keeps_filters(self):
+        url = reverse("teams:wallet-history")
+        response = self.client.get(url, {"kind": "topup"})
+        page = response.context["transactions"]
+        self.assertEqual(len(page), 5)
+        self.assertTrue(all(entry.kind == "topup" for entry in page))
+        self.assertIn("kind=topup", response.context["next_url"])
+
+        response = self.client.get(url + response.context["next_url"])
+        self.assertEqual(len(response.context["transactions"]), 2)
+        self.assertIsNone(response.context["next_url"])
+
+        response = self.client.get(url, {"event": self.event.pk})
+        self.assertEqual(len(response.context["transactions"]), 3)
+        self.assertContains(response, "Friday doubles only")
+
+        for event in (0, -1, MAX_PK + 1):
+            with self.subTest(event=event):
+                response = self.client.get(url, {"event": event})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context["transactions"]), 5)
+
+    def test_admin_list_query_count_does_not_grow_with_rows(self):
+        admin_user = get_user_model().objects.create_superuser(
+            username="admin@example.com", email="admin@example.com", password="x"
+        )
+        self.client.force_login(admin_user)
+        url = reverse("admin:teams_wallettransaction_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        WalletTransaction.objects.bulk_create(
+            WalletTransaction(wallet=self.wallet, amount=Decimal("1.00"), kind="topup")
+            for _ in range(30)
+        )
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+
+class ExportTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(title="Summer league")
+        self.add_players(self.event, 2)
+        old = self.create_event(title="Spring league")
+        Event.objects.filter(pk=old.pk).update(
+            starts_at=timezone.now() - timedelta(days=90),
+            ends_at=timezone.now() - timedelta(days=90) + timedelta(hours=2),
+        )
+
+    def test_command_streams_signups_for_a_date_range(self):
+        out = StringIO()
+        since = timezone.localdate().isoformat()
+        call_command("export_data", "signups", "--since", since, stdout=out)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0], list(exports.DATASETS["signups"].columns))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[2] for row in rows[1:]}, {"Summer league"})
+
+    def test_command_writes_json_lines(self):
+        out = StringIO()
+        call_command("export_data", "events", "--format", "jsonl", stdout=out)
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [event["title"] for event in events], ["Spring league", "Summer league"]
+        )
+        self.assertEqual(events[1]["yes_count"], 2)
+
+    def test_exports_page_by_keyset_without_server_side_cursors(self):
+        for name, dataset in exports.DATASETS.items():
+            queryset = dataset.queryset()
+            expected = list(queryset.values_list(*dataset.columns))
+            database = connections[DEFAULT_DB_ALIAS]
+            with mock.patch.object(exports, "CHUNK_SIZE", 1), mock.patch.dict(
+                database.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True}
+            ):
+                with self.assertNumQueries(len(expected) + 1):
+                    rows = list(exports.read_rows(dataset, queryset))
+            self.assertEqual(rows, expected, name)
+
+    def test_admin_action_streams_the_selection(self):
+        admin_user = get_user_model().objects.create_superuser(
+            username="admin@example.com", email="admin@example.com", password="x"
+        )
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            reverse("admin:teams_event_changelist"),
+            {
+                "action": "export_signups_csv",
+                "_selected_action": [self.event.pk],
+            },
+        )
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(body.strip().splitlines()), 3)
+
+
+class EventSeriesTests(TeamsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venue = Venue.objects.create(
+            name="Leisure centre", address_line1="1 Road", postcode="BA11 1AA"
+        )
+        self.first_date = timezone.localdate() + timedelta(days=1)
+
+    def build_series(self, **kwargs):
+        fields = {
+            "team": self.team,
+            "title": "Tuesday social",
+            "venue": self.venue,
+            "first_date": self.first_date,
+            "last_date": self.first_date + timedelta(weeks=9),
+            "starts_time": time(19),
+            "ends_time": time(21),
+            "max_participants": 8,
+            "price": Decimal("5.00"),
+            "created_by": self.user,
+        }
+        fields.update(kwargs)
+        return EventSeries(**fields)
+
+    def fund(self, user, amount):
+        wallet = booking.get_wallets([user.pk])[user.pk]
+        with transaction.atomic():
+            ledger.post(wallet, amount, WalletTransaction.Kind.TOPUP)
+        return wallet
+
+    def test_materializes_occurrences_with_one_insert(self):
+        skipped = self.first_date + timedelta(weeks=2)
+        event_series = self.build_series(skip_dates=[skipped.isoformat()])
+        with CaptureQueriesContext(connection) as queries:
+            events = series.create_series(event_series)
+        inserts = [
+            q for q in queries if q["sql"].startswith('INSERT INTO "teams_event"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(events), 9)
+        days = [timezone.localdate(event.starts_at) for event in events]
+        self.assertNotIn(skipped, days)
+        self.assertEqual(days[1] - days[0], timedelta(weeks=1))
+
+        fortnightly = self.build_series(frequency=EventSeries.Frequency.FORTNIGHTLY)
+        self.assertEqual(len(series.create_series(fortnightly)), 5)
+
+    def test_edit_updates_future_events_and_refunds_dropped_dates_in_one_batch(self):
+        event_series = self.build_series()
+        first, second = series.create_series(event_series)[:2]
+        players = [
+            get_user_model().objects.create_user(username=f"p{index}@example.com")
+            for index in range(3)
+        ]
+        for player in players:
+            self.fund(player, Decimal("20.00"))
+            booking.book(first.pk, player.pk, EventSignup.Status.YES)
+            booking.book(second.pk, player.pk, EventSignup.Status.YES)
+
+        event_series.title = "Tuesday ladder"
+        event_series.price = Decimal("6.00")
+        event_series.skip_dates = [self.first_date.isoformat()]
+        event_series.last_date += timedelta(weeks=1)
+        event_series.save()
+        with CaptureQueriesContext(connection) as queries:
+            change = series.sync_occurrences(event_series)
+        wallet_updates = [
+            q for q in queries if q["sql"].startswith('UPDATE "teams_wallet"')
+        ]
+        self.assertEqual(len(wallet_updates), 1)
+        self.assertEqual(len(change.created), 1)
+        self.assertEqual(len(change.updated), 9)
+        self.assertEqual(change.price_kept, 1)
+        self.assertEqual(len(change.cancellation.refunds), 3)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.is_cancelled)
+        self.assertEqual(second.title, "Tuesday ladder")
+        self.assertEqual(second.price, Decimal("5.00"))
+        self.assertEqual(
+            set(Wallet.objects.values_list("balance", flat=True)), {Decimal("15.00")}
+        )
+
+        outcome = booking.book(first.pk, players[0].pk, EventSignup.Status.NO)
+        self.assertEqual(outcome.level, messages.ERROR)
+        remaining = series.cancel_future(event_series)
+        self.assertEqual(remaining.refunds[0].amount, Decimal("5.00"))
+        self.assertEqual(
+            set(Wallet.objects.values_list("balance", flat=True)), {Decimal("20.00")}
+        )
+        self.assertEqual(series.cancel_future(event_series).events, [])
+
+    def test_a_date_skipped_then_restored_gets_a_new_occurrence(self):
+        event_series = self.build_series()
+        series.create_series(event_series)
+        skipped = self.first_date + timedelta(weeks=1)
+
+        event_series.skip_dates = [skipped.isoformat()]
+        event_series.save()
+        change = series.sync_occurrences(event_series)
+        self.assertEqual(len(change.cancellation.events), 1)
+        cancelled = change.cancellation.events[0]
+        self.assertEqual(timezone.localdate(cancelled.starts_at), skipped)
+
+        event_series.skip_dates = []
+        event_series.save()
+        change = series.sync_occurrences(event_series)
+        self.assertEqual(len(change.created), 1)
+        self.assertEqual(timezone.localdate(change.created[0].starts_at), skipped)
+        self.assertIsNone(change.cancellation)
+
+        live = event_series.occurrences.filter(is_cancelled=False)
+        self.assertEqual(live.count(), 10)
+        cancelled.refresh_from_db()
+        self.assertTrue(cancelled.is_cancelled)
+
+        # Syncing again leaves both the old and the new occurrence alone.
+        change = series.sync_occurrences(event_series)
+        self.assertEqual((len(change.created), len(change.updated)), (0, 10))
+
+    def test_only_admins_can_schedule_a_series(self):
+        url = reverse("teams:series-create")
+        data = {
+            "title": "Friday drop-in",
+            "venue": self.venue.pk,
+            "frequency": EventSeries.Frequency.WEEKLY,
+            "first_date": self.first_date.isoformat(),
+            "last_date": (self.first_date + timedelta(weeks=3)).isoformat(),
+            "starts_time": "18:00",
+            "ends_time": "20:00",
+            "skip_dates": "",
+            "min_participants": 0,
+            "max_participants": 12,
+            "price": "0",
+        }
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+
+        TeamMembership.objects.update_or_create(
+            team=self.team, user=self.user, defaults={"role": TeamMembership.Role.ADMIN}
+        )
+        response = self.client.post(url, data)
+        event_series = EventSeries.objects.get()
+        self.assertRedirects(
+            response, reverse("teams:series-detail", args=[event_series.pk])
+        )
+        self.assertEqual(event_series.occurrences.count(), 4)
+        response = self.client.get(response.url)
+        self.assertContains(response, "Update upcoming events")
+        self.client.post(reverse("teams:series-cancel", args=[event_series.pk]))
+        self.assertFalse(series.future_occurrences(event_series).exists())
+
+        data["ends_time"] = "17:00"
+        response = self.client.post(url, data)
+        self.assertFormError(
+            response.context["form"],
+            "ends_time",
+            "End time must be after the start time.",
+        )
+
+
+class StartupTests(TeamsTestCase):
+    @override_settings(SITE_DOMAIN="club.example", SITE_ID=None)
+    def test_site_is_resolved_on_the_first_request_and_cached(self):
+        site = Site.objects.create(domain="club.example", name="Club")
+        self.client.get(reverse("teams:event-archive"))
+        self.assertEqual(settings.SITE_ID, site.pk)
+
+        settings.SITE_ID = None
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_site_id(), site.pk)
+
+    @override_settings(SITE_DOMAIN="club.example", SITE_ID=None)
+    def test_site_is_resolved_once_it_has_been_created(self):
+        self.client.get(reverse("teams:event-archive"))
+        self.assertIsNone(settings.SITE_ID)
+
+        site = Site.objects.create(domain="club.example", name="Club")
+        self.client.get(reverse("teams:event-archive"))
+        self.assertEqual(settings.SITE_ID, site.pk)
+
+    @override_settings(SITE_DOMAIN="club.example", SITE_ID=None)
+    def test_warm_up_survives_a_database_that_is_not_ready(self):
+        self.addCleanup(setattr, startup, "_warmed", startup._warmed)
+        startup._warmed = False
+        failure = mock.patch.object(
+            startup,
+            "resolve_site_id",
+            side_effect=OperationalError('relation "django_site" does not exist'),
+        )
+        with failure, self.assertLogs("teams.startup", "WARNING") as logs:
+            timings = startup.warm_up()
+        self.assertIn("templates_ms", timings)
+        self.assertIn("Could not resolve the site", logs.output[0])
+        self.assertIsNone(settings.SITE_ID)
+
+    def test_warm_up_compiles_the_app_templates(self):
+        names = startup.warm_templates()
+        self.assertIn("teams/partials/event_card.html", names)
+        loader = engines["django"].engine.template_loaders[0]
+        self.assertIn("teams/base.html", loader.get_template_cache)
+
+    def test_production_profile_refuses_development_settings(self):
+        # The test runner turns DEBUG off.
+        with override_settings(DJANGO_PROFILE="production", DEBUG=True):
+            with self.assertRaisesMessage(ImproperlyConfigured, "DEBUG is on"):
+                startup.validate_profile()
+
+        production = dict(settings.TEMPLATES[0], APP_DIRS=False)
+        production["OPTIONS"] = dict(
+            production["OPTIONS"],
+            debug=False,
+            loaders=[
+                (
+                    "django.template.loaders.cached.Loader",
+                    ["django.template.loaders.app_directories.Loader"],
+                )
+            ],
+        )
+        with override_settings(
+            DJANGO_PROFILE="production",
+            DEBUG=False,
+            SECRET_KEY="production-secret",
+            ALLOWED_HOSTS=["club.example"],
+            TEMPLATES=[production],
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+                }
+            },
+            STRIPE_CLIENT="stripe",
+        ):
+            self.assertEqual(startup.profile_problems(), [])
+            with override_settings(STRIPE_CLIENT="stub"):
+                with self.assertRaisesMessage(ImproperlyConfigured, "STRIPE_CLIENT"):
+                    startup.validate_profile()
+
+    def test_startup_report_fails_against_a_smaller_baseline(self):
+        modules, packages = startup.parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     encodings.utf_8\n"
+            "import time:       300 |        420 |   encodings\n"
+        )
+        self.assertEqual((modules, packages), (2, {"encodings": 420}))
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            with open(baseline, "w") as handle:
+                json.dump({"modules": 10, "import_ms": 1}, handle)
+            out = StringIO()
+            with self.assertRaisesMessage(CommandError, "modules"):
+                call_command(
+                    "report_startup", "--runs", "1", "--baseline", baseline, stdout=out
+                )
+        self.assertIn("templates_ms", json.loads(out.getvalue()))
+
+
+class SignupQueueLockingTests(TransactionTestCase):
+    """Rows are committed so a second connection can lock them."""
+
+    def setUp(self):
+        forget_default_team()
+        self.addCleanup(forget_default_team)
+        User = get_user_model()
+        self.players = [
+            User.objects.create_user(username=f"queued-{index}@example.com")
+            for index in range(2)
+        ]
+        starts_at = timezone.now() + timedelta(days=3)
+        self.event = Event.objects.create(
+            team=get_default_team(),
+            title="Club night",
+            starts_at=starts_at,
+            ends_at=starts_at + timedelta(hours=2),
+            max_participants=8,
+            created_by=self.players[0],
+        )
+
+    @skipUnlessDBFeature("has_select_for_update_skip_locked")
+    def test_drain_skips_requests_locked_by_another_worker(self):
+        held, free = [
+            booking.enqueue_signup(self.event, player.pk, EventSignup.Status.YES)
+            for player in self.players
+        ]
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            try:
+                with transaction.atomic():
+                    SignupRequest.objects.select_for_update().get(pk=held.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=hold)
+        worker.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(booking.drain_signup_requests(self.event.pk), 1)
+        finally:
+            release.set()
+            worker.join()
+
+        held.refresh_from_db()
+        free.refresh_from_db()
+        self.assertEqual(held.state, SignupRequest.State.PENDING)
+        self.assertEqual(free.state, SignupRequest.State.DONE)
+        self.assertEqual(booking.drain_signup_requests(self.event.pk), 1)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second connection to the test database stands in for the replica.
+
+    Rows are committed so both connections see them, which is why this is a
+    TransactionTestCase.
+    """
+
+    # Resolved in setUpClass, after the replica alias is registered.
+    databases = "__all__"
+    serialized_rollback = True
+
+    @classmethod
+    def setUpClass(cls):
+        replica = dict(connections[DEFAULT_DB_ALIAS].settings_dict)
+        replica["TEST"] = {**replica["TEST"], "MIRROR": DEFAULT_DB_ALIAS}
+        connections.settings[routers.REPLICA] = replica
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[routers.REPLICA].close()
+        del connections[routers.REPLICA]
+        del connections.settings[routers.REPLICA]
+
+    def setUp(self):
+        cache.clear()
+        forget_default_team()
+        self.addCleanup(forget_default_team)
+        self.team = get_default_team()
+        self.user = get_user_model().objects.create_user(
+            username="player@example.com", email="player@example.com"
+        )
+        starts_at = timezone.now() + timedelta(days=3)
+        self.event = Event.objects.create(
+            team=self.team,
+            title="Club night",
+            starts_at=starts_at,
+            ends_at=starts_at + timedelta(hours=2),
+            max_participants=8,
+            created_by=self.user,
+        )
+
+    def tables_read(self, method, url, data=None):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary:
+            with CaptureQueriesContext(connections[routers.REPLICA]) as replica:
+                response = getattr(self.client, method)(url, data)
+
+        def tables(queries):
+            return {
+                table
+                for query in queries
+                for table in re.findall(r'FROM "(\w+)"', query["sql"])
+            }
+
+        return response, tables(primary), tables(replica)
+
+    def test_listing_reads_use_the_replica_until_the_client_writes(self):
+        home = reverse("teams:home")
+        _, primary, replica = self.tables_read("get", home)
+        self.assertIn("teams_event", replica)
+        self.assertNotIn("teams_event", primary)
+
+        self.client.force_login(self.user)
+        # A first visit resolves the membership with get_or_create, which the
+        # router counts as a write; returning members have it cached.
+        get_membership_role(self.team, self.user)
+        detail = reverse("teams:event-detail", args=[self.event.pk])
+        _, primary, replica = self.tables_read("get", detail)
+        self.assertIn("teams_eventsignup", replica)
+        self.assertIn("django_session", primary)
+        self.assertNotIn("django_session", replica)
+
+        # The RSVP itself, and the pages right after it, use the primary.
+        response, _, replica = self.tables_read(
+            "post",
+            reverse("teams:event-signup", args=[self.event.pk]),
+            {"status": EventSignup.Status.MAYBE},
+        )
+        self.assertEqual(replica, set())
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        response, _, replica = self.tables_read("get", detail)
+        self.assertEqual(replica, set())
+        self.assertEqual(response.context["my_status"], EventSignup.Status.MAYBE)
+
+        self.client.cookies.pop(routers.PIN_COOKIE)
+        _, _, replica = self.tables_read("get", detail)
+        self.assertIn("teams_event", replica)
+
+    def test_pages_read_from_the_replica_carry_no_validator(self):
+        home = reverse("teams:home")
+        detail = reverse("teams:event-detail", args=[self.event.pk])
+        for url in (home, home, detail):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("ETag", response.headers)
+
+        self.client.cookies[routers.PIN_COOKIE] = str(timezone.now().timestamp() + 60)
+        response = self.client.get(detail)
+        self.assertIn("ETag", response.headers)
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_views_and_writes_stay_on_the_primary(self):
+        self.client.force_login(self.user)
+        _, primary, replica = self.tables_read("get", reverse("teams:wallet"))
+        self.assertEqual(replica, set())
+        self.assertIn("teams_wallet", primary)
+
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Event), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(routers.REPLICA, "teams"))
@@ -1,22 +1,56 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
 app_name = "teams"
 
 urlpatterns = [
-    path("", views.HomeView.as_view(), name="home"),
+    path("", read_views.HomeView.as_view(), name="home"),
     path("wallet/", views.WalletView.as_view(), name="wallet"),
+    path(
+        "wallet/history/", views.WalletHistoryView.as_view(), name="wallet-history"
+    ),
     path(
         "events/new/",
         views.EventCreateView.as_view(),
         name="event-create",
     ),
-    path("events/<int:event_id>/", views.EventDetailView.as_view(), name="event-detail"),
+    path(
+        "events/series/new/",
+        views.EventSeriesCreateView.as_view(),
+        name="series-create",
+    ),
+    path(
+        "events/series/<int:series_id>/",
+        views.EventSeriesUpdateView.as_view(),
+        name="series-detail",
+    ),
+    path(
+        "events/series/<int:series_id>/cancel/",
+        views.EventSeriesCancelView.as_view(),
+        name="series-cancel",
+    ),
+    path("events/past/", views.EventArchiveView.as_view(), name="event-archive"),
+    path(
+        "events/<int:event_id>/",
+        read_views.EventDetailView.as_view(),
+        name="event-detail",
+    ),
     path(
         "events/<int:event_id>/signup/",
         views.EventSignupToggleView.as_view(),
         name="event-signup",
     ),
+    path(
+        "signup-requests/<int:request_id>/",
+        views.SignupRequestStatusView.as_view(),
+        name="signup-request",
+    ),
     path("stripe/webhook/", views.StripeWebhookView.as_view(), name="stripe-webhook"),
 ]
@@ -1,115 +1,325 @@
+import hashlib
+import time
 from decimal import Decimal
 
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.messages.utils import get_level_tags
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
-from django.db import transaction
-from django.db.models import CharField, Count, OuterRef, Q, Subquery, Value
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views import View
-from django.views.generic import CreateView, DetailView
-
-from .forms import EventForm, TopUpForm
+from django.views.generic import CreateView, DetailView, UpdateView
+
+from . import booking, payments, series, stripe_client
+from .cache import (
+    get_default_team,
+    get_membership_role,
+    get_version,
+    get_versions,
+    get_wallet_balance,
+)
+from .forms import EventForm, EventSeriesForm, TopUpForm, WalletHistoryFilterForm
+from .middleware import timed_external
 from .models import (
     Event,
+    EventSeries,
     EventSignup,
-    Team,
+    SignupRequest,
     TeamMembership,
     Wallet,
     WalletTransaction,
 )
+from .pagination import keyset_slice, paginate_keyset
+from .routers import cache_timeout, read_from_replica, replica_reads
+
+
+def team_events(team):
+    return team.events.select_related("created_by", "venue")
+
+
+def page_url(param, cursor, anchor):
+    return f"?{param}={cursor}#{anchor}" if cursor else None
+
+
+def upcoming_events(team, now):
+    return team_events(team).filter(ends_at__gte=now)
+
+
+def upcoming_signups(team, user, now):
+    return EventSignup.objects.filter(
+        user=user, event__team=team, event__ends_at__gte=now
+    ).select_related("event__venue")
+
+
+def signup_overlay(signups):
+    """The member's ``{event_id: status}`` and their booked events.
+
+    One query over the member's own upcoming signups, joined to their
+    events, replaces a status subquery per listed event and a second query
+    for the "My booked events" tab.
+    """
+    statuses = {}
+    booked = []
+    for signup in signups:
+        statuses[signup.event_id] = signup.status
+        if signup.status == EventSignup.Status.YES:
+            booked.append(signup.event)
+    return statuses, booked
+
+
+def overlay_statuses(events, statuses):
+    for event in events:
+        event.my_status = statuses.get(event.pk)
+
+
+def anonymous_home_key(request, team, version):
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"teams:home:anonymous-page:{team.pk}:{version}:{path_hash}"
+
+
+def time_bucket():
+    """Changes every ``PAGE_VALIDATOR_BUCKET`` seconds.
+
+    Upcoming lists drop events as they end, which no write records.
+    """
+    return int(time.time() // settings.PAGE_VALIDATOR_BUCKET)
+
+
+def page_etag(request, user, versions, role=None, balance=None, bucket=None):
+    """Validator for a page built from ``versions`` as ``user`` sees it.
+
+    ``versions`` are the change versions bumped by every event, signup and
+    venue write. The member's id and role cover ``my_status`` and the tabs
+    shown. The wallet balance and a member's CSRF token are rendered into
+    the page too. Everything comes from the cache, so a 304 costs no page
+    queries.
+    """
+    csrf_secret = ""
+    if user.is_authenticated:
+        get_token(request)  # sets the cookie the page's forms will use
+        csrf_secret = request.META["CSRF_COOKIE"]
+    parts = [
+        *versions,
+        str(user.pk or ""),
+        role or "",
+        "" if balance is None else str(balance),
+        csrf_secret,
+        "" if bucket is None else str(bucket),
+    ]
+    return quote_etag(hashlib.md5("|".join(parts).encode()).hexdigest())
+
+
+def with_validator(response, etag, from_replica=None):
+    """Send ``etag`` and make the browser revalidate before reuse.
+
+    A body read from a lagging replica may be older than the versions in
+    ``etag``, so it goes out without the tag and is never confirmed by a
+    304. ``from_replica`` defaults to whether this request read from it.
+    """
+    if from_replica is None:
+        from_replica = read_from_replica()
+    if not from_replica:
+        response.headers["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def home_context(team, role, events_page, my_events_page):
+    return {
+        "team": team,
+        "events": events_page.items,
+        "events_next_url": page_url("cursor", events_page.next_cursor, "events"),
+        "my_events": my_events_page.items if my_events_page else [],
+        "my_events_next_url": page_url(
+            "my_cursor",
+            my_events_page.next_cursor if my_events_page else None,
+            "my-events",
+        ),
+        "is_admin": role == TeamMembership.Role.ADMIN,
+        "show_my_events_tab": role is not None,
+    }
+
+
+def event_detail_queryset(team, user):
+    events = Event.objects.filter(team=team).select_related("team", "venue")
+    if user.is_authenticated:
+        events = events.prefetch_related(
+            Prefetch(
+                "signups",
+                queryset=EventSignup.objects.select_related("user").order_by(
+                    "created_at", "pk"
+                ),
+            )
+        )
+    return events
+
 
-try:
-    import stripe
-except ImportError:  # pragma: no cover - handled with a user-facing message
-    stripe = None
+def signup_lists(event, user):
+    """Partition the event's prefetched signups by status for the template."""
+    context = {"my_status": None}
+    by_status = {status: [] for status in EventSignup.Status.values}
+    for signup in event.signups.all():
+        by_status[signup.status].append(signup)
+        if signup.user_id == user.pk:
+            context["my_status"] = signup.status
+    context["signups_yes"] = by_status[EventSignup.Status.YES]
+    context["signups_waitlist"] = by_status[EventSignup.Status.WAITLIST]
+    context["signups_maybe"] = by_status[EventSignup.Status.MAYBE]
+    context["signups_no"] = by_status[EventSignup.Status.NO]
+    return context
 
 
-def get_default_team():
-    team, _ = Team.objects.get_or_create(name=settings.TEAM_NAME)
-    return team
+def attach_card_versions(*event_lists):
+    events = [event for event_list in event_lists for event in event_list]
+    versions = get_versions("event", {event.pk for event in events})
+    for event in events:
+        event.card_version = versions[event.pk]
 
 
-class HomeView(View):
+class ReplicaReadsMixin:
+    """Serve the view's event, signup and venue reads from the replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class HomeView(ReplicaReadsMixin, View):
     def get(self, request):
         team = get_default_team()
         is_authenticated = request.user.is_authenticated
+        if len(messages.get_messages(request)):
+            return self.render_page(request, team)
+
+        version = get_version("team", team.pk)
         if is_authenticated:
-            TeamMembership.objects.get_or_create(
-                team=team,
-                user=request.user,
-                defaults={"role": TeamMembership.Role.MEMBER},
-            )
-            user_status = EventSignup.objects.filter(
-                event=OuterRef("pk"), user=request.user
-            ).values("status")[:1]
-            my_status = Subquery(user_status, output_field=CharField())
+            role = get_membership_role(team, request.user)
+            balance = get_wallet_balance(request.user.pk)
         else:
-            my_status = Value(None, output_field=CharField())
-
-        events = (
-            team.events.annotate(
-                yes_count=Count(
-                    "signups",
-                    filter=Q(signups__status=EventSignup.Status.YES),
-                ),
-                waitlist_count=Count(
-                    "signups",
-                    filter=Q(signups__status=EventSignup.Status.WAITLIST),
-                ),
-                my_status=my_status,
+            role = balance = None
+        etag = page_etag(
+            request, request.user, [version], role, balance, time_bucket()
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        if is_authenticated:
+            return with_validator(self.render_page(request, team), etag)
+
+        key = anonymous_home_key(request, team, version)
+        cached = cache.get(key)
+        if cached is None:
+            response = self.render_page(request, team)
+            cache.set(
+                key,
+                (response.content, read_from_replica()),
+                cache_timeout(settings.ANONYMOUS_PAGE_CACHE_TIMEOUT),
             )
-            .select_related("created_by", "venue")
-            .order_by("starts_at")
+            return with_validator(response, etag)
+        content, from_replica = cached
+        return with_validator(HttpResponse(content), etag, from_replica)
+
+    def render_page(self, request, team):
+        is_authenticated = request.user.is_authenticated
+        role = get_membership_role(team, request.user) if is_authenticated else None
+
+        now = timezone.now()
+        upcoming = upcoming_events(team, now)
+        events_page = paginate_keyset(
+            upcoming,
+            "starts_at",
+            request.GET.get("cursor"),
+            settings.EVENT_PAGE_SIZE,
         )
+        statuses = {}
+        my_events_page = None
         if is_authenticated:
-            my_events = events.filter(
-                signups__user=request.user, signups__status=EventSignup.Status.YES
-            ).distinct()
-            is_admin = team.memberships.filter(
-                user=request.user, role=TeamMembership.Role.ADMIN
-            ).exists()
-        else:
-            my_events = events.none()
-            is_admin = False
+            statuses, booked = signup_overlay(
+                upcoming_signups(team, request.user, now)
+            )
+            my_events_page = keyset_slice(
+                booked,
+                "starts_at",
+                request.GET.get("my_cursor"),
+                settings.EVENT_PAGE_SIZE,
+            )
+            overlay_statuses(my_events_page.items, statuses)
+        overlay_statuses(events_page.items, statuses)
+        attach_card_versions(
+            events_page.items, my_events_page.items if my_events_page else []
+        )
         return render(
             request,
             "teams/team_detail.html",
+            home_context(team, role, events_page, my_events_page),
+        )
+
+
+class EventArchiveView(View):
+    def get(self, request):
+        team = get_default_team()
+        past = team_events(team).filter(ends_at__lt=timezone.now())
+        page = paginate_keyset(
+            past,
+            "starts_at",
+            request.GET.get("cursor"),
+            settings.EVENT_PAGE_SIZE,
+            descending=True,
+        )
+        # Past cards have no RSVP buttons, so the member's state is not needed.
+        attach_card_versions(page.items)
+        return render(
+            request,
+            "teams/event_archive.html",
             {
                 "team": team,
-                "events": events,
-                "my_events": my_events,
-                "is_admin": is_admin,
-                "show_my_events_tab": is_authenticated,
+                "events": page.items,
+                "next_url": page_url("cursor", page.next_cursor, "past-events"),
             },
         )
 
 
-class EventDetailView(DetailView):
+class EventDetailView(ReplicaReadsMixin, DetailView):
     model = Event
     template_name = "teams/event_detail.html"
     context_object_name = "event"
     pk_url_kwarg = "event_id"
 
-    def get_queryset(self):
-        team = get_default_team()
-        return (
-            Event.objects.filter(team=team)
-            .select_related("team", "venue")
-            .annotate(
-                waitlist_count=Count(
-                    "signups",
-                    filter=Q(signups__status=EventSignup.Status.WAITLIST),
-                )
-            )
-            .prefetch_related("signups__user")
+    def get(self, request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            return super().get(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            role = get_membership_role(get_default_team(), request.user)
+            balance = get_wallet_balance(request.user.pk)
+        else:
+            role = balance = None
+        etag = page_etag(
+            request,
+            request.user,
+            [get_version("event", kwargs["event_id"])],
+            role,
+            balance,
         )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return with_validator(super().get(request, *args, **kwargs), etag)
+
+    def get_queryset(self):
+        return event_detail_queryset(get_default_team(), self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -121,37 +331,17 @@ class EventDetailView(DetailView):
         if not is_authenticated:
             return context
 
-        TeamMembership.objects.get_or_create(
-            team=event.team,
-            user=self.request.user,
-            defaults={"role": TeamMembership.Role.MEMBER},
-        )
-        signups = event.signups.select_related("user").order_by("created_at")
-        context["signups_yes"] = signups.filter(status=EventSignup.Status.YES)
-        context["signups_waitlist"] = signups.filter(
-            status=EventSignup.Status.WAITLIST
-        )
-        context["signups_maybe"] = signups.filter(status=EventSignup.Status.MAYBE)
-        context["signups_no"] = signups.filter(status=EventSignup.Status.NO)
-        context["my_status"] = (
-            signups.filter(user=self.request.user)
-            .values_list("status", flat=True)
-            .first()
-        )
+        get_membership_role(event.team, self.request.user)
+        context.update(signup_lists(event, self.request.user))
         return context
 
 
-class EventCreateView(LoginRequiredMixin, CreateView):
-    model = Event
-    form_class = EventForm
-    template_name = "teams/event_form.html"
-
+class TeamAdminRequiredMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
         self.team = get_default_team()
-        is_admin = TeamMembership.objects.filter(
-            team=self.team, user=request.user, role=TeamMembership.Role.ADMIN
-        ).exists()
-        if not is_admin:
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        if get_membership_role(self.team, request.user) != TeamMembership.Role.ADMIN:
             raise PermissionDenied
         return super().dispatch(request, *args, **kwargs)
 
@@ -160,6 +350,12 @@ class EventCreateView(LoginRequiredMixin, CreateView):
         context["team"] = self.team
         return context
 
+
+class EventCreateView(TeamAdminRequiredMixin, CreateView):
+    model = Event
+    form_class = EventForm
+    template_name = "teams/event_form.html"
+
     def form_valid(self, form):
         form.instance.team = self.team
         form.instance.created_by = self.request.user
@@ -169,14 +365,113 @@ class EventCreateView(LoginRequiredMixin, CreateView):
         return reverse("teams:home")
 
 
+def cancellation_message(cancellation):
+    message = f"Cancelled {len(cancellation.events)} event(s)"
+    if cancellation.refunds:
+        message += f" and refunded {len(cancellation.refunds)} booking(s)"
+    return message + "."
+
+
+class EventSeriesCreateView(TeamAdminRequiredMixin, CreateView):
+    model = EventSeries
+    form_class = EventSeriesForm
+    template_name = "teams/series_form.html"
+
+    def form_valid(self, form):
+        form.instance.team = self.team
+        form.instance.created_by = self.request.user
+        self.object = form.instance
+        events = series.create_series(self.object)
+        messages.success(self.request, f"Scheduled {len(events)} events.")
+        return redirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse("teams:series-detail", args=[self.object.pk])
+
+
+class EventSeriesUpdateView(TeamAdminRequiredMixin, UpdateView):
+    form_class = EventSeriesForm
+    template_name = "teams/series_form.html"
+    pk_url_kwarg = "series_id"
+
+    def get_queryset(self):
+        return EventSeries.objects.filter(team=self.team)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["occurrences"] = self.object.occurrences.select_related("venue")
+        context["now"] = timezone.now()
+        return context
+
+    def form_valid(self, form):
+        self.object = form.save(commit=False)
+        with transaction.atomic():
+            self.object.save()
+            change = series.sync_occurrences(self.object)
+        messages.success(
+            self.request,
+            f"Updated {len(change.updated)} and added {len(change.created)} "
+            "upcoming event(s).",
+        )
+        if change.cancellation:
+            messages.info(self.request, cancellation_message(change.cancellation))
+        if change.price_kept:
+            messages.warning(
+                self.request,
+                f"{change.price_kept} booked event(s) kept their old price.",
+            )
+        return redirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse("teams:series-detail", args=[self.object.pk])
+
+
+class EventSeriesCancelView(TeamAdminRequiredMixin, View):
+    def post(self, request, series_id):
+        event_series = get_object_or_404(EventSeries, pk=series_id, team=self.team)
+        cancellation = series.cancel_future(event_series)
+        if cancellation.events:
+            messages.success(request, cancellation_message(cancellation))
+        else:
+            messages.info(request, "There are no upcoming events to cancel.")
+        return redirect("teams:series-detail", series_id=event_series.pk)
+
+
+def wants_json(request):
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def signup_response(request, outcome):
+    """The updated card, status and balance for a script-driven RSVP."""
+    event = outcome.event
+    event.my_status = outcome.status
+    attach_card_versions([event])
+    card = render_to_string(
+        "teams/partials/event_card.html", {"event": event}, request=request
+    )
+    return JsonResponse(
+        {
+            "event": event.pk,
+            "status": outcome.status,
+            "message": outcome.message,
+            "level": get_level_tags().get(outcome.level, ""),
+            "card": card,
+            "balance": f"{get_wallet_balance(request.user.pk):.2f}",
+        }
+    )
+
+
 class EventSignupToggleView(LoginRequiredMixin, View):
+    """Apply an RSVP.
+
+    Plain form posts redirect back to the events page. Requests that accept
+    JSON, sent by the script on the events page, get the re-rendered card
+    instead, so a click costs one booking transaction and no page render.
+    """
+
     def post(self, request, event_id):
         event = get_object_or_404(Event.objects.select_related("team"), pk=event_id)
-        TeamMembership.objects.get_or_create(
-            team=event.team,
-            user=request.user,
-            defaults={"role": TeamMembership.Role.MEMBER},
-        )
+        get_membership_role(event.team, request.user)
 
         requested_status = request.POST.get("status")
         if not requested_status:
@@ -186,134 +481,46 @@ class EventSignupToggleView(LoginRequiredMixin, View):
                 else EventSignup.Status.NO
             )
         if requested_status not in EventSignup.Status.values:
+            if wants_json(request):
+                return JsonResponse({"message": "Invalid response."}, status=400)
             messages.error(request, "Invalid response.")
             return redirect("teams:home")
 
-        with transaction.atomic():
-            event = (
-                Event.objects.select_for_update()
-                .select_related("team")
-                .get(pk=event_id)
-            )
-            signup = (
-                EventSignup.objects.select_for_update()
-                .filter(event=event, user=request.user)
-                .first()
+        if event.queued_booking:
+            signup_request = booking.enqueue_signup(
+                event, request.user.pk, requested_status
             )
-            current_status = signup.status if signup else None
-            wallet, _ = Wallet.objects.get_or_create(user=request.user)
-            wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
-
-            yes_count = EventSignup.objects.filter(
-                event=event, status=EventSignup.Status.YES
-            ).count()
-            spots_left = event.max_participants - yes_count
-
-            message_sent = False
-
-            if (
-                requested_status == EventSignup.Status.YES
-                and current_status != EventSignup.Status.YES
-            ):
-                if spots_left <= 0:
-                    requested_status = EventSignup.Status.WAITLIST
-                    messages.info(
-                        request, "Event is full. You've been added to the waitlist."
-                    )
-                    message_sent = True
-                elif event.price > 0 and wallet.balance < event.price:
-                    messages.error(
-                        request,
-                        "Insufficient wallet balance. Top up to book this event.",
-                    )
-                    return redirect("teams:home")
-
-            if signup:
-                signup.status = requested_status
-                signup.save(update_fields=["status"])
-            else:
-                signup = EventSignup.objects.create(
-                    event=event, user=request.user, status=requested_status
-                )
-
-            if (
-                current_status == EventSignup.Status.YES
-                and requested_status != EventSignup.Status.YES
-            ):
-                if event.price > 0:
-                    wallet.balance = wallet.balance + event.price
-                    wallet.save(update_fields=["balance"])
-                    WalletTransaction.objects.create(
-                        wallet=wallet,
-                        amount=event.price,
-                        kind=WalletTransaction.Kind.EVENT_REFUND,
-                        event=event,
-                    )
-                self._promote_waitlist(event, exclude_user_id=request.user.id)
-
-            if (
-                current_status != EventSignup.Status.YES
-                and requested_status == EventSignup.Status.YES
-            ):
-                if event.price > 0:
-                    wallet.balance = wallet.balance - event.price
-                    wallet.save(update_fields=["balance"])
-                    WalletTransaction.objects.create(
-                        wallet=wallet,
-                        amount=-event.price,
-                        kind=WalletTransaction.Kind.EVENT_DEBIT,
-                        event=event,
-                    )
-
-            if not message_sent and current_status != requested_status:
-                if requested_status == EventSignup.Status.YES:
-                    messages.success(request, "You're booked in!")
-                elif requested_status == EventSignup.Status.WAITLIST:
-                    messages.info(request, "You're on the waitlist.")
-                elif requested_status == EventSignup.Status.MAYBE:
-                    messages.info(request, "Marked as maybe.")
-                elif requested_status == EventSignup.Status.NO:
-                    messages.info(request, "Marked as not attending.")
-
+            status_url = reverse("teams:signup-request", args=[signup_request.pk])
+            if wants_json(request):
+                return JsonResponse({"redirect": status_url}, status=202)
+            return redirect(status_url)
+
+        outcome = booking.book(event.pk, request.user.pk, requested_status)
+        if wants_json(request):
+            return signup_response(request, outcome)
+        if outcome.message:
+            messages.add_message(request, outcome.level, outcome.message)
         return redirect("teams:home")
 
-    @staticmethod
-    def _promote_waitlist(event, exclude_user_id=None):
-        yes_count = EventSignup.objects.filter(
-            event=event, status=EventSignup.Status.YES
-        ).count()
-        spots_left = event.max_participants - yes_count
-        if spots_left <= 0:
-            return
-
-        waitlist = (
-            EventSignup.objects.select_for_update()
-            .filter(event=event, status=EventSignup.Status.WAITLIST)
-            .exclude(user_id=exclude_user_id)
-            .order_by("created_at")
-        )
 
-        for signup in waitlist:
-            if spots_left <= 0:
-                break
-            wallet, _ = Wallet.objects.get_or_create(user=signup.user)
-            wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
-
-            if event.price > 0 and wallet.balance < event.price:
-                continue
-
-            signup.status = EventSignup.Status.YES
-            signup.save(update_fields=["status"])
-            if event.price > 0:
-                wallet.balance = wallet.balance - event.price
-                wallet.save(update_fields=["balance"])
-                WalletTransaction.objects.create(
-                    wallet=wallet,
-                    amount=-event.price,
-                    kind=WalletTransaction.Kind.EVENT_DEBIT,
-                    event=event,
-                )
-            spots_left -= 1
+class SignupRequestStatusView(LoginRequiredMixin, View):
+    def get(self, request, request_id):
+        signup_request = get_object_or_404(
+            SignupRequest.objects.select_related("event"),
+            pk=request_id,
+            user=request.user,
+        )
+        if signup_request.state == SignupRequest.State.PENDING:
+            return render(
+                request,
+                "teams/signup_request.html",
+                {"signup_request": signup_request, "event": signup_request.event},
+            )
+        if signup_request.message:
+            messages.add_message(
+                request, signup_request.message_level, signup_request.message
+            )
+        return redirect("teams:home")
 
 
 class WalletView(LoginRequiredMixin, View):
@@ -321,64 +528,58 @@ class WalletView(LoginRequiredMixin, View):
         wallet, _ = Wallet.objects.get_or_create(user=request.user)
         session_id = request.GET.get("session_id")
         if session_id:
-            if not settings.STRIPE_SECRET_KEY or stripe is None:
-                messages.error(request, "Stripe is not configured yet.")
-                return redirect("teams:wallet")
-
-            stripe.api_key = settings.STRIPE_SECRET_KEY
-            try:
-                session = stripe.checkout.Session.retrieve(session_id)
-            except stripe.error.StripeError:
-                messages.error(request, "Unable to verify the Stripe session.")
-                return redirect("teams:wallet")
+            return self.check_topup(request, wallet, session_id)
+        form = TopUpForm()
+        return render(request, "teams/wallet.html", {"wallet": wallet, "form": form})
 
-            session_user_id = session.get("client_reference_id") or session.get(
-                "metadata", {}
-            ).get("user_id")
-            if str(session_user_id) != str(request.user.id):
+    def check_topup(self, request, wallet, session_id):
+        # The webhook usually lands before the customer is redirected back, so
+        # the inbox is checked before asking Stripe about the session.
+        try:
+            payments.credit_from_inbox(session_id)
+        except IntegrityError:
+            # A background session check credited the session first; the
+            # ledger row read below is the one it wrote.
+            pass
+        credited_wallet_id = (
+            WalletTransaction.objects.filter(stripe_session_id=session_id)
+            .values_list("wallet_id", flat=True)
+            .first()
+        )
+        if credited_wallet_id is not None:
+            if credited_wallet_id != wallet.pk:
                 messages.error(request, "This top-up session does not belong to you.")
                 return redirect("teams:wallet")
+            messages.success(request, "Top-up applied to your wallet.")
+            return redirect("teams:home")
 
-            if session.get("payment_status") != "paid":
-                messages.info(request, "Payment is not complete yet.")
-                return redirect("teams:wallet")
-
-            amount_total = session.get("amount_total")
-            if amount_total is None:
-                messages.error(request, "Stripe did not return a payment amount.")
-                return redirect("teams:wallet")
+        try:
+            result = payments.request_session_check(session_id)
+        except stripe_client.StripeUnavailable as exc:
+            messages.error(request, str(exc))
+            return redirect("teams:wallet")
 
-            payment_intent = session.get("payment_intent")
-            amount = Decimal(amount_total) / Decimal("100")
-            with transaction.atomic():
-                wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
-                already_logged = WalletTransaction.objects.filter(
-                    stripe_session_id=session_id
-                ).exists()
-                if not already_logged:
-                    wallet.balance = wallet.balance + amount
-                    wallet.save(update_fields=["balance"])
-                    WalletTransaction.objects.create(
-                        wallet=wallet,
-                        amount=amount,
-                        kind=WalletTransaction.Kind.TOPUP,
-                        stripe_session_id=session_id,
-                        stripe_payment_intent=payment_intent or None,
-                    )
-                    messages.success(request, "Top-up applied to your wallet.")
-                else:
-                    messages.info(request, "Top-up was already applied.")
-            return redirect("teams:home")
-        form = TopUpForm()
-        return render(request, "teams/wallet.html", {"wallet": wallet, "form": form})
+        state = result["state"]
+        if state == payments.SessionCheck.PENDING:
+            return render(request, "teams/wallet_pending.html", {"wallet": wallet})
+        if state == payments.SessionCheck.ERROR:
+            messages.error(request, "Unable to verify the Stripe session.")
+            return redirect("teams:wallet")
+        if result["user_id"] != str(request.user.id):
+            messages.error(request, "This top-up session does not belong to you.")
+            return redirect("teams:wallet")
+        if state == payments.SessionCheck.UNPAID:
+            messages.info(request, "Payment is not complete yet.")
+            return redirect("teams:wallet")
+        messages.success(request, "Top-up applied to your wallet.")
+        return redirect("teams:home")
 
     def post(self, request):
         wallet, _ = Wallet.objects.get_or_create(user=request.user)
-        if not settings.STRIPE_SECRET_KEY:
-            messages.error(request, "Stripe is not configured yet.")
-            return redirect("teams:wallet")
-        if stripe is None:
-            messages.error(request, "Stripe package is not installed on the server.")
+        try:
+            client = stripe_client.get_client()
+        except stripe_client.StripeUnavailable as exc:
+            messages.error(request, str(exc))
             return redirect("teams:wallet")
 
         form = TopUpForm(request.POST)
@@ -394,91 +595,87 @@ class WalletView(LoginRequiredMixin, View):
                 request, "teams/wallet.html", {"wallet": wallet, "form": form}
             )
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
         amount_cents = int(amount * Decimal("100"))
         success_url = request.build_absolute_uri(reverse("teams:wallet"))
         success_url = f"{success_url}?session_id={{CHECKOUT_SESSION_ID}}"
         cancel_url = request.build_absolute_uri(reverse("teams:wallet"))
 
-        session = stripe.checkout.Session.create(
-            mode="payment",
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": settings.STRIPE_CURRENCY,
-                        "product_data": {"name": "Wallet top-up"},
-                        "unit_amount": amount_cents,
-                    },
-                    "quantity": 1,
-                }
-            ],
-            success_url=success_url,
-            cancel_url=cancel_url,
-            client_reference_id=str(request.user.id),
-            metadata={"user_id": str(request.user.id)},
+        try:
+            with timed_external("stripe"):
+                session = client.create_checkout_session(
+                    mode="payment",
+                    payment_method_types=["card"],
+                    line_items=[
+                        {
+                            "price_data": {
+                                "currency": settings.STRIPE_CURRENCY,
+                                "product_data": {"name": "Wallet top-up"},
+                                "unit_amount": amount_cents,
+                            },
+                            "quantity": 1,
+                        }
+                    ],
+                    success_url=success_url,
+                    cancel_url=cancel_url,
+                    client_reference_id=str(request.user.id),
+                    metadata={"user_id": str(request.user.id)},
+                )
+        except stripe_client.StripeError:
+            messages.error(request, "Unable to start a Stripe checkout.")
+            return redirect("teams:wallet")
+        return redirect(session["url"])
+
+
+class WalletHistoryView(LoginRequiredMixin, View):
+    def get(self, request):
+        wallet, _ = Wallet.objects.get_or_create(user=request.user)
+        form = WalletHistoryFilterForm(request.GET)
+        transactions = form.filter(wallet.transactions.select_related("event"))
+        page = paginate_keyset(
+            transactions,
+            "created_at",
+            request.GET.get("cursor"),
+            settings.WALLET_HISTORY_PAGE_SIZE,
+            descending=True,
+        )
+        next_url = None
+        if page.next_cursor:
+            query = request.GET.copy()
+            query["cursor"] = page.next_cursor
+            next_url = f"?{query.urlencode()}"
+        filtered_event = None
+        if form.is_valid() and form.cleaned_data["event"]:
+            filtered_event = Event.objects.filter(
+                pk=form.cleaned_data["event"]
+            ).first()
+        return render(
+            request,
+            "teams/wallet_history.html",
+            {
+                "wallet": wallet,
+                "form": form,
+                "transactions": page.items,
+                "next_url": next_url,
+                "filtered_event": filtered_event,
+            },
         )
-        return redirect(session.url)
 
 
 @method_decorator(csrf_exempt, name="dispatch")
 class StripeWebhookView(View):
     def post(self, request):
-        if not settings.STRIPE_WEBHOOK_SECRET or stripe is None:
+        if not settings.STRIPE_WEBHOOK_SECRET:
             return HttpResponse(status=400)
 
         payload = request.body
         sig_header = request.META.get("HTTP_STRIPE_SIGNATURE", "")
         try:
-            event = stripe.Webhook.construct_event(
+            stripe_client.verify_webhook(
                 payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
             )
-        except stripe.error.SignatureVerificationError:
-            return HttpResponse(status=400)
-        except ValueError:
+            # Apply the event out of band so bursts of deliveries do not hold
+            # web workers; see the process_stripe_events command.
+            payments.record_stripe_event(payload)
+        except (stripe_client.SignatureError, ValueError, KeyError):
             return HttpResponse(status=400)
-
-        if event["type"] == "checkout.session.completed":
-            session = event["data"]["object"]
-            if session.get("payment_status") != "paid":
-                return HttpResponse(status=200)
-
-            user_id = session.get("client_reference_id") or session.get("metadata", {}).get(
-                "user_id"
-            )
-            amount_total = session.get("amount_total")
-            session_id = session.get("id")
-            payment_intent = session.get("payment_intent", "")
-
-            if not user_id or amount_total is None or not session_id:
-                return HttpResponse(status=200)
-
-            try:
-                user_id = int(user_id)
-            except (TypeError, ValueError):
-                return HttpResponse(status=200)
-
-            User = get_user_model()
-            if not User.objects.filter(pk=user_id).exists():
-                return HttpResponse(status=200)
-
-            amount = Decimal(amount_total) / Decimal("100")
-            wallet, _ = Wallet.objects.get_or_create(user_id=user_id)
-
-            with transaction.atomic():
-                wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
-                already_logged = WalletTransaction.objects.filter(
-                    stripe_session_id=session_id
-                ).exists()
-                if not already_logged:
-                    wallet.balance = wallet.balance + amount
-                    wallet.save(update_fields=["balance"])
-                    WalletTransaction.objects.create(
-                        wallet=wallet,
-                        amount=amount,
-                        kind=WalletTransaction.Kind.TOPUP,
-                        stripe_session_id=session_id,
-                        stripe_payment_intent=payment_intent or None,
-                    )
-
         return HttpResponse(status=200)